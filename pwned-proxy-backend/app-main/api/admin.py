@@ -2,25 +2,40 @@
 
 from django.contrib import admin, messages
 from django.core.management import call_command
+from django.db.models import Q, Sum
 from django.shortcuts import redirect, get_object_or_404
 from django.urls import path
 from django.utils.html import format_html
 
-from .models import APIKey, Domain, generate_api_key, EndpointLog, hash_api_key
+from .models import (
+    APIKey, Breach, DataClass, Domain, DomainRule, DomainSnapshot, generate_api_key, Endpoint,
+    EndpointLog, EndpointUsage, GroupQuota, hash_api_key,
+)
+
+
+class DomainRuleInline(admin.TabularInline):
+    model = DomainRule
+    extra = 0
+
 
 @admin.register(APIKey)
 class APIKeyAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'group', 'domain_list', 'key', 'created_at')
+    list_display = (
+        'id', 'name', 'group', 'domain_list', 'rate_limit', 'burst', 'max_concurrent',
+        'key', 'created_at',
+    )
     search_fields = ('name', 'description', 'key')
     readonly_fields = ('created_at',)
     filter_horizontal = ('domains',)
+    inlines = [DomainRuleInline]
     actions = ['rotate_api_keys']
 
     # Custom template to add "Rotate" button on change page
     change_form_template = "admin/api/apikey/change_form.html"
 
     def domain_list(self, obj):
-        return ", ".join(d.name for d in obj.domains.all())
+        rules = [str(rule) for rule in obj.domain_rules.all()]
+        return ", ".join(rules + [d.name for d in obj.domains.all()])
     domain_list.short_description = "Domains"
 
     def save_model(self, request, obj, form, change):
@@ -143,15 +158,155 @@ class HIBPKeyAdmin(admin.ModelAdmin):
     """
     Allows admin users to add/remove HIBP API keys.
     """
-    list_display = ('__str__', 'api_key', 'created_at')
+    list_display = (
+        '__str__', 'api_key', 'rpm', 'is_active', 'last_error_status', 'unavailable_until', 'created_at',
+    )
+    list_filter = ('is_active',)
     search_fields = ('api_key', 'description')
+    readonly_fields = ('last_error_status', 'unavailable_until')
+
+
+@admin.register(Breach)
+class BreachAdmin(admin.ModelAdmin):
+    """
+    Read-only view of the locally synchronized breach catalog, with a
+    "Sync catalog from HIBP" button.
+    """
+    list_display = ('name', 'domain', 'breach_date', 'added_date', 'pwn_count', 'is_spam_list')
+    list_filter = ('is_verified', 'is_spam_list')
+    search_fields = ('name', 'title', 'domain')
+    change_list_template = "admin/api/breach/change_list.html"
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                "sync-hibp/",
+                self.admin_site.admin_view(self.sync_from_hibp),
+                name="api_breach_sync_hibp"
+            ),
+        ]
+        return custom_urls + urls
+
+    def sync_from_hibp(self, request):
+        call_command("sync_breach_catalog")
+        self.message_user(request, "Breach catalog synced from HIBP!")
+        return redirect("..")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DataClass)
+class DataClassAdmin(admin.ModelAdmin):
+    list_display = ('name', 'position')
+    search_fields = ('name',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DomainSnapshot)
+class DomainSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('domain', 'version', 'pwn_count', 'status_code', 'size', 'created_at')
+    list_filter = ('domain',)
+    exclude = ('content',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Endpoint)
+class EndpointAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name')
+    search_fields = ('name',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class SuccessFilter(admin.SimpleListFilter):
+    """Filter on ``EndpointLog.success``, which is derived from the status."""
+
+    title = "success"
+    parameter_name = "success"
+
+    def lookups(self, request, model_admin):
+        return (("1", "Yes"), ("0", "No"))
+
+    def queryset(self, request, queryset):
+        succeeded = Q(status_code__gte=200, status_code__lt=400)
+        if self.value() == "1":
+            return queryset.filter(succeeded)
+        if self.value() == "0":
+            return queryset.exclude(succeeded)
+        return queryset
 
 
 @admin.register(EndpointLog)
 class EndpointLogAdmin(admin.ModelAdmin):
-    list_display = ('created_at', 'group', 'endpoint', 'status_code', 'success')
-    list_filter = ('group', 'endpoint', 'success')
-    readonly_fields = ('api_key', 'group', 'endpoint', 'status_code', 'success', 'created_at')
+    list_display = (
+        'created_at', 'group', 'endpoint', 'status_code', 'success', 'duration_ms',
+        'upstream_ms', 'cache_status',
+    )
+    list_filter = ('group', 'endpoint', SuccessFilter, 'cache_status')
+    list_select_related = ('group', 'endpoint')
+    readonly_fields = (
+        'api_key', 'group', 'endpoint', 'status_code', 'success', 'created_at', 'duration_ms',
+        'upstream_ms', 'upstream_status', 'response_bytes', 'cache_status',
+    )
+    # Counting the whole table is slow; usage totals are in EndpointUsage.
+    show_full_result_count = False
+
+    def success(self, obj):
+        return obj.success
+    success.boolean = True
+
+
+@admin.register(EndpointUsage)
+class EndpointUsageAdmin(admin.ModelAdmin):
+    """Hourly request counts; the changelist shows the total of its filters."""
+
+    list_display = ('hour', 'group', 'api_key', 'endpoint', 'status', 'count')
+    list_filter = ('group', 'endpoint', 'status_class')
+    list_select_related = ('group', 'api_key')
+    date_hierarchy = 'hour'
+    ordering = ('-hour',)
+    change_list_template = "admin/api/endpointusage/change_list.html"
+
+    def status(self, obj):
+        return f"{obj.status_class}xx"
+    status.short_description = "Status"
+    status.admin_order_field = 'status_class'
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        cl = getattr(response, "context_data", {}).get("cl")
+        if cl is not None:
+            total = cl.queryset.aggregate(total=Sum('count'))['total']
+            response.context_data['total_requests'] = total or 0
+        return response
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 
@@ -182,6 +337,12 @@ SEED_DATA = [
   {"domain": "cbs.dk", "group": "Copenhagen Business School"}
 ]
 
+class GroupQuotaInline(admin.StackedInline):
+    model = GroupQuota
+    can_delete = True
+    verbose_name_plural = "Quota (defaults for the group's API keys)"
+
+
 @admin.register(Group)
 class CustomGroupAdmin(GroupAdmin):
     """
@@ -189,6 +350,7 @@ class CustomGroupAdmin(GroupAdmin):
     “Seed Groups” button/link in the changelist page.
     """
     change_list_template = "admin/auth/group/change_list.html"
+    inlines = [GroupQuotaInline]
 
     def get_urls(self):
         """
@@ -208,8 +370,8 @@ class CustomGroupAdmin(GroupAdmin):
         Otherwise:
           1. Overwrite (delete) the existing APIKeys for all the groups in SEED_DATA
           2. Create new APIKeys
-          3. For each group, find subdomains that end with the domain and associate them
-          4. Return a JSON file with the group name, raw key, and associated domains
+          3. For each group, authorize the domain and all its subdomains with a DomainRule
+          4. Return a JSON file with the group name, raw key, and domain rules
         """
         from django.contrib import messages
         from django.shortcuts import redirect
@@ -239,16 +401,14 @@ class CustomGroupAdmin(GroupAdmin):
                 description="Initial seed key",
             )
 
-            # find all matching domains
-            matching_domains = Domain.objects.filter(name__endswith=base_domain)
-            api_key_obj.domains.add(*matching_domains)
-
-            # Build a list of domain names
-            domain_names = [d.name for d in matching_domains]
+            # the domain and every subdomain, including ones imported later
+            rule = DomainRule.objects.create(
+                api_key=api_key_obj, domain=base_domain, include_subdomains=True
+            )
 
             grouped[group_name].append({
                 "raw_key": raw_key,
-                "domains": domain_names,
+                "domain_rules": [str(rule)],
             })
 
         result_list = [
@@ -277,6 +437,7 @@ class CustomGroupAdmin(GroupAdmin):
                 key_list.append({
                     "hashed_key": api_key.key,
                     "domains": list(api_key.domains.values_list('name', flat=True)),
+                    "domain_rules": [str(rule) for rule in api_key.domain_rules.all()],
                 })
             data.append({"group_name": group.name, "api_keys": key_list})
 
@@ -355,6 +516,12 @@ class CustomGroupAdmin(GroupAdmin):
                         )
                         if domains:
                             api_key.domains.set(domains)
+                        for rule in key.get("domain_rules", []):
+                            DomainRule.objects.create(
+                                api_key=api_key,
+                                domain=rule,
+                                include_subdomains=rule.startswith("*."),
+                            )
 
                 messages.success(request, "Groups and API keys imported.")
                 return redirect("..")
@@ -0,0 +1,23 @@
+# api/async_urls.py
+"""
+URL patterns used when the project is served over ASGI.
+
+The routes and names mirror ``api/urls.py``; each DRF view is swapped for
+the async view of the same name in ``api/async_views.py`` when one exists.
+Routes without an async counterpart keep their sync view, which Django
+runs in a thread.
+"""
+from django.urls import path
+
+from . import async_views, urls
+
+
+def _async_counterpart(pattern):
+    view_class = pattern.callback.view_class
+    async_class = getattr(async_views, view_class.__name__, None)
+    if async_class is None:
+        return pattern
+    return path(str(pattern.pattern), async_class.as_view(), name=pattern.name)
+
+
+urlpatterns = [_async_counterpart(p) for p in urls.urlpatterns]
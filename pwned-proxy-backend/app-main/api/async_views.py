@@ -0,0 +1,438 @@
+# api/async_views.py
+"""
+Native async implementation of the proxy endpoints.
+
+These views are served instead of the DRF views in ``api/views.py`` when
+the project runs under ASGI (``pwned_proxy/asgi.py``), see
+``api/async_urls.py``.  Authentication, throttling, logging and the
+upstream call are all awaited, so a single worker process can hold many
+concurrent upstream waits instead of one per gunicorn worker.
+
+Responses use the same status codes, JSON payloads and forwarded headers
+as their DRF counterparts.
+"""
+import json
+import math
+from urllib.parse import urlencode
+
+import requests
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Group
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, AuthenticationFailed
+
+from .authentication import APIKeyAuthentication
+from .bulk import (
+    NDJSON_CONTENT_TYPE,
+    astream_batch,
+    parse_batch,
+    partition,
+)
+from .caching import (
+    account_cache_key,
+    acached_account_get,
+    acached_catalog_get,
+)
+from .catalog import get_catalog, parse_bool
+from .circuit import acircuit_get
+from .coalesce import acoalesced_get
+from .keypool import apooled_get
+from . import log_writer
+from .log_writer import make_log
+from .models import Domain
+from .principal import AuthPrincipal
+from .quotas import acting_as, aupstream_slot
+from . import request_stats
+from .request_stats import timed_upstream
+from .snapshots import domain_changes, indexed_account_get, latest_snapshot
+from .throttling import APIKeyRateThrottle
+from .upstream import upstream_aget
+from .views import (
+    HEALTH_FORBIDDEN,
+    breached_account_path,
+    from_allowed_network,
+    health_report,
+    make_response,
+)
+
+
+# ---------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------
+
+
+async def ahibp_get(path: str):
+    """Async counterpart of ``views.hibp_get``."""
+    async def fetch(p, api_key):
+        return await upstream_aget(p, api_key)
+
+    async def governed(p):
+        return await apooled_get(
+            p, fetch, lambda api_key: fetch("subscription/status", api_key)
+        )
+
+    async def guarded(p):
+        return await acircuit_get(p, governed)
+
+    async with aupstream_slot():
+        with timed_upstream() as stats:
+            resp = await acoalesced_get(path, guarded)
+            stats.upstream_status = resp.status_code
+            return resp
+
+
+async def abreached_account_get(account: str, query: dict):
+    """Async counterpart of ``views.breached_account_get``."""
+    catalog = await sync_to_async(get_catalog)()
+    indexed = await sync_to_async(indexed_account_get)(account, query, catalog)
+    if indexed is not None:
+        return indexed
+
+    if catalog is not None and parse_bool(query.get("truncateResponse")) is False:
+        truncated = {k: v for k, v in query.items() if k != "truncateResponse"}
+        resp = await acached_account_get(
+            breached_account_path(account, truncated),
+            account_cache_key("breachedaccount", account, truncated),
+            ahibp_get,
+        )
+        if resp.status_code != 200:
+            return resp
+        expanded = catalog.expand(resp)
+        if expanded is not None:
+            return expanded
+
+    return await acached_account_get(
+        breached_account_path(account, query),
+        account_cache_key("breachedaccount", account, query),
+        ahibp_get,
+    )
+
+
+def detail(message, status: int) -> JsonResponse:
+    return JsonResponse({"detail": message}, status=status)
+
+
+class AsyncLoggedView(View):
+    """
+    Async counterpart of ``views.LoggedAPIView``: authenticates the API key,
+    applies the API key throttle and queues an ``EndpointLog`` row.
+    """
+
+    http_method_names = ["get", "options"]
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        token = request_stats.bind()
+        try:
+            return await self._dispatch(request, *args, **kwargs)
+        finally:
+            request_stats.unbind(token)
+
+    async def _dispatch(self, request, *args, **kwargs):
+        self.principal = None
+        try:
+            result = await APIKeyAuthentication().aauthenticate(request)
+            if result is not None:
+                self.principal = result[1]
+            request.auth = self.principal
+
+            throttle = APIKeyRateThrottle()
+            if not await sync_to_async(throttle.allow_request)(request, self):
+                wait = throttle.wait()
+                response = detail("Request was throttled.", 429)
+                if wait is not None:
+                    response["Retry-After"] = str(math.ceil(wait))
+            else:
+                with acting_as(self.principal):
+                    response = await super().dispatch(request, *args, **kwargs)
+        except AuthenticationFailed as exc:
+            # DRF answers 403 here because the API key scheme has no
+            # WWW-Authenticate header; keep the same behaviour.
+            response = detail(exc.detail, 403)
+        except APIException as exc:
+            response = JsonResponse(
+                exc.detail if isinstance(exc.detail, (dict, list)) else {"detail": exc.detail},
+                status=exc.status_code,
+                safe=False,
+            )
+            if getattr(exc, "wait", None):
+                response["Retry-After"] = str(math.ceil(exc.wait))
+        except Exception:
+            # Django's handler turns the error into a 500; record it as one
+            # before it propagates.
+            await self.log(request, detail("Internal server error.", 500))
+            raise
+
+        for header, value in getattr(request, "rate_limit_headers", {}).items():
+            response[header] = value
+        await self.log(request, response)
+        return response
+
+    async def log(self, request, response) -> None:
+        try:
+            endpoint = request.resolver_match.view_name
+        except AttributeError:  # pragma: no cover - should not happen
+            endpoint = request.path
+        details = request_stats.log_details(request_stats.current(), response)
+        await log_writer.arecord(
+            [make_log(self.principal, endpoint, response.status_code, **details)]
+        )
+
+# ---------------------------------------------------------------------
+# Proxy endpoints
+# ---------------------------------------------------------------------
+
+
+class BreachedDomainProxyView(AsyncLoggedView):
+    """GET /api/v3/breacheddomain/{domain}"""
+
+    async def get(self, request, domain: str = None):
+        if not isinstance(self.principal, AuthPrincipal):
+            return detail("No valid API key provided.", 401)
+        if not self.principal.allows(domain):
+            return detail(f"API key not authorized for domain '{domain}'", 403)
+
+        snapshot = await sync_to_async(latest_snapshot)(domain)
+        if snapshot is not None:
+            return make_response(snapshot)
+        return make_response(await ahibp_get(f"breacheddomain/{domain}"))
+
+
+class BreachedDomainChangesView(AsyncLoggedView):
+    """GET /api/v3/breacheddomain/{domain}/changes"""
+
+    async def get(self, request, domain: str = None):
+        if not isinstance(self.principal, AuthPrincipal):
+            return detail("No valid API key provided.", 401)
+        domain_obj = None
+        if self.principal.allows(domain):
+            domain_obj = await Domain.objects.filter(name__iexact=domain).afirst()
+        if domain_obj is None:
+            return detail(f"API key not authorized for domain '{domain}'", 403)
+
+        changes = await sync_to_async(domain_changes)(domain_obj, request.GET.get("since"))
+        return JsonResponse(changes)
+
+
+class BreachedAccountProxyView(AsyncLoggedView):
+    """GET /api/v3/breachedaccount/{account}"""
+
+    async def get(self, request, account: str = None):
+        if not account:
+            return detail("No email specified.", 400)
+        try:
+            account.encode("ascii")
+        except UnicodeEncodeError:
+            return detail("Invalid email format.", 400)
+
+        query = {}
+        for param in ["truncateResponse", "includeUnverified"]:
+            if param in request.GET:
+                query[param] = request.GET[param]
+
+        return make_response(await abreached_account_get(account, query))
+
+
+class BulkBreachedAccountProxyView(AsyncLoggedView):
+    """POST /api/v3/breachedaccounts"""
+
+    http_method_names = ["post", "options"]
+
+    async def post(self, request):
+        if not isinstance(self.principal, AuthPrincipal):
+            return detail("No valid API key provided.", 401)
+        try:
+            data = json.loads(request.body or b"null")
+        except ValueError:
+            return detail("JSON parse error.", 400)
+
+        accounts, query = parse_batch(data)
+        authorized, rejected = partition(accounts, self.principal.domains)
+        return StreamingHttpResponse(
+            astream_batch(
+                authorized,
+                rejected,
+                lambda account: abreached_account_get(account, query),
+                self.principal,
+            ),
+            content_type=NDJSON_CONTENT_TYPE,
+        )
+
+
+class _AsyncEmailProxyView(AsyncLoggedView):
+    """Shared logic for endpoints keyed on an authorised email address."""
+
+    endpoint = None
+
+    async def lookup(self, email: str):
+        if not self.principal:
+            return detail("No valid API key.", 401)
+        if not email:
+            return detail("Missing 'email' parameter.", 400)
+        try:
+            _local, email_domain = email.rsplit("@", 1)
+        except ValueError:
+            return detail("Invalid email format.", 400)
+        if not self.principal.allows(email_domain):
+            return detail(f"API key not authorised for '{email_domain}'", 403)
+
+        resp = await acached_account_get(
+            f"{self.endpoint}/{requests.utils.requote_uri(email)}",
+            account_cache_key(self.endpoint, email),
+            ahibp_get,
+        )
+        return make_response(resp)
+
+
+class PasteAccountProxyView(_AsyncEmailProxyView):
+    """GET /api/v3/pasteaccount/{account}"""
+
+    endpoint = "pasteaccount"
+
+    async def get(self, request, account: str = None):
+        return await self.lookup(account)
+
+
+class StealerLogsByEmailProxyView(_AsyncEmailProxyView):
+    """GET /api/v3/stealerlogsbyemail/{email}"""
+
+    endpoint = "stealerlogsbyemail"
+
+    async def get(self, request, email: str = None):
+        return await self.lookup(email)
+
+
+class SubscribedDomainsProxyView(AsyncLoggedView):
+    """GET /api/v3/subscribeddomains"""
+
+    async def get(self, request):
+        if not self.principal:
+            return detail("No valid API key.", 401)
+
+        allowed = self.principal.domains
+        resp = await ahibp_get("subscribeddomains")
+        if resp.status_code != 200:
+            return make_response(resp)
+
+        filtered = [
+            item for item in resp.json() if item.get("DomainName", "").lower() in allowed
+        ]
+        return JsonResponse(filtered, safe=False)
+
+
+class _AsyncDomainProxyView(AsyncLoggedView):
+    """Shared logic for endpoints keyed on an authorised domain."""
+
+    endpoint = None
+
+    async def get(self, request, domain: str = None):
+        if not self.principal:
+            return detail("No valid API key.", 401)
+        if not domain:
+            return detail("Missing 'domain' parameter.", 400)
+        if not self.principal.allows(domain):
+            return detail(f"API key not authorised for '{domain}'", 403)
+
+        return make_response(
+            await ahibp_get(f"{self.endpoint}/{requests.utils.requote_uri(domain)}")
+        )
+
+
+class StealerLogsByWebsiteDomainProxyView(_AsyncDomainProxyView):
+    """GET /api/v3/stealerlogsbywebsitedomain/{domain}"""
+
+    endpoint = "stealerlogsbywebsitedomain"
+
+
+class StealerLogsByEmailDomainProxyView(_AsyncDomainProxyView):
+    """GET /api/v3/stealerlogsbyemaildomain/{domain}"""
+
+    endpoint = "stealerlogsbyemaildomain"
+
+
+class AllBreachesProxyView(AsyncLoggedView):
+    """GET /api/v3/breaches"""
+
+    async def get(self, request):
+        query = {}
+        for param in ["Domain", "IsSpamList"]:
+            if param in request.GET:
+                query[param] = request.GET[param]
+
+        catalog = await sync_to_async(get_catalog)()
+        if catalog is not None:
+            return make_response(catalog.response(catalog.breaches(
+                domain=query.get("Domain"),
+                is_spam_list=parse_bool(query.get("IsSpamList")),
+            )))
+
+        path = "breaches"
+        if query:
+            path += f"?{urlencode(query)}"
+        return make_response(await acached_catalog_get(path, ahibp_get))
+
+
+class SingleBreachProxyView(AsyncLoggedView):
+    """GET /api/v3/breach/{name}"""
+
+    async def get(self, request, name: str = None):
+        catalog = await sync_to_async(get_catalog)()
+        if catalog is not None and catalog.get(name):
+            return make_response(catalog.response(catalog.get(name)))
+        return make_response(await acached_catalog_get(
+            f"breach/{requests.utils.requote_uri(name)}", ahibp_get
+        ))
+
+
+class LatestBreachProxyView(AsyncLoggedView):
+    """GET /api/v3/latestbreach"""
+
+    async def get(self, request):
+        catalog = await sync_to_async(get_catalog)()
+        if catalog is not None and catalog.latest():
+            return make_response(catalog.response(catalog.latest()))
+        return make_response(await acached_catalog_get("latestbreach", ahibp_get))
+
+
+class DataClassesProxyView(AsyncLoggedView):
+    """GET /api/v3/dataclasses"""
+
+    async def get(self, request):
+        catalog = await sync_to_async(get_catalog)()
+        if catalog is not None and catalog.dataclasses():
+            return make_response(catalog.response(catalog.dataclasses()))
+        return make_response(await acached_catalog_get("dataclasses", ahibp_get))
+
+
+class SubscriptionStatusProxyView(AsyncLoggedView):
+    """GET /api/v3/subscription/status"""
+
+    async def get(self, request):
+        if not self.principal:
+            return detail("No valid API key.", 401)
+        return make_response(await ahibp_get("subscription/status"))
+
+
+class UpstreamHealthView(AsyncLoggedView):
+    """GET /api/v3/upstream/health (staff or internal networks only)"""
+
+    async def get(self, request):
+        if not (from_allowed_network(request) or (await request.auser()).is_staff):
+            return detail(HEALTH_FORBIDDEN, 403)
+        return JsonResponse(health_report())
+
+
+class GroupNamesView(AsyncLoggedView):
+    """GET /api/v3/group-names"""
+
+    async def get(self, request):
+        names = [
+            name async for name in Group.objects.order_by("name").values_list("name", flat=True)
+        ]
+        return JsonResponse(names, safe=False)
@@ -9,7 +9,8 @@ from django.contrib.auth.models import AnonymousUser
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 
-from .models import APIKey, hash_api_key
+from .models import hash_api_key
+from .principal import aget_principal, get_principal
 
 User = get_user_model()
 
@@ -17,7 +18,8 @@ User = get_user_model()
 class APIKeyAuthentication(BaseAuthentication):
     """
     Looks for 'X-API-Key' or 'hibp-api-key' in headers,
-    matches it directly against stored API keys.
+    matches it against stored API keys through the principal cache
+    (see ``api/principal.py``).
     """
 
     def authenticate(self, request):
@@ -25,14 +27,24 @@ class APIKeyAuthentication(BaseAuthentication):
         if not raw_key:
             return None  # No API key => DRF tries next auth class
 
-        hashed = hash_api_key(raw_key)
-        try:
-            api_key = APIKey.objects.get(key=hashed)
-        except APIKey.DoesNotExist:
+        principal = get_principal(hash_api_key(raw_key))
+        if principal is None:
             raise AuthenticationFailed("Invalid API Key")
 
-        # Return an AnonymousUser plus the APIKey instance
-        return (AnonymousUser(), api_key)
+        # Return an AnonymousUser plus the key's AuthPrincipal
+        return (AnonymousUser(), principal)
+
+    async def aauthenticate(self, request):
+        """Async variant used by the ASGI views in ``api/async_views.py``."""
+        raw_key = request.headers.get('X-API-Key') or request.headers.get('hibp-api-key')
+        if not raw_key:
+            return None
+
+        principal = await aget_principal(hash_api_key(raw_key))
+        if principal is None:
+            raise AuthenticationFailed("Invalid API Key")
+
+        return (AnonymousUser(), principal)
 
 
 # class AzureAdJWTAuthentication(BaseAuthentication):
@@ -0,0 +1,265 @@
+# api/bulk.py
+"""
+Batch account lookups for ``POST /api/v3/breachedaccounts``.
+
+A batch is authenticated and throttled once, and the email domains of all
+accounts are checked against the caller's cached ``AuthPrincipal``.  The
+authorised lookups then run concurrently, each still going through the
+account cache, coalescing and the rate governor, and their results are
+streamed back as NDJSON, one line per account, in the order they
+complete::
+
+    {"account":"a@dtu.dk","status":200,"breaches":[{"Name":"Adobe"}]}
+    {"account":"b@dtu.dk","status":404,"breaches":[]}
+    {"account":"c@example.com","status":403,"detail":"..."}
+
+Every account is recorded as its own ``EndpointLog`` row under the
+``breached-account`` endpoint once the stream is done (see
+``api/log_writer.py``).
+"""
+import asyncio
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import APIException, ParseError
+
+from .catalog import dump_json, parse_bool
+from . import log_writer
+from .log_writer import make_log
+from .models import EndpointLog
+from .quotas import acting_as
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+LOG_ENDPOINT = "breached-account"
+
+_DONE = object()
+
+logger = logging.getLogger(__name__)
+
+
+def parse_batch(data) -> tuple[list[str], dict]:
+    """
+    Validate a request body and return ``(accounts, query)``.
+
+    ``accounts`` is de-duplicated case-insensitively; ``query`` holds the
+    ``truncateResponse`` and ``includeUnverified`` flags as HIBP expects
+    them.  Raises ``ParseError`` (400) on a malformed body.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("accounts"), list):
+        raise ParseError("Expected a JSON object with an 'accounts' list.")
+    accounts = data["accounts"]
+    if not accounts:
+        raise ParseError("No accounts specified.")
+    if len(accounts) > settings.HIBP_BULK_MAX_ACCOUNTS:
+        raise ParseError(
+            f"At most {settings.HIBP_BULK_MAX_ACCOUNTS} accounts per request."
+        )
+
+    unique = {}
+    for account in accounts:
+        if not isinstance(account, str):
+            raise ParseError("Accounts must be strings.")
+        unique.setdefault(account.strip().lower(), account.strip())
+
+    query = {}
+    for param in ["truncateResponse", "includeUnverified"]:
+        if param in data:
+            query[param] = "true" if parse_bool(data[param]) else "false"
+    return list(unique.values()), query
+
+
+def email_domain(account: str) -> str | None:
+    """Return the lower-cased domain of ``account``, or None if invalid."""
+    try:
+        account.encode("ascii")
+        local, domain = account.rsplit("@", 1)
+    except (UnicodeEncodeError, ValueError):
+        return None
+    if not local or not domain:
+        return None
+    return domain.lower()
+
+
+def partition(accounts, allowed_domains) -> tuple[list[str], list[tuple]]:
+    """
+    Split ``accounts`` into those the caller may look up and a list of
+    ``(account, status, detail)`` rejections.
+    """
+    authorized, rejected = [], []
+    for account in accounts:
+        domain = email_domain(account)
+        if domain is None:
+            rejected.append((account, 400, "Invalid email format."))
+        elif domain not in allowed_domains:
+            rejected.append((account, 403, f"API key not authorised for '{domain}'"))
+        else:
+            authorized.append(account)
+    return authorized, rejected
+
+
+def result_line(account: str, resp) -> bytes:
+    """Build the NDJSON line for an upstream (or cached) response."""
+    if resp.status_code == 200:
+        breaches = resp.content
+    elif resp.status_code == 404:
+        breaches = b"[]"
+    else:
+        return error_line(
+            account, resp.status_code, f"Upstream HIBP answered {resp.status_code}."
+        )
+    return (
+        b'{"account":' + dump_json(account).encode()
+        + b',"status":' + str(resp.status_code).encode()
+        + b',"breaches":' + breaches + b"}\n"
+    )
+
+
+def error_line(account: str, status: int, detail) -> bytes:
+    return (dump_json({"account": account, "status": status, "detail": str(detail)}) + "\n").encode()
+
+
+def run_lookup(account: str, lookup) -> tuple[int, bytes]:
+    """
+    Look up ``account`` and return ``(status, line)``.  Errors become lines
+    of their own: the response headers are sent already, so one failing
+    account must not cut the stream short for the others.
+    """
+    try:
+        resp = lookup(account)
+        return resp.status_code, result_line(account, resp)
+    except APIException as exc:
+        return exc.status_code, error_line(account, exc.status_code, exc.detail)
+    except Exception:
+        logger.exception("Bulk lookup of one account failed")
+        return 500, error_line(account, 500, "Internal server error.")
+
+
+async def arun_lookup(account: str, lookup) -> tuple[int, bytes]:
+    """Async counterpart of ``run_lookup``."""
+    try:
+        resp = await lookup(account)
+        return resp.status_code, result_line(account, resp)
+    except APIException as exc:
+        return exc.status_code, error_line(account, exc.status_code, exc.detail)
+    except Exception:
+        logger.exception("Bulk lookup of one account failed")
+        return 500, error_line(account, 500, "Internal server error.")
+
+
+def fan_out(func, items, workers: int):
+    """
+    Yield ``func(item)`` for every item, in completion order, using up to
+    ``workers`` threads.  Closing the generator stops the remaining work.
+    """
+    pending = queue.SimpleQueue()
+    for item in items:
+        pending.put(item)
+    results = queue.SimpleQueue()
+    stop = threading.Event()
+
+    def worker():
+        try:
+            while not stop.is_set():
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results.put(func(item))
+                except Exception as exc:  # re-raised in the consumer
+                    results.put(exc)
+        finally:
+            connections.close_all()
+            results.put(_DONE)
+
+    threads = [
+        threading.Thread(target=worker, daemon=True)
+        for _ in range(max(1, min(workers, len(items))))
+    ]
+    for thread in threads:
+        thread.start()
+    running = len(threads)
+    try:
+        while running:
+            result = results.get()
+            if result is _DONE:
+                running -= 1
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                yield result
+    finally:
+        stop.set()
+
+
+async def afan_out(func, items, workers: int):
+    """Async counterpart of ``fan_out`` running ``func`` as tasks."""
+    slots = asyncio.Semaphore(max(1, workers))
+
+    async def run(item):
+        async with slots:
+            return await func(item)
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def item_logs(principal, statuses) -> list[EndpointLog]:
+    return [make_log(principal, LOG_ENDPOINT, status) for status in statuses]
+
+
+def stream_batch(authorized, rejected, lookup, principal):
+    """
+    Yield the NDJSON lines of a batch: rejections first, then the results
+    of ``lookup(account)`` as they complete.
+    """
+    def run(account):
+        # Worker threads (and the response iterator) do not inherit the
+        # view's context, so bind the key for its concurrency quota here.
+        with acting_as(principal):
+            return run_lookup(account, lookup)
+
+    statuses = []
+    try:
+        for account, status, detail in rejected:
+            statuses.append(status)
+            yield error_line(account, status, detail)
+        for status, line in fan_out(
+            run,
+            authorized,
+            settings.HIBP_BULK_CONCURRENCY,
+        ):
+            statuses.append(status)
+            yield line
+    finally:
+        log_writer.record(item_logs(principal, statuses))
+
+
+async def astream_batch(authorized, rejected, lookup, principal):
+    """Async counterpart of ``stream_batch``."""
+    async def run(account):
+        with acting_as(principal):
+            return await arun_lookup(account, lookup)
+
+    statuses = []
+    try:
+        for account, status, detail in rejected:
+            statuses.append(status)
+            yield error_line(account, status, detail)
+        async for status, line in afan_out(
+            run,
+            authorized,
+            settings.HIBP_BULK_CONCURRENCY,
+        ):
+            statuses.append(status)
+            yield line
+    finally:
+        await log_writer.arecord(item_logs(principal, statuses))
@@ -0,0 +1,305 @@
+# api/caching.py
+"""
+Response caching for upstream HIBP calls.
+
+Catalog endpoints (``breaches``, ``breach``, ``latestbreach``,
+``dataclasses``) return the same data for every API key and change only a
+few times a day, so their upstream responses are cached per path (the path
+includes any forwarded query string) in the two-level cache shared by all
+workers.  Fresh entries are served directly;
+entries past their TTL but inside the stale window are served immediately
+while one background refresh revalidates them.
+
+Per-account lookups (``breachedaccount``, ``pasteaccount``,
+``stealerlogsbyemail``) are cached briefly in a per-process LRU bounded by
+a byte budget, including 404 "no record" answers.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .tiered_cache import namespace
+
+# Values for the ``X-Cache`` response header.
+HIT = "HIT"
+MISS = "MISS"
+STALE = "STALE"
+
+# Upstream headers worth keeping alongside a cached body.
+CACHED_HEADERS = ("Content-Type", "Retry-After")
+
+# Catalog entries live in the two-level cache; revalidation locks stay in
+# the shared cache because they rely on an atomic ``add``.
+catalog_responses = namespace("catalog")
+
+
+class CachedResponse:
+    """
+    Minimal stand-in for ``requests.Response`` rebuilt from a cache entry,
+    so ``make_response`` can treat cached and live responses the same way.
+    """
+
+    def __init__(self, status_code, content, headers, cache_status=MISS, age=0):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.cache_status = cache_status
+        self.age = age
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def endpoint_of(path: str) -> str:
+    """Return the HIBP endpoint name (first path segment) of ``path``."""
+    return path.lstrip("/").split("/", 1)[0].split("?", 1)[0]
+
+
+def cache_key(namespace: str, path: str) -> str:
+    digest = hashlib.sha256(path.encode()).hexdigest()
+    return f"hibp:{namespace}:{digest}"
+
+
+def to_entry(resp) -> dict:
+    return {
+        "status": resp.status_code,
+        "content": resp.content,
+        "headers": {h: resp.headers[h] for h in CACHED_HEADERS if h in resp.headers},
+        "fetched_at": time.time(),
+    }
+
+
+def from_entry(entry: dict, cache_status: str) -> CachedResponse:
+    age = max(0, int(time.time() - entry["fetched_at"]))
+    return CachedResponse(
+        entry["status"], entry["content"], dict(entry["headers"]), cache_status, age
+    )
+
+
+def cached_catalog_get(path: str, fetch) -> CachedResponse:
+    """
+    Return the response for catalog ``path``, using ``fetch(path)`` for
+    upstream calls.  Only 200 responses are cached.
+    """
+    ttl = settings.HIBP_CATALOG_CACHE_TTLS.get(endpoint_of(path))
+    if ttl is None:
+        return _wrap(fetch(path), MISS)
+
+    key = cache_key("catalog", path)
+    entry = catalog_responses.get(key)
+    if entry is not None and time.time() - entry["fetched_at"] >= ttl:
+        # Another worker may have revalidated it since it entered our L1.
+        entry = catalog_responses.get(key, skip_local=True)
+    if entry is not None:
+        age = time.time() - entry["fetched_at"]
+        if age < ttl:
+            return from_entry(entry, HIT)
+        _revalidate_in_background(key, path, fetch, ttl)
+        return from_entry(entry, STALE)
+
+    resp = fetch(path)
+    if _cacheable(resp):
+        _store(key, resp, ttl)
+    return _wrap(resp, MISS)
+
+
+async def acached_catalog_get(path: str, fetch) -> CachedResponse:
+    """Async counterpart of ``cached_catalog_get``; ``fetch`` is awaited."""
+    ttl = settings.HIBP_CATALOG_CACHE_TTLS.get(endpoint_of(path))
+    if ttl is None:
+        return _wrap(await fetch(path), MISS)
+
+    key = cache_key("catalog", path)
+    entry = await catalog_responses.aget(key)
+    if entry is not None and time.time() - entry["fetched_at"] >= ttl:
+        entry = await catalog_responses.aget(key, skip_local=True)
+    if entry is not None:
+        age = time.time() - entry["fetched_at"]
+        if age < ttl:
+            return from_entry(entry, HIT)
+        lock_key = f"{key}:revalidating"
+        if await cache.aadd(lock_key, 1, settings.HIBP_TIMEOUTS["default"][1] * 2):
+            _background_tasks.add(asyncio.create_task(
+                _arevalidate(key, lock_key, path, fetch, ttl)
+            ))
+        return from_entry(entry, STALE)
+
+    resp = await fetch(path)
+    if _cacheable(resp):
+        await catalog_responses.aset(key, to_entry(resp), ttl + settings.HIBP_CATALOG_STALE_TTL)
+    return _wrap(resp, MISS)
+
+
+# Strong references so pending revalidation tasks are not garbage collected.
+_background_tasks = set()
+
+
+async def _arevalidate(key: str, lock_key: str, path: str, fetch, ttl: int) -> None:
+    try:
+        resp = await fetch(path)
+        if _cacheable(resp):
+            await catalog_responses.aset(key, to_entry(resp), ttl + settings.HIBP_CATALOG_STALE_TTL)
+    except Exception:  # keep serving the stale copy
+        pass
+    finally:
+        await cache.adelete(lock_key)
+        _background_tasks.discard(asyncio.current_task())
+
+
+def _store(key: str, resp, ttl: int) -> None:
+    catalog_responses.set(key, to_entry(resp), ttl + settings.HIBP_CATALOG_STALE_TTL)
+
+
+def _cacheable(resp) -> bool:
+    # Stale fallbacks served by ``api.circuit`` must not refresh the cache.
+    return resp.status_code == 200 and getattr(resp, "cache_status", None) != STALE
+
+
+def _wrap(resp, cache_status: str):
+    # Keep the marker of a stale fallback served by ``api.circuit``.
+    if getattr(resp, "cache_status", None) != STALE:
+        resp.cache_status = cache_status
+    return resp
+
+
+def _revalidate_in_background(key: str, path: str, fetch, ttl: int) -> None:
+    # ``cache.add`` only succeeds for the first caller, so a stale entry is
+    # refreshed once no matter how many requests see it.
+    lock_key = f"{key}:revalidating"
+    if not cache.add(lock_key, 1, settings.HIBP_TIMEOUTS["default"][1] * 2):
+        return
+    threading.Thread(
+        target=_revalidate, args=(key, lock_key, path, fetch, ttl), daemon=True
+    ).start()
+
+
+def _revalidate(key: str, lock_key: str, path: str, fetch, ttl: int) -> None:
+    try:
+        resp = fetch(path)
+        if _cacheable(resp):
+            _store(key, resp, ttl)
+    except Exception:  # keep serving the stale copy
+        pass
+    finally:
+        cache.delete(lock_key)
+        connections.close_all()
+
+
+# ---------------------------------------------------------------------
+# Per-account lookups
+# ---------------------------------------------------------------------
+
+
+class LRUByteCache:
+    """
+    Thread-safe in-process LRU cache bounded by the total size of the
+    cached bodies rather than by entry count.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (expires_at, entry)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, entry = item
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry: dict, ttl: int) -> None:
+        nbytes = len(entry["content"])
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.time() + ttl, entry)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _remove(self, key) -> None:
+        _expires_at, entry = self._data.pop(key)
+        self.size -= len(entry["content"])
+
+    def __len__(self):
+        return len(self._data)
+
+
+_account_cache = None
+_account_cache_lock = threading.Lock()
+
+
+def get_account_cache() -> LRUByteCache:
+    global _account_cache
+    if _account_cache is None:
+        with _account_cache_lock:
+            if _account_cache is None:
+                _account_cache = LRUByteCache(settings.HIBP_ACCOUNT_CACHE_MAX_BYTES)
+    return _account_cache
+
+
+def account_cache_key(endpoint: str, account: str, query: dict | None = None) -> tuple:
+    """Key on the normalized account plus the forwarded query params."""
+    params = tuple(sorted((k, str(v).lower()) for k, v in (query or {}).items()))
+    return (endpoint, account.strip().lower(), params)
+
+
+def cached_account_get(path: str, key: tuple, fetch):
+    """
+    Return the response for per-account ``path``.  200 answers are kept for
+    ``HIBP_ACCOUNT_CACHE_TTL`` seconds, 404 answers for
+    ``HIBP_ACCOUNT_NOT_FOUND_TTL``; anything else is never cached.
+    """
+    store = get_account_cache()
+    entry = store.get(key)
+    if entry is not None:
+        return from_entry(entry, HIT)
+
+    return _store_account(store, key, fetch(path))
+
+
+async def acached_account_get(path: str, key: tuple, fetch):
+    """Async counterpart of ``cached_account_get``; ``fetch`` is awaited."""
+    store = get_account_cache()
+    entry = store.get(key)
+    if entry is not None:
+        return from_entry(entry, HIT)
+    return _store_account(store, key, await fetch(path))
+
+
+def _store_account(store: LRUByteCache, key: tuple, resp):
+    ttl = {
+        200: settings.HIBP_ACCOUNT_CACHE_TTL,
+        404: settings.HIBP_ACCOUNT_NOT_FOUND_TTL,
+    }.get(resp.status_code)
+    if ttl and getattr(resp, "cache_status", None) != STALE:
+        store.set(key, to_entry(resp), ttl)
+    return _wrap(resp, MISS)
@@ -0,0 +1,194 @@
+# api/catalog.py
+"""
+In-memory index over the locally synchronized breach catalog.
+
+``sync_breach_catalog`` mirrors HIBP's ``/breaches`` and ``/dataclasses``
+into the ``Breach`` and ``DataClass`` tables and stamps every row with the
+sync time.  Each worker keeps a ``BreachCatalog`` built from those tables
+and rebuilds it when it notices a newer sync, so catalog reads are served
+from memory without touching HIBP.
+
+Breach objects are kept as their serialized JSON text, so list responses
+are built by joining strings instead of encoding Python objects.
+"""
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Max
+
+from .caching import CachedResponse, HIT
+from .models import Breach, DataClass
+
+JSON_CONTENT_TYPE = "application/json; charset=utf-8"
+
+
+def dump_json(obj) -> str:
+    """Serialize ``obj`` the way HIBP does: compact, UTF-8, key order kept."""
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+class BreachCatalog:
+    """Read-only index of breaches by name, domain and added date."""
+
+    def __init__(self, breaches, dataclasses, version=None, synced_at=None):
+        """
+        ``breaches`` is an iterable of ``(name, domain, is_spam_list,
+        added_date, raw)`` tuples in upstream order, ``dataclasses`` a list
+        of names.
+        """
+        self.version = version
+        self.synced_at = synced_at or time.time()
+        self._ordered = []
+        self._by_name = {}
+        self._by_domain = {}
+        # name -> (position, Name, IsVerified, IsSensitive) for account lookups
+        self._account_info = {}
+        latest = None
+        for name, domain, is_spam_list, added_date, raw in breaches:
+            entry = (name, is_spam_list, raw)
+            self._ordered.append(entry)
+            self._by_name[name.lower()] = raw
+            data = json.loads(raw)
+            self._account_info[name.lower()] = (
+                len(self._ordered),
+                data.get("Name", name),
+                data.get("IsVerified", True),
+                data.get("IsSensitive", False),
+            )
+            if domain:
+                self._by_domain.setdefault(domain.lower(), []).append(entry)
+            if added_date is not None and (latest is None or added_date > latest[0]):
+                latest = (added_date, raw)
+        self._latest = latest[1] if latest else None
+        self._all = _join(e[2] for e in self._ordered)
+        dataclasses = list(dataclasses)
+        self._dataclasses = dump_json(dataclasses).encode() if dataclasses else None
+
+    def __len__(self):
+        return len(self._ordered)
+
+    def get(self, name: str) -> str | None:
+        """Return the raw JSON of breach ``name`` (case-insensitive)."""
+        return self._by_name.get(name.lower())
+
+    def breaches(self, domain: str | None = None, is_spam_list: bool | None = None) -> bytes:
+        """Return the ``/breaches`` body, optionally filtered like HIBP."""
+        if domain is None and is_spam_list is None:
+            return self._all
+        entries = self._ordered if domain is None else self._by_domain.get(domain.lower(), [])
+        if is_spam_list is not None:
+            entries = [e for e in entries if e[1] == is_spam_list]
+        return _join(e[2] for e in entries)
+
+    def latest(self) -> str | None:
+        return self._latest
+
+    def dataclasses(self) -> bytes | None:
+        return self._dataclasses
+
+    def expand(self, resp) -> CachedResponse | None:
+        """
+        Expand a truncated ``breachedaccount`` response (``[{"Name": ...}]``)
+        into full breach objects, in the same order and format HIBP uses for
+        ``truncateResponse=false``.  Returns None when a breach is missing
+        from the local catalog, so the caller can ask HIBP instead.
+        """
+        try:
+            names = [item["Name"] for item in json.loads(resp.content)]
+        except (ValueError, TypeError, KeyError):
+            return None
+        raws = [self.get(name) for name in names]
+        if None in raws:
+            return None
+        return CachedResponse(
+            200,
+            _join(raws),
+            {"Content-Type": resp.headers.get("Content-Type", JSON_CONTENT_TYPE)},
+            getattr(resp, "cache_status", None),
+            getattr(resp, "age", 0),
+        )
+
+    def account_breaches(
+        self, names, truncate: bool = True, include_unverified: bool = True
+    ) -> bytes | None:
+        """
+        Build a ``breachedaccount`` body for the breaches ``names``, filtered
+        and formatted like HIBP.  Sensitive breaches are left out, as HIBP's
+        ``breachedaccount`` does not return them.  Returns None when a name
+        is not in the catalog.
+        """
+        found = []
+        for name in names:
+            info = self._account_info.get(name.lower())
+            if info is None:
+                return None
+            position, canonical, is_verified, is_sensitive = info
+            if is_sensitive or (not include_unverified and not is_verified):
+                continue
+            found.append((position, canonical))
+        found.sort()
+        if truncate:
+            return dump_json([{"Name": name} for _position, name in found]).encode()
+        return _join(self._by_name[name.lower()] for _position, name in found)
+
+    def response(self, content) -> CachedResponse:
+        """Wrap ``content`` so it can be returned through ``make_response``."""
+        if isinstance(content, str):
+            content = content.encode()
+        age = max(0, int(time.time() - self.synced_at))
+        return CachedResponse(200, content, {"Content-Type": JSON_CONTENT_TYPE}, HIT, age)
+
+
+def _join(raws) -> bytes:
+    return ("[" + ",".join(raws) + "]").encode()
+
+
+def parse_bool(value) -> bool | None:
+    if value is None:
+        return None
+    return str(value).strip().lower() in {"1", "true", "yes"}
+
+
+# ---------------------------------------------------------------------
+# Per-process instance
+# ---------------------------------------------------------------------
+
+_catalog = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_catalog() -> BreachCatalog | None:
+    """
+    Return this worker's catalog index, or None while the local catalog is
+    empty (callers then fall back to HIBP).  Whether a newer sync exists is
+    checked at most every ``HIBP_CATALOG_CHECK_INTERVAL`` seconds with one
+    ``MAX(synced_at)`` query.
+    """
+    global _catalog, _checked_at
+    now = time.monotonic()
+    if _catalog is not None and now - _checked_at < settings.HIBP_CATALOG_CHECK_INTERVAL:
+        return _catalog or None
+
+    with _lock:
+        if _catalog is not None and now - _checked_at < settings.HIBP_CATALOG_CHECK_INTERVAL:
+            return _catalog or None
+        version = Breach.objects.aggregate(v=Max("synced_at"))["v"]
+        if _catalog is None or version != _catalog.version:
+            _catalog = load_catalog(version)
+        _checked_at = now
+    return _catalog or None
+
+
+def load_catalog(version=None) -> BreachCatalog:
+    rows = Breach.objects.order_by("position").values_list(
+        "name", "domain", "is_spam_list", "added_date", "raw"
+    )
+    return BreachCatalog(
+        rows,
+        DataClass.objects.order_by("position").values_list("name", flat=True),
+        version=version,
+        synced_at=version.timestamp() if version else None,
+    )
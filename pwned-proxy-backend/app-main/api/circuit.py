@@ -0,0 +1,206 @@
+# api/circuit.py
+"""
+Per-endpoint circuit breaker for upstream HIBP calls.
+
+Each worker keeps one breaker per HIBP endpoint (``breacheddomain``,
+``breachedaccount``, ...).  A call fails when it raises ``UpstreamTimeout``
+or ``UpstreamUnavailable``, answers with a 5xx status, or takes more than
+``HIBP_CIRCUIT_SLOW_CALL_RATIO`` of the endpoint's read timeout.  Once at least
+``HIBP_CIRCUIT_MIN_CALLS`` of the last ``HIBP_CIRCUIT_WINDOW`` calls were
+made and ``HIBP_CIRCUIT_ERROR_RATE`` of them failed, the circuit opens and
+calls fail fast for ``HIBP_CIRCUIT_OPEN_SECONDS``.  After that a single
+probe call is let through (half-open); it closes the circuit on success and
+reopens it on failure.
+
+The last good (200) response of every path is remembered in a per-worker
+LRU.  While the circuit is open, or when a call fails, that response is
+served with ``X-Cache: STALE`` and its ``Age`` instead of an error.
+"""
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .caching import STALE, LRUByteCache, endpoint_of, from_entry, to_entry
+from .upstream import UpstreamTimeout, UpstreamUnavailable, get_timeout
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpen(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Upstream HIBP is failing, try again shortly."
+    default_code = "circuit_open"
+
+    def __init__(self, retry_after: float | None = None):
+        super().__init__()
+        self.wait = max(1, int(retry_after)) if retry_after else None
+
+
+class CircuitBreaker:
+    """Thread-safe breaker state for one endpoint."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self._outcomes = []  # True for success, most recent last
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < settings.HIBP_CIRCUIT_OPEN_SECONDS:
+                    return False
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if ok:
+                    self.state = CLOSED
+                    self._outcomes = []
+                else:
+                    self._open()
+                return
+            self._outcomes.append(ok)
+            del self._outcomes[:-settings.HIBP_CIRCUIT_WINDOW]
+            failures = self._outcomes.count(False)
+            if (
+                len(self._outcomes) >= settings.HIBP_CIRCUIT_MIN_CALLS
+                and failures / len(self._outcomes) >= settings.HIBP_CIRCUIT_ERROR_RATE
+            ):
+                self._open()
+
+    def release(self) -> None:
+        """End a call without a verdict (e.g. it never reached HIBP)."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def retry_after(self) -> float:
+        return max(
+            0.0, settings.HIBP_CIRCUIT_OPEN_SECONDS - (time.monotonic() - self.opened_at)
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": self._outcomes.count(False),
+                "trips": self.trips,
+            }
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self._outcomes = []
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_last_good = None
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+    return breaker
+
+
+def get_last_good() -> LRUByteCache:
+    global _last_good
+    if _last_good is None:
+        with _breakers_lock:
+            if _last_good is None:
+                _last_good = LRUByteCache(settings.HIBP_CIRCUIT_STALE_MAX_BYTES)
+    return _last_good
+
+
+def circuit_stats() -> dict:
+    return {name: breaker.stats() for name, breaker in sorted(_breakers.items())}
+
+
+def circuit_get(path: str, fetch, remember: bool = True):
+    """
+    Call ``fetch(path)`` through the breaker of ``path``'s endpoint, falling
+    back to the last good response while the circuit is open or the call
+    fails.  With ``remember=False`` (streamed bodies) nothing is stored.
+    """
+    breaker = get_breaker(endpoint_of(path))
+    if not breaker.allow():
+        return _stale_or_raise(path, CircuitOpen(breaker.retry_after()))
+
+    try:
+        resp = fetch(path)
+    except (UpstreamTimeout, UpstreamUnavailable) as exc:
+        breaker.record(False)
+        return _stale_or_raise(path, exc)
+    except Exception:
+        # e.g. UpstreamRateLimited: the call never reached HIBP.
+        breaker.release()
+        raise
+    return _handle(path, resp, breaker, remember)
+
+
+async def acircuit_get(path: str, fetch, remember: bool = True):
+    """Async counterpart of ``circuit_get``; ``fetch`` is awaited."""
+    breaker = get_breaker(endpoint_of(path))
+    if not breaker.allow():
+        return _stale_or_raise(path, CircuitOpen(breaker.retry_after()))
+
+    try:
+        resp = await fetch(path)
+    except (UpstreamTimeout, UpstreamUnavailable) as exc:
+        breaker.record(False)
+        return _stale_or_raise(path, exc)
+    except Exception:
+        # e.g. UpstreamRateLimited: the call never reached HIBP.
+        breaker.release()
+        raise
+    return _handle(path, resp, breaker, remember)
+
+
+def _handle(path: str, resp, breaker: CircuitBreaker, remember: bool):
+    if resp.status_code == 429:
+        # Rate limiting is the governor's business, not an outage.
+        breaker.release()
+        return resp
+    elapsed = getattr(resp, "elapsed", None)
+    slow = elapsed is not None and elapsed.total_seconds() > (
+        get_timeout(path)[1] * settings.HIBP_CIRCUIT_SLOW_CALL_RATIO
+    )
+    failed = resp.status_code >= 500
+    breaker.record(not (failed or slow))
+    if failed:
+        return _stale_or_raise(path, None) or resp
+    if remember and resp.status_code == 200:
+        get_last_good().set(path, to_entry(resp), settings.HIBP_CIRCUIT_STALE_TTL)
+    return resp
+
+
+def _stale_or_raise(path: str, exc: Exception | None):
+    entry = get_last_good().get(path)
+    if entry is not None:
+        return from_entry(entry, STALE)
+    if exc is not None:
+        raise exc
+    return None
@@ -0,0 +1,158 @@
+# api/coalesce.py
+"""
+Single-flight coalescing of identical upstream requests.
+
+While a GET for a given path (including its query string) is in flight,
+further callers for the same path wait for it and share its response
+instead of sending their own request to HIBP.
+
+Within a worker this uses a ``threading.Event`` per path.  Across workers
+the leader additionally claims the path in the Django cache with
+``cache.add``; leaders in other workers that lose that race poll the cache
+for the published result for up to ``HIBP_COALESCE_WAIT`` seconds before
+falling back to a request of their own.  Only a result fetched after a
+follower began waiting is used, so a result left behind by an earlier
+leader is never served as the answer to a later request.  Cross-worker coalescing therefore
+only takes effect when the configured cache is shared between workers.
+
+``acoalesced_get`` does the same for the ASGI views with one
+``asyncio.Future`` per path on the worker's event loop.
+"""
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import cache_key, from_entry, to_entry, MISS
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def coalesced_get(path: str, fetch):
+    """
+    Return ``fetch(path)``, sharing a single in-flight call between all
+    concurrent callers asking for the same ``path``.
+    """
+    with _calls_lock:
+        call = _calls.get(path)
+        leader = call is None
+        if leader:
+            call = _calls[path] = _Call()
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.response
+
+    try:
+        call.response = _leader_get(path, fetch)
+        return call.response
+    except Exception as exc:
+        call.error = exc
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(path, None)
+        call.done.set()
+
+
+def in_flight() -> int:
+    """Number of distinct paths currently being fetched by this worker."""
+    with _calls_lock:
+        return len(_calls)
+
+
+def _leader_get(path: str, fetch):
+    if not settings.HIBP_COALESCE_ACROSS_WORKERS:
+        return fetch(path)
+
+    lock_key = cache_key("inflight", path)
+    result_key = cache_key("inflight-result", path)
+    wait = settings.HIBP_COALESCE_WAIT
+
+    if not cache.add(lock_key, 1, wait):
+        # Another worker is already fetching this path; wait for its result.
+        since = time.time()
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            entry = cache.get(result_key)
+            if _fetched_since(entry, since):
+                return from_entry(entry, MISS)
+            if cache.get(lock_key) is None:
+                break
+            time.sleep(settings.HIBP_COALESCE_POLL_INTERVAL)
+        return fetch(path)
+
+    try:
+        resp = fetch(path)
+        cache.set(result_key, to_entry(resp), settings.HIBP_COALESCE_RESULT_TTL)
+        return resp
+    finally:
+        cache.delete(lock_key)
+
+
+def _fetched_since(entry, since: float) -> bool:
+    return entry is not None and entry["fetched_at"] >= since
+
+
+_afutures = {}
+
+
+async def acoalesced_get(path: str, fetch):
+    """Async counterpart of ``coalesced_get``; ``fetch`` is awaited."""
+    future = _afutures.get(path)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = _afutures[path] = asyncio.get_running_loop().create_future()
+    try:
+        resp = await _aleader_get(path, fetch)
+        future.set_result(resp)
+        return resp
+    except BaseException as exc:
+        future.set_exception(exc)
+        # Mark the exception as retrieved when nobody else was waiting.
+        future.exception()
+        raise
+    finally:
+        _afutures.pop(path, None)
+
+
+async def _aleader_get(path: str, fetch):
+    if not settings.HIBP_COALESCE_ACROSS_WORKERS:
+        return await fetch(path)
+
+    lock_key = cache_key("inflight", path)
+    result_key = cache_key("inflight-result", path)
+    wait = settings.HIBP_COALESCE_WAIT
+
+    if not await cache.aadd(lock_key, 1, wait):
+        since = time.time()
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            entry = await cache.aget(result_key)
+            if _fetched_since(entry, since):
+                return from_entry(entry, MISS)
+            if await cache.aget(lock_key) is None:
+                break
+            await asyncio.sleep(settings.HIBP_COALESCE_POLL_INTERVAL)
+        return await fetch(path)
+
+    try:
+        resp = await fetch(path)
+        await cache.aset(result_key, to_entry(resp), settings.HIBP_COALESCE_RESULT_TTL)
+        return resp
+    finally:
+        await cache.adelete(lock_key)
@@ -0,0 +1,213 @@
+# api/counters.py
+"""
+Atomic counters shared by all workers on all nodes.
+
+Throttle windows (``api/throttling.py``), concurrent call slots
+(``api/quotas.py``) and cache namespace versions (``api/tiered_cache.py``)
+need an increment that is atomic and keeps the counter's expiry.  Redis'
+``INCR`` does both.  Django's ``DatabaseCache`` does neither: its ``incr``
+is a read and a separate write that loses concurrent updates and resets
+the expiry to the cache's default timeout.
+
+With ``HIBP_COUNTER_BACKEND = "database"`` (the default unless the shared
+cache is Redis) counters are ``SharedCounter`` rows, changed with single
+``INSERT ... ON CONFLICT DO UPDATE ... RETURNING`` statements like the rate
+governor's bucket; expired rows are deleted every ``CULL_EVERY``
+increments.  With ``"cache"`` they live in the shared cache, which then must
+have atomic counters.
+"""
+import itertools
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+# ``models`` needs ``tiered_cache``, which needs this module: look the
+# model up when it is used.
+from . import models
+
+# Delete expired rows once per this many increments (per process).
+CULL_EVERY = 1000
+
+
+class DatabaseCounters:
+    """Counters in the ``SharedCounter`` table."""
+
+    def __init__(self):
+        self._increments = itertools.count(1)
+
+    def incr_many(self, counters: dict, read=(), initial: int = 1) -> dict:
+        now = time.time()
+        table = models.SharedCounter._meta.db_table
+        # A fixed order keeps concurrent writers from deadlocking on the rows.
+        names = sorted(counters)
+        values = ", ".join(["(%s, %s, %s)"] * len(names))
+        params = []
+        for name in names:
+            ttl = counters[name]
+            params += [name, initial, None if ttl is None else now + ttl]
+        sql = (
+            f"WITH hit AS ("
+            f"INSERT INTO {table} AS counter (name, value, expires_at) VALUES {values} "
+            f"ON CONFLICT (name) DO UPDATE SET "
+            f"value = CASE WHEN counter.expires_at <= %s "
+            f"THEN EXCLUDED.value ELSE counter.value + 1 END, "
+            f"expires_at = CASE WHEN counter.expires_at <= %s "
+            f"THEN EXCLUDED.expires_at ELSE counter.expires_at END "
+            f"RETURNING name, value) "
+            f"SELECT name, value FROM hit"
+        )
+        params += [now, now]
+        if read:
+            sql += (
+                f" UNION ALL SELECT name, value FROM {table} "
+                f"WHERE name = ANY(%s) AND (expires_at IS NULL OR expires_at > %s)"
+            )
+            params += [list(read), now]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            result = dict(cursor.fetchall())
+            if next(self._increments) % CULL_EVERY == 0:
+                cursor.execute(f"DELETE FROM {table} WHERE expires_at <= %s", [now])
+        return result
+
+    def decr_many(self, names) -> None:
+        table = models.SharedCounter._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET value = value - 1 "
+                f"WHERE name = ANY(%s) AND (expires_at IS NULL OR expires_at > %s)",
+                [sorted(names), time.time()],
+            )
+
+    def get(self, name: str) -> int | None:
+        table = models.SharedCounter._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT value FROM {table} "
+                f"WHERE name = %s AND (expires_at IS NULL OR expires_at > %s)",
+                [name, time.time()],
+            )
+            row = cursor.fetchone()
+        return None if row is None else row[0]
+
+    def add(self, name: str, value: int, ttl: float | None = None) -> bool:
+        now = time.time()
+        table = models.SharedCounter._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} AS counter (name, value, expires_at) VALUES (%s, %s, %s) "
+                f"ON CONFLICT (name) DO UPDATE SET "
+                f"value = EXCLUDED.value, expires_at = EXCLUDED.expires_at "
+                f"WHERE counter.expires_at <= %s "
+                f"RETURNING 1",
+                [name, value, None if ttl is None else now + ttl, now],
+            )
+            return cursor.fetchone() is not None
+
+
+class CacheCounters:
+    """Counters in a Django cache whose ``incr`` is atomic (Redis)."""
+
+    def __init__(self, backend):
+        self.cache = backend
+
+    def incr_many(self, counters: dict, read=(), initial: int = 1) -> dict:
+        result = {}
+        for name, ttl in counters.items():
+            try:
+                result[name] = self.cache.incr(name)
+            except ValueError:
+                if self.cache.add(name, initial, ttl):
+                    result[name] = initial
+                else:
+                    result[name] = self.cache.incr(name)
+        if read:
+            result.update(self.cache.get_many(list(read)))
+        return result
+
+    def decr_many(self, names) -> None:
+        for name in names:
+            try:
+                self.cache.decr(name)
+            except ValueError:  # expired meanwhile
+                pass
+
+    def get(self, name: str) -> int | None:
+        return self.cache.get(name)
+
+    def add(self, name: str, value: int, ttl: float | None = None) -> bool:
+        return self.cache.add(name, value, ttl)
+
+
+_database = DatabaseCounters()
+
+
+def backend():
+    """The counter store selected by ``HIBP_COUNTER_BACKEND``."""
+    if settings.HIBP_COUNTER_BACKEND == "database":
+        return _database
+    if settings.HIBP_COUNTER_BACKEND != "cache":
+        raise ImproperlyConfigured('HIBP_COUNTER_BACKEND must be "database" or "cache".')
+    shared = caches["default"]
+    if isinstance(shared, DatabaseCache):
+        raise ImproperlyConfigured(
+            'HIBP_COUNTER_BACKEND = "cache" needs a cache with atomic counters, not DatabaseCache.'
+        )
+    return CacheCounters(shared)
+
+
+def incr(name: str, ttl: float | None = None, initial: int = 1) -> int:
+    """
+    Add one to counter ``name`` and return its new value.  A missing or
+    expired counter starts at ``initial`` and expires ``ttl`` seconds later
+    (None: never); incrementing it does not move the expiry.
+    """
+    return backend().incr_many({name: ttl}, initial=initial)[name]
+
+
+def incr_many(counters: dict, read=()) -> dict:
+    """
+    Increment each counter of ``counters`` (name -> ttl) like ``incr`` and
+    read the counters named in ``read``, in one round trip to the database.
+    Returns name -> value; unknown or expired ``read`` counters are left out.
+    """
+    return backend().incr_many(counters, read)
+
+
+def decr(name: str) -> None:
+    """Subtract one from counter ``name`` unless it has expired."""
+    backend().decr_many([name])
+
+
+def decr_many(names) -> None:
+    backend().decr_many(names)
+
+
+def get(name: str) -> int | None:
+    return backend().get(name)
+
+
+def add(name: str, value: int, ttl: float | None = None) -> bool:
+    """Create counter ``name`` unless it exists; True if it was created."""
+    return backend().add(name, value, ttl)
+
+
+async def aincr(name: str, ttl: float | None = None, initial: int = 1) -> int:
+    return await sync_to_async(incr)(name, ttl, initial)
+
+
+async def adecr(name: str) -> None:
+    await sync_to_async(decr)(name)
+
+
+async def aget(name: str) -> int | None:
+    return await sync_to_async(get)(name)
+
+
+async def aadd(name: str, value: int, ttl: float | None = None) -> bool:
+    return await sync_to_async(add)(name, value, ttl)
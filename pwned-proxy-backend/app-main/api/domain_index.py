@@ -0,0 +1,50 @@
+# api/domain_index.py
+"""
+In-memory matching of domain authorization rules.
+
+An API key may query the domains linked to it (``APIKey.domains``) and,
+through ``DomainRule`` rows, a domain together with all its subdomains.
+``DomainIndex`` compiles both into two frozen sets so a check walks the
+labels of the queried domain once: ``a.b.dtu.dk`` is allowed if it is an
+exact domain or if ``a.b.dtu.dk``, ``b.dtu.dk``, ``dtu.dk`` or ``dk`` is a
+suffix rule.
+"""
+from dataclasses import dataclass
+
+
+def normalize_domain(name: str) -> str:
+    """Lower-case ``name`` and drop a trailing root dot."""
+    return name.strip().lower().rstrip(".")
+
+
+def suffixes(domain: str):
+    """Yield ``domain`` and each parent domain, longest first."""
+    labels = domain.split(".")
+    for i in range(len(labels)):
+        yield ".".join(labels[i:])
+
+
+@dataclass(frozen=True)
+class DomainIndex:
+    exact: frozenset = frozenset()
+    subtrees: frozenset = frozenset()
+
+    @classmethod
+    def compile(cls, exact=(), subtrees=()) -> "DomainIndex":
+        return cls(
+            frozenset(normalize_domain(d) for d in exact),
+            frozenset(normalize_domain(d) for d in subtrees),
+        )
+
+    def __contains__(self, domain) -> bool:
+        if not isinstance(domain, str):
+            return False
+        domain = normalize_domain(domain)
+        if domain in self.exact:
+            return True
+        if not self.subtrees:
+            return False
+        return any(suffix in self.subtrees for suffix in suffixes(domain))
+
+    def __bool__(self) -> bool:
+        return bool(self.exact or self.subtrees)
@@ -0,0 +1,230 @@
+# api/governor.py
+"""
+Cluster-wide rate governor for upstream HIBP calls.
+
+The governor is a GCRA token bucket sized from the subscription's
+requests-per-minute.  Its state is one ``UpstreamRateBucket`` row that every
+worker on every node updates with a single atomic ``UPDATE ... RETURNING``,
+so the budget is shared no matter how many processes run the proxy.
+
+Instead of failing, callers reserve the next free slot and sleep until it
+arrives.  A caller is turned away (``UpstreamRateLimited``, 503) only when
+more than ``HIBP_GOVERNOR_MAX_WAITERS`` callers are already queued in this
+worker or when the slot lies further out than ``HIBP_GOVERNOR_MAX_WAIT``.
+If HIBP still answers 429, the bucket is pushed back by ``Retry-After``
+and the call is retried within the same deadline.
+"""
+import asyncio
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import UpstreamRateBucket
+
+RPM_CACHE_KEY = "hibp_subscription_rpm"
+
+
+class UpstreamRateLimited(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Upstream HIBP rate limit reached, try again shortly."
+    default_code = "upstream_rate_limited"
+
+    def __init__(self, retry_after: float | None = None):
+        super().__init__()
+        # DRF's exception handler turns ``wait`` into a Retry-After header.
+        self.wait = math.ceil(retry_after) if retry_after else None
+
+
+_waiters = None
+_waiters_lock = threading.Lock()
+_waiters_size = None
+_known_buckets = set()
+
+
+def _waiter_slots() -> threading.BoundedSemaphore:
+    global _waiters, _waiters_size
+    size = settings.HIBP_GOVERNOR_MAX_WAITERS
+    if _waiters_size != size:
+        with _waiters_lock:
+            if _waiters_size != size:
+                _waiters = threading.BoundedSemaphore(size)
+                _waiters_size = size
+    return _waiters
+
+
+def get_rpm(api_key: str, fetch_status=None) -> int:
+    """
+    Return the configured requests-per-minute.
+
+    ``HIBP_RATE_LIMIT_RPM`` may be a number, ``0`` to disable the governor,
+    or ``"auto"`` to read ``Rpm`` from ``subscription/status`` (cached for
+    an hour, falling back to ``HIBP_RATE_LIMIT_RPM_FALLBACK``).
+    """
+    configured = str(settings.HIBP_RATE_LIMIT_RPM).strip().lower()
+    if configured != "auto":
+        return int(configured)
+
+    cache_key = f"{RPM_CACHE_KEY}:{api_key[-6:]}"
+    rpm = cache.get(cache_key)
+    if rpm is not None:
+        return rpm
+
+    rpm = settings.HIBP_RATE_LIMIT_RPM_FALLBACK
+    if fetch_status is not None:
+        try:
+            resp = fetch_status()
+            if resp.status_code == 200:
+                rpm = int(resp.json().get("Rpm") or rpm)
+        except (APIException, ValueError, TypeError):
+            pass
+    cache.set(cache_key, rpm, 60 * 60)
+    return rpm
+
+
+def reserve(bucket: str, rpm: int, burst: int, max_wait: float) -> float | None:
+    """
+    Atomically reserve the next slot in ``bucket``.
+
+    Returns the number of seconds to wait before using the slot, or None
+    when the slot is further out than ``max_wait`` (nothing is reserved).
+    """
+    if bucket not in _known_buckets:
+        UpstreamRateBucket.objects.get_or_create(name=bucket)
+        _known_buckets.add(bucket)
+
+    interval = 60.0 / rpm
+    tolerance = interval * max(burst - 1, 0)
+    now = time.time()
+    table = UpstreamRateBucket._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET tat = GREATEST(tat, %s) + %s "
+            f"WHERE name = %s AND GREATEST(tat, %s) - %s - %s <= %s "
+            f"RETURNING tat",
+            [now, interval, bucket, now, tolerance, now, max_wait],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return max(0.0, row[0] - interval - tolerance - now)
+
+
+def penalize(bucket: str, seconds: float) -> None:
+    """Push the bucket back after HIBP answered 429 despite the governor."""
+    UpstreamRateBucket.objects.filter(name=bucket, tat__lt=time.time() + seconds).update(
+        tat=time.time() + seconds
+    )
+
+
+def governed_get(
+    path: str, fetch, api_key: str, fetch_status=None, bucket: str = "hibp",
+    rpm: int | None = None, retry_429: bool = True,
+):
+    """
+    Call ``fetch(path)`` once the shared bucket grants a slot, retrying
+    upstream 429 answers until ``HIBP_GOVERNOR_MAX_WAIT`` runs out.
+
+    ``rpm`` overrides ``HIBP_RATE_LIMIT_RPM`` for this bucket; with
+    ``retry_429=False`` a 429 answer is returned right away (after pushing
+    the bucket back) so the caller can try another key.
+    """
+    if rpm is None:
+        rpm = get_rpm(api_key, fetch_status)
+    if rpm <= 0:
+        return fetch(path)
+
+    deadline = time.monotonic() + settings.HIBP_GOVERNOR_MAX_WAIT
+    slots = _waiter_slots()
+    if not slots.acquire(blocking=False):
+        raise UpstreamRateLimited(retry_after=60.0 / rpm)
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            wait = reserve(bucket, rpm, settings.HIBP_GOVERNOR_BURST, remaining)
+            if wait is None:
+                raise UpstreamRateLimited(retry_after=60.0 / rpm)
+            time.sleep(wait)
+
+            resp = fetch(path)
+            if resp.status_code != 429:
+                return resp
+            retry_after = _retry_after(resp)
+            penalize(bucket, retry_after)
+            if not retry_429 or deadline - time.monotonic() < retry_after:
+                return resp
+            resp.close()  # give a streamed connection back before retrying
+    finally:
+        slots.release()
+
+
+_async_waiters = 0
+
+
+async def agoverned_get(
+    path: str, fetch, api_key: str, fetch_status=None, bucket: str = "hibp",
+    rpm: int | None = None, retry_429: bool = True,
+):
+    """
+    Async counterpart of ``governed_get``; ``fetch`` and ``fetch_status``
+    are awaited and the bucket row is updated in a worker thread.
+    """
+    global _async_waiters
+    if rpm is None:
+        rpm = await _aget_rpm(api_key, fetch_status)
+    if rpm <= 0:
+        return await fetch(path)
+
+    deadline = time.monotonic() + settings.HIBP_GOVERNOR_MAX_WAIT
+    if _async_waiters >= settings.HIBP_GOVERNOR_MAX_WAITERS:
+        raise UpstreamRateLimited(retry_after=60.0 / rpm)
+    _async_waiters += 1
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            wait = await sync_to_async(reserve)(
+                bucket, rpm, settings.HIBP_GOVERNOR_BURST, remaining
+            )
+            if wait is None:
+                raise UpstreamRateLimited(retry_after=60.0 / rpm)
+            await asyncio.sleep(wait)
+
+            resp = await fetch(path)
+            if resp.status_code != 429:
+                return resp
+            retry_after = _retry_after(resp)
+            await sync_to_async(penalize)(bucket, retry_after)
+            if not retry_429 or deadline - time.monotonic() < retry_after:
+                return resp
+            await resp.aclose()
+    finally:
+        _async_waiters -= 1
+
+
+async def _aget_rpm(api_key: str, fetch_status=None) -> int:
+    configured = str(settings.HIBP_RATE_LIMIT_RPM).strip().lower()
+    if configured != "auto":
+        return int(configured)
+    cached = await cache.aget(f"{RPM_CACHE_KEY}:{api_key[-6:]}")
+    if cached is not None:
+        return cached
+    resp = None
+    if fetch_status is not None:
+        try:
+            resp = await fetch_status()
+        except APIException:
+            pass
+    return await sync_to_async(get_rpm)(api_key, (lambda: resp) if resp else None)
+
+
+def _retry_after(resp) -> float:
+    try:
+        return float(resp.headers.get("Retry-After", 2))
+    except (TypeError, ValueError):
+        return 2.0
@@ -0,0 +1,179 @@
+# api/keypool.py
+"""
+Pool of HIBP subscription keys.
+
+Every active ``HIBPKey`` has its own governor bucket (``hibp-key-<pk>``) and
+its own requests-per-minute.  Each upstream call goes to the healthy key
+with the most remaining budget, i.e. the one whose bucket grants the
+earliest slot.  A key that HIBP answers with 401 (invalid or expired) or
+429 (over its limit) is taken out of rotation for
+``HIBP_KEY_UNAUTHORIZED_COOLDOWN`` seconds or the ``Retry-After`` period
+and the call is retried on the next key.
+
+Health is shared between workers through the cache and mirrored onto the
+``HIBPKey`` row so it shows up in the admin.
+"""
+import itertools
+import math
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .governor import UpstreamRateLimited, agoverned_get, governed_get, _retry_after
+from .models import HIBPKey, UpstreamRateBucket
+from .utils import get_hibp_keys
+
+DOWN_CACHE_KEY = "hibp_key_down"
+
+
+class NoUpstreamKey(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "No HIBP API key is currently usable, try again shortly."
+    default_code = "no_upstream_key"
+
+    def __init__(self, retry_after: float | None = None):
+        super().__init__()
+        self.wait = math.ceil(retry_after) if retry_after else None
+
+
+_rotation = itertools.count()
+
+
+def bucket_name(pk: int) -> str:
+    return f"hibp-key-{pk}"
+
+
+def rank_keys(keys, exclude=()) -> list[tuple[int, str, int | None]]:
+    """
+    Return the usable keys of ``keys`` best first: healthy keys ordered by
+    the time their bucket grants the next slot, then by larger RPM, with a
+    rotating tie-break so equal keys take turns.
+    """
+    keys = [k for k in keys if k[0] not in exclude]
+    if not keys:
+        return []
+    now = time.time()
+    down = cache.get_many([f"{DOWN_CACHE_KEY}:{k[0]}" for k in keys])
+    keys = [k for k in keys if down.get(f"{DOWN_CACHE_KEY}:{k[0]}", 0) <= now]
+    if len(keys) < 2:
+        return keys
+
+    tats = dict(
+        UpstreamRateBucket.objects.filter(
+            name__in=[bucket_name(k[0]) for k in keys]
+        ).values_list("name", "tat")
+    )
+    turn = next(_rotation)
+    return [
+        key for _rank, key in sorted(
+            (
+                (max(tats.get(bucket_name(key[0]), 0.0), now), -(key[2] or 0), (i - turn) % len(keys)),
+                key,
+            )
+            for i, key in enumerate(keys)
+        )
+    ]
+
+
+def next_available(keys) -> float | None:
+    """Seconds until the first key out of rotation becomes usable again."""
+    down = cache.get_many([f"{DOWN_CACHE_KEY}:{k[0]}" for k in keys])
+    if not down:
+        return None
+    return max(0.0, min(down.values()) - time.time())
+
+
+def mark_down(pk: int, status_code: int, seconds: float) -> None:
+    """Take key ``pk`` out of rotation for ``seconds``."""
+    seconds = max(1.0, seconds)
+    cache.set(f"{DOWN_CACHE_KEY}:{pk}", time.time() + seconds, math.ceil(seconds))
+    HIBPKey.objects.filter(pk=pk).update(
+        last_error_status=status_code,
+        unavailable_until=timezone.now() + timedelta(seconds=seconds),
+    )
+
+
+def _cooldown(resp) -> float | None:
+    if resp.status_code == 401:
+        return settings.HIBP_KEY_UNAUTHORIZED_COOLDOWN
+    if resp.status_code == 429:
+        return _retry_after(resp)
+    return None
+
+
+def pooled_get(path: str, fetch, fetch_status):
+    """
+    Call ``fetch(path, api_key)`` with the best key of the pool through its
+    governor bucket, moving on to the next key when a key is rate limited
+    or rejected.  ``fetch_status(api_key)`` returns ``subscription/status``
+    for keys without a configured RPM.
+    """
+    keys = get_hibp_keys()
+    tried = set()
+    resp = error = None
+    while True:
+        ranked = rank_keys(keys, exclude=tried)
+        if not ranked:
+            break
+        pk, api_key, rpm = ranked[0]
+        tried.add(pk)
+        try:
+            attempt = governed_get(
+                path, lambda p: fetch(p, api_key), api_key,
+                fetch_status=lambda: fetch_status(api_key),
+                bucket=bucket_name(pk), rpm=rpm, retry_429=len(keys) == 1,
+            )
+        except UpstreamRateLimited as exc:
+            error = exc
+            continue
+        if resp is not None:
+            resp.close()  # release a streamed body of the previous key
+        resp = attempt
+        cooldown = _cooldown(resp)
+        if cooldown is None:
+            return resp
+        mark_down(pk, resp.status_code, cooldown)
+
+    if resp is not None:
+        return resp
+    if error is not None:
+        raise error
+    raise NoUpstreamKey(retry_after=next_available(keys))
+
+
+async def apooled_get(path: str, fetch, fetch_status):
+    """Async counterpart of ``pooled_get``; ``fetch`` and ``fetch_status`` are awaited."""
+    keys = await sync_to_async(get_hibp_keys)()
+    tried = set()
+    resp = error = None
+    while True:
+        ranked = await sync_to_async(rank_keys)(keys, exclude=tried)
+        if not ranked:
+            break
+        pk, api_key, rpm = ranked[0]
+        tried.add(pk)
+        try:
+            resp = await agoverned_get(
+                path, lambda p: fetch(p, api_key), api_key,
+                fetch_status=lambda: fetch_status(api_key),
+                bucket=bucket_name(pk), rpm=rpm, retry_429=len(keys) == 1,
+            )
+        except UpstreamRateLimited as exc:
+            error = exc
+            continue
+        cooldown = _cooldown(resp)
+        if cooldown is None:
+            return resp
+        await sync_to_async(mark_down)(pk, resp.status_code, cooldown)
+
+    if resp is not None:
+        return resp
+    if error is not None:
+        raise error
+    raise NoUpstreamKey(retry_after=await sync_to_async(next_available)(keys))
@@ -0,0 +1,251 @@
+# api/log_writer.py
+"""
+Buffered writer for ``EndpointLog`` rows.
+
+Views hand their log rows to ``record()``, which only puts them on an
+in-memory queue; a background thread per worker process writes them with
+``bulk_create`` once ``HIBP_LOG_BATCH_SIZE`` rows are waiting or
+``HIBP_LOG_FLUSH_INTERVAL`` seconds have passed.  The response path thus no
+longer waits for an INSERT.
+
+The queue holds at most ``HIBP_LOG_QUEUE_SIZE`` rows.  When the database
+cannot keep up, further rows are dropped and counted rather than blocking
+requests; rows of a batch that fails to insert are counted as dropped too.
+Drops are logged as warnings at most every ``DROP_WARNING_INTERVAL``
+seconds, and ``writer_stats()`` (shown by ``/upstream/health``) reports the
+counts.  The queue is drained when the worker exits.  With ``HIBP_LOG_QUEUE_SIZE = 0``
+rows are written inline, as before.
+
+Each batch also updates the hourly ``EndpointUsage`` rollups (see
+``api/usage.py``) in the same transaction.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import Endpoint, EndpointLog
+from .usage import add_usage
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Seconds between two "rows dropped" warnings of one writer.
+DROP_WARNING_INTERVAL = 60
+
+
+# Endpoint name -> saved ``Endpoint`` row; the dictionary only grows.
+_endpoints = {}
+
+
+def resolve_endpoints(logs) -> None:
+    """
+    Point the logs' unsaved ``Endpoint(name=...)`` at dictionary rows,
+    adding rows for names not seen before.
+    """
+    missing = {log.endpoint.name for log in logs} - _endpoints.keys()
+    if missing:
+        Endpoint.objects.bulk_create(
+            [Endpoint(name=name) for name in sorted(missing)], ignore_conflicts=True
+        )
+        _endpoints.update(
+            (endpoint.name, endpoint) for endpoint in Endpoint.objects.filter(name__in=missing)
+        )
+    for log in logs:
+        log.endpoint = _endpoints[log.endpoint.name]
+
+
+def write_logs(logs) -> None:
+    """Insert ``logs`` and add them to the usage rollups."""
+    # Outside the transaction: a cached dictionary row must not be rolled back.
+    resolve_endpoints(logs)
+    with transaction.atomic():
+        EndpointLog.objects.bulk_create(logs)
+        add_usage(logs)
+
+
+def make_log(principal, endpoint: str, status_code: int, **details) -> EndpointLog:
+    """
+    ``details`` are the timing fields of ``request_stats.log_details``.  The
+    endpoint is resolved to its dictionary id when the row is written.
+    """
+    return EndpointLog(
+        api_key_id=principal.api_key_id if principal else None,
+        group_id=principal.group_id if principal else None,
+        endpoint=Endpoint(name=endpoint),
+        status_code=status_code,
+        created_at=timezone.now(),
+        **details,
+    )
+
+
+class LogWriter:
+    def __init__(self, max_size: int, batch_size: int, flush_interval: float):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._reported = 0
+        self._reported_at = float("-inf")
+        self._queue = queue.Queue(max_size)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def put(self, logs) -> None:
+        self._ensure_started()
+        dropped = 0
+        for log in logs:
+            try:
+                self._queue.put_nowait(log)
+            except queue.Full:
+                dropped += 1
+        if dropped:
+            with self._lock:
+                self.dropped += dropped
+            self._report_dropped()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+    def close(self, timeout: float = 10) -> None:
+        """Write what is queued and stop the thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:  # pragma: no cover - thread is stuck
+            return
+        thread.join(timeout)
+
+    # -- internals ------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="endpoint-log-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._collect()
+                if batch:
+                    self._write(batch)
+        finally:
+            connections.close_all()
+
+    def _collect(self) -> tuple[list, bool]:
+        """Wait for a full batch, the flush interval or the stop marker."""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                log = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if log is _STOP:
+                return self._drain(batch), True
+            batch.append(log)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch, False
+
+    def _drain(self, batch: list) -> list:
+        while True:
+            try:
+                log = self._queue.get_nowait()
+            except queue.Empty:
+                return batch
+            if log is not _STOP:
+                batch.append(log)
+
+    def _write(self, batch: list) -> None:
+        close_old_connections()
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            try:
+                write_logs(chunk)
+            except Exception:
+                logger.exception("Could not write %d endpoint log rows", len(chunk))
+                with self._lock:
+                    self.dropped += len(chunk)
+            else:
+                self.written += len(chunk)
+        self._report_dropped()
+
+    def _report_dropped(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.dropped == self._reported or now - self._reported_at < DROP_WARNING_INTERVAL:
+                return
+            self._reported, self._reported_at = self.dropped, now
+        logger.warning("%d endpoint log rows dropped so far", self._reported)
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> LogWriter:
+    """Return this process's writer; forked workers get their own."""
+    global _writer, _writer_pid
+    pid = os.getpid()
+    if _writer_pid != pid:
+        with _writer_lock:
+            if _writer_pid != pid:
+                _writer = LogWriter(
+                    settings.HIBP_LOG_QUEUE_SIZE,
+                    settings.HIBP_LOG_BATCH_SIZE,
+                    settings.HIBP_LOG_FLUSH_INTERVAL,
+                )
+                _writer_pid = pid
+    return _writer
+
+
+def writer_stats() -> dict:
+    """Queued, written and dropped rows of this process's writer."""
+    return get_writer().stats()
+
+
+def record(logs) -> None:
+    """Queue ``EndpointLog`` rows for writing (or write them inline)."""
+    if settings.HIBP_LOG_QUEUE_SIZE <= 0:
+        write_logs(logs)
+        return
+    get_writer().put(logs)
+
+
+async def arecord(logs) -> None:
+    """Async counterpart of ``record``; queueing itself never blocks."""
+    if settings.HIBP_LOG_QUEUE_SIZE <= 0:
+        await sync_to_async(write_logs)(logs)
+        return
+    get_writer().put(logs)
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.close()
@@ -1,38 +1,37 @@
 # file: api/management/commands/import_domain_data.py
 
-import json
-import urllib.request
-import urllib.error
+import requests
 from django.core.management.base import BaseCommand
 from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import APIException
 
-from api.models import Domain, HIBPKey
-
-API_URL = "https://haveibeenpwned.com/api/v3/subscribeddomains"
+from api.keypool import pooled_get
+from api.models import Domain
+from api.upstream import upstream_get
+from api.utils import get_hibp_keys
 
 class Command(BaseCommand):
     help = "Import or update domain records from the HIBP API, removing any not returned."
 
     def handle(self, *args, **options):
-        # 1) Fetch the latest stored API key
-        hibp_key = HIBPKey.objects.order_by('-created_at').first()
-        if not hibp_key:
+        # 1) Make sure an active API key is configured
+        try:
+            get_hibp_keys()
+        except RuntimeError:
             self.stderr.write(
-                self.style.ERROR("No HIBPKey found in the database. Please add one in the admin.")
+                self.style.ERROR("No active HIBPKey found in the database. Please add one in the admin.")
             )
             return
 
-        # 2) Make a request to the HIBP API
+        # 2) Make a request to the HIBP API with the best key of the pool
         try:
-            req = urllib.request.Request(
-                API_URL,
-                headers={
-                    "hibp-api-key": hibp_key.api_key,
-                }
+            response = pooled_get(
+                "subscribeddomains", upstream_get,
+                lambda key: upstream_get("subscription/status", key),
             )
-            with urllib.request.urlopen(req) as response:
-                data = json.loads(response.read().decode("utf-8"))
-        except urllib.error.URLError as e:
+            response.raise_for_status()
+            data = response.json()
+        except (APIException, requests.RequestException, ValueError) as e:
             self.stderr.write(self.style.ERROR(f"Error fetching domains from the HIBP API: {e}"))
             return
 
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.core.management import call_command
 from django.contrib.auth.models import Group
-from api.models import HIBPKey, APIKey, Domain
+from api.models import HIBPKey, APIKey, DomainRule
 from api.admin import SEED_DATA
 import os
 import json
@@ -58,8 +58,9 @@ class Command(BaseCommand):
                     name=f"Seed key for {group_name}",
                     description="Initial seed key",
                 )
-                matching = Domain.objects.filter(name__endswith=base_domain)
-                api_key_obj.domains.add(*matching)
+                DomainRule.objects.create(
+                    api_key=api_key_obj, domain=base_domain, include_subdomains=True
+                )
                 results.append({"group": group_name, "api_key": raw_key})
 
             for res in results:
@@ -0,0 +1,50 @@
+# file: api/management/commands/latency_report.py
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ParseError
+
+from api.usage import LATENCY_GROUPINGS, PERCENTILES, latency_report, parse_period
+
+
+class Command(BaseCommand):
+    help = (
+        "Print request counts and p50/p95/p99 of the total and HIBP (upstream) "
+        "time per endpoint or group over a time range, in milliseconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="ISO 8601 start time (default: 24 hours ago).")
+        parser.add_argument("--until", help="ISO 8601 end time (default: now).")
+        parser.add_argument(
+            "--by", choices=list(LATENCY_GROUPINGS), default="endpoint",
+            help="Group the report by endpoint (default) or group.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since, until = parse_period(options["since"], options["until"])
+        except ParseError as exc:
+            raise CommandError(exc.detail)
+        rows = latency_report(since, until, by=options["by"])
+
+        self.stdout.write(f"Requests from {since.isoformat()} to {until.isoformat()}")
+        columns = [options["by"], "requests", "cache_hits", "upstream_calls"]
+        columns += [f"p{p}" for p in PERCENTILES]
+        columns += [f"upstream_p{p}" for p in PERCENTILES]
+        table = [columns] + [[_format(row[c]) for c in columns] for row in rows]
+        widths = [max(len(line[i]) for line in table) for i in range(len(columns))]
+        for line in table:
+            self.stdout.write("  ".join(
+                cell.ljust(width) if i == 0 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(line, widths))
+            ))
+        if not rows:
+            self.stdout.write("No requests with timings in this range.")
+
+
+def _format(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.0f}"
+    return str(value)
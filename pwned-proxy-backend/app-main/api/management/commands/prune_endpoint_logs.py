@@ -0,0 +1,47 @@
+# file: api/management/commands/prune_endpoint_logs.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.retention import prune
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete EndpointLog rows older than HIBP_LOG_RETENTION_DAYS and usage "
+        "rollups older than HIBP_USAGE_RETENTION_DAYS, in small chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.HIBP_LOG_RETENTION_DAYS,
+            help="Keep this many days of logs (0 = keep all).",
+        )
+        parser.add_argument(
+            "--usage-days", type=int, default=settings.HIBP_USAGE_RETENTION_DAYS,
+            help="Keep this many days of usage rollups (0 = keep all).",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=settings.HIBP_RETENTION_CHUNK_SIZE,
+            help="Rows deleted per transaction.",
+        )
+        parser.add_argument(
+            "--pause", type=float, default=0,
+            help="Seconds to sleep between chunks to spread the load.",
+        )
+        parser.add_argument(
+            "--max-chunks", type=int, default=0,
+            help="Stop after this many chunks per table (0 = until done).",
+        )
+
+    def handle(self, *args, **options):
+        deleted = prune(
+            options["days"],
+            options["usage_days"],
+            chunk_size=options["chunk_size"],
+            pause=options["pause"],
+            max_chunks=options["max_chunks"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted['logs']} log rows and {deleted['usage']} usage rows."
+        ))
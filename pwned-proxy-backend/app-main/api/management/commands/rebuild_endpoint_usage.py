@@ -0,0 +1,33 @@
+# file: api/management/commands/rebuild_endpoint_usage.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.usage import rebuild_usage
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the hourly EndpointUsage rollups from EndpointLog, e.g. for "
+        "rows logged before the rollups existed. Requests logged while it runs "
+        "may be counted twice or not at all; run it when traffic is low."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help="Only rebuild hours from this ISO 8601 time on (default: all).",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError("--since must be an ISO 8601 timestamp.")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        rows = rebuild_usage(since)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} usage rollup rows."))
@@ -0,0 +1,91 @@
+# file: api/management/commands/sync_breach_catalog.py
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import APIException
+
+from api.catalog import dump_json
+from api.keypool import pooled_get
+from api.models import Breach, DataClass
+from api.upstream import upstream_get
+from api.utils import get_hibp_keys
+
+
+UPDATE_FIELDS = [
+    "title", "domain", "breach_date", "added_date", "modified_date",
+    "pwn_count", "is_verified", "is_spam_list", "position", "raw",
+]
+
+
+class Command(BaseCommand):
+    help = "Mirror HIBP's /breaches and /dataclasses into the local breach catalog."
+
+    def handle(self, *args, **options):
+        try:
+            get_hibp_keys()
+        except RuntimeError:
+            self.stderr.write(
+                self.style.ERROR("No active HIBPKey found in the database. Please add one in the admin.")
+            )
+            return
+
+        try:
+            breaches = self.fetch("breaches")
+            dataclasses = self.fetch("dataclasses")
+        except (APIException, requests.RequestException, ValueError) as e:
+            self.stderr.write(self.style.ERROR(f"Error fetching the breach catalog from the HIBP API: {e}"))
+            return
+
+        with transaction.atomic():
+            existing = {b.name: b for b in Breach.objects.all()}
+            to_create, to_update = [], []
+            for position, data in enumerate(breaches):
+                fields = {
+                    "title": data.get("Title") or "",
+                    "domain": data.get("Domain") or "",
+                    "breach_date": parse_date(data["BreachDate"]) if data.get("BreachDate") else None,
+                    "added_date": parse_datetime(data["AddedDate"]) if data.get("AddedDate") else None,
+                    "modified_date": parse_datetime(data["ModifiedDate"]) if data.get("ModifiedDate") else None,
+                    "pwn_count": data.get("PwnCount") or 0,
+                    "is_verified": bool(data.get("IsVerified", True)),
+                    "is_spam_list": bool(data.get("IsSpamList", False)),
+                    "position": position,
+                    "raw": dump_json(data),
+                }
+                breach = existing.pop(data["Name"], None)
+                if breach is None:
+                    to_create.append(Breach(name=data["Name"], **fields))
+                else:
+                    for field, value in fields.items():
+                        setattr(breach, field, value)
+                    to_update.append(breach)
+
+            Breach.objects.bulk_create(to_create, batch_size=500)
+            Breach.objects.bulk_update(to_update, UPDATE_FIELDS, batch_size=500)
+            deleted, _ = Breach.objects.filter(name__in=list(existing)).delete()
+            # bulk_update bypasses auto_now, so stamp the sync time explicitly.
+            # Workers rebuild their in-memory index when this value changes.
+            Breach.objects.update(synced_at=timezone.now())
+
+            DataClass.objects.all().delete()
+            DataClass.objects.bulk_create(
+                DataClass(name=name, position=position)
+                for position, name in enumerate(dataclasses)
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {len(breaches)} breaches ({len(to_create)} new, {deleted} removed) "
+            f"and {len(dataclasses)} data classes."
+        ))
+
+    def fetch(self, path):
+        # Through the key pool, so cooled down keys are skipped and the call
+        # counts against the key's rate governor bucket.
+        response = pooled_get(
+            path, upstream_get, lambda key: upstream_get("subscription/status", key)
+        )
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,101 @@
+# file: api/management/commands/sync_domain_snapshots.py
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef, Subquery
+from rest_framework.exceptions import APIException
+
+from api.keypool import pooled_get
+from api.models import Domain, DomainSnapshot
+from api.snapshots import mark_verified, store_snapshot
+from api.upstream import upstream_get
+from api.utils import get_hibp_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Store a breacheddomain snapshot for every domain whose pwn_count "
+        "changed since its last snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--domain", action="append", dest="domains",
+            help="Only sync this domain (may be repeated).",
+        )
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Fetch new snapshots even when pwn_count is unchanged.",
+        )
+        parser.add_argument(
+            "--skip-import", action="store_true",
+            help="Do not refresh the Domain table (import_domain_data) first.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            get_hibp_keys()
+        except RuntimeError:
+            self.stderr.write(
+                self.style.ERROR("No active HIBPKey found in the database. Please add one in the admin.")
+            )
+            return
+
+        # pwn_count comes from subscribeddomains, so refresh it first.
+        if not options["skip_import"]:
+            call_command("import_domain_data")
+
+        latest = DomainSnapshot.objects.filter(domain=OuterRef("pk")).order_by("-version")
+        domains = Domain.objects.annotate(
+            has_snapshot=Exists(latest),
+            snapshot_pwn_count=Subquery(latest.values("pwn_count")[:1]),
+            snapshot_id=Subquery(latest.values("pk")[:1]),
+        ).order_by("name")
+        if options["domains"]:
+            domains = domains.filter(name__in=options["domains"])
+
+        def fetch(path, key):
+            return upstream_get(path, key)
+
+        stored = failed = 0
+        verified = []
+        for domain in domains:
+            if (
+                not options["force"]
+                and domain.has_snapshot
+                and domain.snapshot_pwn_count == domain.pwn_count
+            ):
+                verified.append(domain.snapshot_id)
+                continue
+
+            try:
+                resp = pooled_get(
+                    f"breacheddomain/{domain.name}", fetch,
+                    lambda key: fetch("subscription/status", key),
+                )
+            except APIException as e:
+                self.stderr.write(self.style.ERROR(f"Error fetching {domain.name}: {e}"))
+                failed += 1
+                continue
+            # HIBP answers 404 when no address on the domain is breached.
+            if resp.status_code not in (200, 404):
+                self.stderr.write(
+                    self.style.ERROR(f"Error fetching {domain.name}: HTTP {resp.status_code}")
+                )
+                failed += 1
+                continue
+
+            snapshot = store_snapshot(
+                domain, resp.status_code, resp.content, settings.HIBP_DOMAIN_SNAPSHOT_KEEP
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Stored {domain.name} v{snapshot.version} ({snapshot.size} bytes)"
+            ))
+            stored += 1
+
+        # Unchanged snapshots stay servable for another HIBP_DOMAIN_SNAPSHOT_MAX_AGE.
+        unchanged = mark_verified(verified)
+        self.stdout.write(self.style.SUCCESS(
+            f"Domain snapshots: {stored} stored, {unchanged} unchanged, {failed} failed."
+        ))
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_apikey_name_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UpstreamRateBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('tat', models.FloatField(default=0)),
+            ],
+        ),
+    ]
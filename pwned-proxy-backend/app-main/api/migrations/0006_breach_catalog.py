@@ -0,0 +1,45 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_upstreamratebucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Breach',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('domain', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('breach_date', models.DateField(blank=True, null=True)),
+                ('added_date', models.DateTimeField(blank=True, null=True)),
+                ('modified_date', models.DateTimeField(blank=True, null=True)),
+                ('pwn_count', models.BigIntegerField(default=0)),
+                ('is_verified', models.BooleanField(default=True)),
+                ('is_spam_list', models.BooleanField(default=False)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('raw', models.TextField()),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DataClass',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('position', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+    ]
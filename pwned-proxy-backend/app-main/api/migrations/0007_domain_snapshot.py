@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_breach_catalog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DomainSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('pwn_count', models.IntegerField(blank=True, null=True)),
+                ('status_code', models.PositiveSmallIntegerField(default=200)),
+                ('content', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='api.domain')),
+            ],
+            options={
+                'ordering': ['domain', '-version'],
+                'constraints': [models.UniqueConstraint(fields=('domain', 'version'), name='unique_domain_snapshot_version')],
+            },
+        ),
+    ]
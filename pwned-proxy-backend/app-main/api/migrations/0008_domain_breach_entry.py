@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_domain_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DomainBreachEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=255)),
+                ('breach', models.CharField(max_length=255)),
+                ('added_in', models.PositiveIntegerField()),
+                ('removed_in', models.PositiveIntegerField(blank=True, null=True)),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='breach_entries', to='api.domain')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['domain', 'added_in'], name='breach_entry_added_idx'), models.Index(fields=['domain', 'removed_in'], name='breach_entry_removed_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_domain_breach_entry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='domainbreachentry',
+            index=models.Index(condition=models.Q(('removed_in__isnull', True)), fields=['domain', 'alias'], name='breach_entry_current_alias_idx'),
+        ),
+    ]
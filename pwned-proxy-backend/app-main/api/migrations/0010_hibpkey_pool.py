@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_breach_entry_alias_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hibpkey',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='hibpkey',
+            name='last_error_status',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='hibpkey',
+            name='rpm',
+            field=models.PositiveIntegerField(blank=True, help_text="Requests per minute of this key's subscription. Leave empty to use HIBP_RATE_LIMIT_RPM.", null=True),
+        ),
+        migrations.AddField(
+            model_name='hibpkey',
+            name='unavailable_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
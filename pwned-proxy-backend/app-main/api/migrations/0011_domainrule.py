@@ -0,0 +1,26 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_hibpkey_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DomainRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=255)),
+                ('include_subdomains', models.BooleanField(default=True)),
+                ('api_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='domain_rules', to='api.apikey')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('api_key', 'domain'), name='unique_domain_rule_per_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:54
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_domainrule'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apikey',
+            name='burst',
+            field=models.PositiveIntegerField(blank=True, help_text='Requests allowed within HIBP_THROTTLE_BURST_WINDOW seconds.', null=True),
+        ),
+        migrations.AddField(
+            model_name='apikey',
+            name='max_concurrent',
+            field=models.PositiveIntegerField(blank=True, help_text='Upstream HIBP calls allowed at the same time.', null=True),
+        ),
+        migrations.AddField(
+            model_name='apikey',
+            name='rate_limit',
+            field=models.CharField(blank=True, help_text='Requests per period, e.g. "5000/day".', max_length=32, validators=[django.core.validators.RegexValidator('^\\d+/(s|sec|second|m|min|minute|h|hour|d|day)$', 'Enter a rate such as "5000/day" (per second, minute, hour or day).')]),
+        ),
+        migrations.CreateModel(
+            name='GroupQuota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rate_limit', models.CharField(blank=True, help_text='Requests per period, e.g. "5000/day".', max_length=32, validators=[django.core.validators.RegexValidator('^\\d+/(s|sec|second|m|min|minute|h|hour|d|day)$', 'Enter a rate such as "5000/day" (per second, minute, hour or day).')])),
+                ('burst', models.PositiveIntegerField(blank=True, help_text='Requests allowed within HIBP_THROTTLE_BURST_WINDOW seconds.', null=True)),
+                ('max_concurrent', models.PositiveIntegerField(blank=True, help_text='Upstream HIBP calls allowed at the same time.', null=True)),
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='quota', to='auth.group')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
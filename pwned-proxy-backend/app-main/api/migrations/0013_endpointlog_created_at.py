@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_quotas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='endpointlog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:01
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_endpointlog_created_at'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EndpointUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('endpoint', models.CharField(max_length=255)),
+                ('status_class', models.PositiveSmallIntegerField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('api_key', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='endpoint_usage', to='api.apikey')),
+                ('group', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='endpoint_usage', to='auth.group')),
+            ],
+            options={
+                'verbose_name_plural': 'endpoint usage',
+                'indexes': [models.Index(fields=['api_key', 'hour'], name='endpoint_usage_key_idx'), models.Index(fields=['group', 'hour'], name='endpoint_usage_group_idx')],
+                'constraints': [models.UniqueConstraint(models.F('hour'), django.db.models.functions.comparison.Coalesce('group', 0), django.db.models.functions.comparison.Coalesce('api_key', 0), models.F('endpoint'), models.F('status_class'), name='endpoint_usage_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_endpointusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='endpointlog',
+            name='cache_status',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='endpointlog',
+            name='duration_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='endpointlog',
+            name='response_bytes',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='endpointlog',
+            name='upstream_ms',
+            field=models.PositiveIntegerField(blank=True, help_text='Time spent calling HIBP, if it was called.', null=True),
+        ),
+        migrations.AddField(
+            model_name='endpointlog',
+            name='upstream_status',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:04
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Build the index without blocking log writes on a large table.
+    atomic = False
+
+    dependencies = [
+        ('api', '0015_endpointlog_timings'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='endpointlog',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='endpoint_log_created_brin'),
+        ),
+    ]
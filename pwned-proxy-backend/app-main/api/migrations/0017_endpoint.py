@@ -0,0 +1,109 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+# Log rows updated per transaction while filling ``endpoint_ref``.
+BATCH_SIZE = 50_000
+
+
+def fill_endpoint_refs(apps, schema_editor, start=None):
+    """
+    Add the logged names to the dictionary and point every row from id
+    ``start`` on (default: all rows) at its entry, one short transaction per
+    ``BATCH_SIZE`` ids, so a large log is never locked as a whole.
+    """
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if start is None:
+            cursor.execute("SELECT min(id) FROM api_endpointlog")
+            start = cursor.fetchone()[0]
+        cursor.execute("SELECT max(id) FROM api_endpointlog")
+        end = cursor.fetchone()[0]
+        if start is None or end is None:
+            return
+        for low in range(start, end + 1, BATCH_SIZE):
+            with transaction.atomic(using=connection.alias):
+                # Only new names are inserted, so no sequence values are
+                # burnt on conflicts in the small id range.
+                cursor.execute(
+                    "INSERT INTO api_endpoint (name) "
+                    "SELECT DISTINCT log.endpoint FROM api_endpointlog AS log "
+                    "WHERE log.id >= %s AND log.id < %s AND NOT EXISTS "
+                    "(SELECT 1 FROM api_endpoint AS e WHERE e.name = log.endpoint) "
+                    "ORDER BY log.endpoint ON CONFLICT (name) DO NOTHING",
+                    [low, low + BATCH_SIZE],
+                )
+                cursor.execute(
+                    "UPDATE api_endpointlog AS log SET endpoint_ref_id = e.id "
+                    "FROM api_endpoint AS e "
+                    "WHERE log.id >= %s AND log.id < %s "
+                    "AND log.endpoint_ref_id IS NULL AND e.name = log.endpoint",
+                    [low, low + BATCH_SIZE],
+                )
+
+
+def fill_endpoint_names(apps, schema_editor):
+    """Reverse: copy the names back into ``endpoint``, in batches."""
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT min(id), max(id) FROM api_endpointlog")
+        start, end = cursor.fetchone()
+        if start is None:
+            return
+        for low in range(start, end + 1, BATCH_SIZE):
+            with transaction.atomic(using=connection.alias):
+                cursor.execute(
+                    "UPDATE api_endpointlog AS log SET endpoint = e.name "
+                    "FROM api_endpoint AS e "
+                    "WHERE log.id >= %s AND log.id < %s AND e.id = log.endpoint_ref_id",
+                    [low, low + BATCH_SIZE],
+                )
+
+
+class Migration(migrations.Migration):
+    # Runs without locking the log for long and may be applied while the
+    # proxy keeps serving; see 0018 for the part that needs a maintenance
+    # window.  Not atomic, so every batch of the backfill commits on its own.
+    atomic = False
+
+    dependencies = [
+        ('api', '0016_endpointlog_created_brin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Endpoint',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        # A plain ADD CONSTRAINT would check every existing row while
+        # holding a lock that blocks inserts.  The column starts out empty,
+        # so the constraint is added NOT VALID (only new rows are checked)
+        # and validated in 0018; its index is built there too, concurrently.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='endpointlog',
+                    name='endpoint_ref',
+                    field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.endpoint'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        "ALTER TABLE api_endpointlog ADD COLUMN endpoint_ref_id smallint NULL",
+                        "ALTER TABLE api_endpointlog ADD CONSTRAINT api_endpointlog_endpoint_fk "
+                        "FOREIGN KEY (endpoint_ref_id) REFERENCES api_endpoint (id) "
+                        "DEFERRABLE INITIALLY DEFERRED NOT VALID",
+                    ],
+                    reverse_sql=["ALTER TABLE api_endpointlog DROP COLUMN endpoint_ref_id"],
+                ),
+            ],
+        ),
+        # Fill the dictionary from the logged names and point every row at
+        # its entry; 0018 then drops the name column.
+        migrations.RunPython(fill_endpoint_refs, fill_endpoint_names),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:05
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+fill_endpoint_refs = import_module("api.migrations.0017_endpoint").fill_endpoint_refs
+
+
+def fill_new_rows(apps, schema_editor):
+    """Rows logged by the old code since 0017 ran still lack their reference."""
+    with schema_editor.connection.cursor() as cursor:
+        # Walks the primary key backwards, past the new rows only.
+        cursor.execute(
+            "SELECT max(id) FROM api_endpointlog WHERE endpoint_ref_id IS NOT NULL"
+        )
+        last = cursor.fetchone()[0]
+    fill_endpoint_refs(apps, schema_editor, start=None if last is None else last + 1)
+
+
+class Migration(migrations.Migration):
+    # MAINTENANCE WINDOW: stop the old workers before applying this
+    # migration; it drops the column they write.  Changing ``status_code``
+    # to smallint rewrites the whole log table under an exclusive lock, so
+    # logging (and therefore every request) waits for roughly as long as
+    # copying the table takes.  Prune the log first (``manage.py
+    # prune_endpoint_logs``) to keep the window short.  Everything else here
+    # only scans the table without blocking writes or changes metadata.
+    atomic = False
+
+    dependencies = [
+        ('api', '0017_endpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_new_rows, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='endpointlog',
+                    name='endpoint',
+                ),
+                migrations.RenameField(
+                    model_name='endpointlog',
+                    old_name='endpoint_ref',
+                    new_name='endpoint',
+                ),
+                migrations.AlterField(
+                    model_name='endpointlog',
+                    name='endpoint',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='logs', to='api.endpoint'),
+                ),
+            ],
+            # VALIDATE CONSTRAINT scans the table without blocking inserts,
+            # and SET NOT NULL skips its own scan once a validated CHECK
+            # proves the column has no NULLs.
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        "ALTER TABLE api_endpointlog DROP COLUMN endpoint",
+                        "ALTER TABLE api_endpointlog RENAME COLUMN endpoint_ref_id TO endpoint_id",
+                        "CREATE INDEX CONCURRENTLY IF NOT EXISTS api_endpointlog_endpoint_id_idx "
+                        "ON api_endpointlog (endpoint_id)",
+                        "ALTER TABLE api_endpointlog VALIDATE CONSTRAINT api_endpointlog_endpoint_fk",
+                        "ALTER TABLE api_endpointlog ADD CONSTRAINT api_endpointlog_endpoint_not_null "
+                        "CHECK (endpoint_id IS NOT NULL) NOT VALID",
+                        "ALTER TABLE api_endpointlog VALIDATE CONSTRAINT api_endpointlog_endpoint_not_null",
+                        "ALTER TABLE api_endpointlog ALTER COLUMN endpoint_id SET NOT NULL",
+                        "ALTER TABLE api_endpointlog DROP CONSTRAINT api_endpointlog_endpoint_not_null",
+                    ],
+                    reverse_sql=[
+                        "ALTER TABLE api_endpointlog ALTER COLUMN endpoint_id DROP NOT NULL",
+                        "ALTER TABLE api_endpointlog RENAME COLUMN endpoint_id TO endpoint_ref_id",
+                        "ALTER TABLE api_endpointlog ADD COLUMN endpoint varchar(255) NOT NULL DEFAULT ''",
+                        "ALTER TABLE api_endpointlog ALTER COLUMN endpoint DROP DEFAULT",
+                    ],
+                ),
+            ],
+        ),
+        # ``success`` is derived from the status code now.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='endpointlog',
+                    name='success',
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql="ALTER TABLE api_endpointlog DROP COLUMN success",
+                    reverse_sql=[
+                        "ALTER TABLE api_endpointlog ADD COLUMN success boolean NULL",
+                        "UPDATE api_endpointlog SET success = status_code >= 200 AND status_code < 400",
+                        "ALTER TABLE api_endpointlog ALTER COLUMN success SET NOT NULL",
+                    ],
+                ),
+            ],
+        ),
+        # Rewrites the table, see above.
+        migrations.AlterField(
+            model_name='endpointlog',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_compact_endpointlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='domainsnapshot',
+            name='verified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        # Existing snapshots were last confirmed when they were stored.
+        migrations.RunSQL(
+            "UPDATE api_domainsnapshot SET verified_at = created_at",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_domainsnapshot_verified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SharedCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=250, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+                ('expires_at', models.FloatField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+    ]
@@ -1,8 +1,12 @@
 import uuid
 import hashlib
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import Group
 from django.core.exceptions import ValidationError
+from django.core.validators import RegexValidator
+from django.utils import timezone
 
 # Default length of generated API keys
 DEFAULT_API_KEY_LENGTH = len(uuid.uuid4().hex)
@@ -39,7 +43,37 @@ class Domain(models.Model):
         return self.name
 
 
-class APIKey(models.Model):
+# "<requests>/<period>" as understood by DRF throttles, e.g. "5000/day".
+validate_rate = RegexValidator(
+    r"^\d+/(s|sec|second|m|min|minute|h|hour|d|day)$",
+    'Enter a rate such as "5000/day" (per second, minute, hour or day).',
+)
+
+
+class QuotaFields(models.Model):
+    """
+    Request limits shared by ``APIKey`` and ``GroupQuota``.  An empty field
+    on a key falls back to its group's quota, then to the global default
+    (see ``api/throttling.py`` and ``api/quotas.py``).
+    """
+    rate_limit = models.CharField(
+        max_length=32, blank=True, validators=[validate_rate],
+        help_text='Requests per period, e.g. "5000/day".',
+    )
+    burst = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Requests allowed within HIBP_THROTTLE_BURST_WINDOW seconds.",
+    )
+    max_concurrent = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Upstream HIBP calls allowed at the same time.",
+    )
+
+    class Meta:
+        abstract = True
+
+
+class APIKey(QuotaFields):
     """
     Each API key:
       - Belongs to one Django Group.
@@ -144,6 +178,57 @@ class APIKey(models.Model):
         return new_key, raw_key
 
 
+class GroupQuota(QuotaFields):
+    """Default request limits for all API keys of ``group``."""
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        related_name='quota',
+    )
+
+    def __str__(self):
+        return f"Quota for {self.group}"
+
+
+class DomainRule(models.Model):
+    """
+    Authorizes an API key for ``domain`` and, with ``include_subdomains``,
+    every subdomain of it, whether or not it is in the Domain table yet.
+    Matched in memory by ``api/domain_index.py``.
+    """
+    api_key = models.ForeignKey(
+        APIKey,
+        on_delete=models.CASCADE,
+        related_name='domain_rules',
+    )
+    domain = models.CharField(max_length=255)
+    include_subdomains = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['api_key', 'domain'], name='unique_domain_rule_per_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"*.{self.domain}" if self.include_subdomains else self.domain
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+    def clean(self):
+        # Accept the "*.dtu.dk" spelling as "dtu.dk and its subdomains".
+        domain = self.domain.strip().lower().rstrip(".")
+        if domain.startswith("*."):
+            domain = domain[2:]
+            self.include_subdomains = True
+        if not domain or "*" in domain or "." not in domain:
+            raise ValidationError({"domain": "Enter a domain such as 'dtu.dk'."})
+        self.domain = domain
+
+
 
 # file: api/models.py
 
@@ -151,9 +236,14 @@ from django.db import models
 from django.core.exceptions import ValidationError
 from django.core.cache import cache
 
+from .tiered_cache import namespace
+
 class HIBPKey(models.Model):
     """
-    Model that allows only ONE record.
+    One HIBP subscription key.  All active keys form a pool that upstream
+    calls are spread over (see ``api/keypool.py``); each key has its own
+    rate budget and is taken out of rotation for a while after HIBP answers
+    401 or 429.
     """
     api_key = models.CharField(max_length=255, unique=True)
     description = models.CharField(
@@ -162,20 +252,23 @@ class HIBPKey(models.Model):
         null=True,
         help_text="Optional label or notes for this key."
     )
+    rpm = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Requests per minute of this key's subscription. "
+                  "Leave empty to use HIBP_RATE_LIMIT_RPM.",
+    )
+    is_active = models.BooleanField(default=True)
+    # Health as last seen by the proxy; informational, the pool keeps the
+    # live state in the cache.
+    last_error_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    unavailable_until = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.description or f"HIBP Key: {self.api_key[:6]}..."
 
     def clean(self):
-        """
-        Check if we're trying to create more than one HIBPKey record.
-        """
-        # If self.pk is None, it means we're creating a new record.
-        # If HIBPKey.objects.exists() is True, it means at least one record
-        # already exists. So we raise an error to block the save.
-        if not self.pk and HIBPKey.objects.exists():
-            raise ValidationError("Only one HIBPKey entry is allowed.")
         if self.api_key and len(self.api_key) < DEFAULT_API_KEY_LENGTH:
             raise ValidationError(
                 f"HIBP API key must be at least {DEFAULT_API_KEY_LENGTH} characters long."
@@ -187,15 +280,151 @@ class HIBPKey(models.Model):
         """
         self.full_clean()
         super().save(*args, **kwargs)
-        cache.delete("hibp_api_key")
+        namespace("hibp_keys").invalidate()
+        # Also put a fixed key straight back into rotation.
+        cache.delete(f"hibp_key_down:{self.pk}")
 
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
-        cache.delete("hibp_api_key")
+        namespace("hibp_keys").invalidate()
+
+
+class Breach(models.Model):
+    """
+    Local mirror of one breach from HIBP's ``/breaches`` catalog, kept up to
+    date by the ``sync_breach_catalog`` management command.
+
+    ``raw`` holds the breach object exactly as it is served to clients; the
+    other columns are copies of its fields used for filtering and indexing.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    title = models.CharField(max_length=255, blank=True)
+    domain = models.CharField(max_length=255, blank=True, db_index=True)
+    breach_date = models.DateField(null=True, blank=True)
+    added_date = models.DateTimeField(null=True, blank=True)
+    modified_date = models.DateTimeField(null=True, blank=True)
+    pwn_count = models.BigIntegerField(default=0)
+    is_verified = models.BooleanField(default=True)
+    is_spam_list = models.BooleanField(default=False)
+    # Position in the upstream ``/breaches`` response, to keep its ordering.
+    position = models.PositiveIntegerField(default=0)
+    raw = models.TextField()
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["position"]
+
+    def __str__(self):
+        return self.name
+
+
+class DataClass(models.Model):
+    """Local mirror of one entry from HIBP's ``/dataclasses`` list."""
+    name = models.CharField(max_length=255, unique=True)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["position"]
+
+    def __str__(self):
+        return self.name
+
+
+class DomainSnapshot(models.Model):
+    """
+    One stored ``breacheddomain/{domain}`` response, written by the
+    ``sync_domain_snapshots`` management command.
+
+    ``content`` is the upstream body compressed with gzip; ``pwn_count`` is
+    the domain's ``pwn_count`` when the snapshot was taken, so a new
+    snapshot is only fetched once that number changes.  ``verified_at`` is
+    the last time a sync found the snapshot still current; its age, not that
+    of ``created_at``, decides whether the snapshot may be served.
+    """
+    domain = models.ForeignKey(
+        Domain,
+        on_delete=models.CASCADE,
+        related_name="snapshots",
+    )
+    version = models.PositiveIntegerField()
+    pwn_count = models.IntegerField(null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(default=200)
+    content = models.BinaryField()
+    # Uncompressed size of the body in bytes.
+    size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    verified_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["domain", "-version"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["domain", "version"], name="unique_domain_snapshot_version"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.domain} v{self.version}"
+
+
+class DomainBreachEntry(models.Model):
+    """
+    One alias/breach pair from a domain's snapshots, present from snapshot
+    version ``added_in`` until (excluding) ``removed_in``.
+
+    The rows are maintained by ``api.snapshots.store_snapshot`` and let the
+    ``breacheddomain/{domain}/changes`` endpoint compute what changed since
+    a version with two indexed range queries instead of diffing snapshots.
+    The open rows double as a reverse index for ``breachedaccount``
+    lookups.  Aliases are stored lower-cased.
+    """
+    domain = models.ForeignKey(
+        Domain,
+        on_delete=models.CASCADE,
+        related_name="breach_entries",
+    )
+    alias = models.CharField(max_length=255)
+    breach = models.CharField(max_length=255)
+    added_in = models.PositiveIntegerField()
+    removed_in = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["domain", "added_in"], name="breach_entry_added_idx"),
+            models.Index(fields=["domain", "removed_in"], name="breach_entry_removed_idx"),
+            # Reverse index for account lookups: current breaches of alias@domain.
+            models.Index(
+                fields=["domain", "alias"],
+                condition=models.Q(removed_in__isnull=True),
+                name="breach_entry_current_alias_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.alias}@{self.domain}: {self.breach}"
+
+
+class Endpoint(models.Model):
+    """
+    Dictionary of the endpoint (URL) names in ``EndpointLog``, so each log
+    row stores a two-byte id instead of the name.  Rows are added by the log
+    writer as new names show up and are never deleted.
+    """
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.name
 
 
 class EndpointLog(models.Model):
-    """Record which API key accessed which endpoint and whether it succeeded."""
+    """
+    Record which API key accessed which endpoint and whether it succeeded.
+
+    Rows are kept narrow because one is written per proxied request: the
+    endpoint is a small-int reference to ``Endpoint`` and ``success`` is
+    derived from ``status_code``.
+    """
 
     api_key = models.ForeignKey(
         APIKey,
@@ -211,10 +440,120 @@ class EndpointLog(models.Model):
         blank=True,
         related_name="endpoint_logs",
     )
-    endpoint = models.CharField(max_length=255)
-    status_code = models.IntegerField()
-    success = models.BooleanField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    endpoint = models.ForeignKey(Endpoint, on_delete=models.PROTECT, related_name="logs")
+    status_code = models.PositiveSmallIntegerField()
+    # Timings and cache outcome (see api/request_stats.py); empty for rows
+    # logged before they were recorded and for the items of bulk requests.
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+    upstream_ms = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Time spent calling HIBP, if it was called."
+    )
+    upstream_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_bytes = models.PositiveIntegerField(null=True, blank=True)
+    cache_status = models.CharField(max_length=8, blank=True, default="")
+    # Set when the request is logged, not when the buffered row is written
+    # (see api/log_writer.py).
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # Rows arrive in time order, so a BRIN index of a few pages
+            # serves time-range reports and retention pruning
+            # (``manage.py prune_endpoint_logs``) on a table of any size.
+            BrinIndex(fields=["created_at"], name="endpoint_log_created_brin"),
+        ]
+
+    @property
+    def success(self) -> bool:
+        return 200 <= self.status_code < 400
 
     def __str__(self):
         return f"{self.group}: {self.endpoint} -> {self.status_code}"
+
+
+class EndpointUsage(models.Model):
+    """
+    Hourly request counts per group, API key, endpoint and status class
+    (2 for 2xx, 4 for 4xx, ...).
+
+    The rows are incremented by ``api.usage.add_usage`` in the same
+    transaction that writes the ``EndpointLog`` rows, so usage reports and
+    the usage API read a few rows per hour instead of the raw log.  The key
+    and group columns are not foreign key constraints: counts of deleted
+    keys are kept.
+    """
+    hour = models.DateTimeField()
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="endpoint_usage",
+    )
+    api_key = models.ForeignKey(
+        APIKey,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="endpoint_usage",
+    )
+    endpoint = models.CharField(max_length=255)
+    status_class = models.PositiveSmallIntegerField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "endpoint usage"
+        constraints = [
+            # Target of the ON CONFLICT upsert; anonymous requests have no
+            # key or group, which COALESCE makes comparable.
+            models.UniqueConstraint(
+                "hour",
+                Coalesce("group", 0),
+                Coalesce("api_key", 0),
+                "endpoint",
+                "status_class",
+                name="endpoint_usage_unique",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["api_key", "hour"], name="endpoint_usage_key_idx"),
+            models.Index(fields=["group", "hour"], name="endpoint_usage_group_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.endpoint} {self.status_class}xx: {self.count}"
+
+
+class UpstreamRateBucket(models.Model):
+    """
+    Shared GCRA state for the upstream HIBP rate governor.
+
+    ``tat`` is the "theoretical arrival time" (epoch seconds) of the next
+    free upstream slot.  All workers on all nodes reserve slots by updating
+    this row atomically, see ``api/governor.py``.
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    tat = models.FloatField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class SharedCounter(models.Model):
+    """
+    Atomic counter shared by all workers (throttle windows, concurrency
+    slots, cache namespace versions), see ``api/counters.py``.
+
+    ``expires_at`` is in epoch seconds; NULL never expires.  An expired
+    counter starts over on its next increment.
+    """
+
+    name = models.CharField(max_length=250, unique=True)
+    value = models.BigIntegerField(default=0)
+    expires_at = models.FloatField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
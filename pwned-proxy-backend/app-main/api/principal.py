@@ -0,0 +1,126 @@
+# api/principal.py
+"""
+Cached authorization principals for API keys.
+
+Authenticating a request used to cost one query for the ``APIKey`` row and
+each view ran another one to check ``api_key.domains``.  Instead, an
+``AuthPrincipal`` per key hash is kept in the ``auth_principal`` namespace
+of the two-level cache (``api/tiered_cache.py``) for ``HIBP_AUTH_CACHE_TTL``
+seconds, holding the key and group ids, the key's domains and domain rules
+compiled into a ``DomainIndex`` and its effective ``Limits``, so a request
+normally needs no query before the upstream call.
+
+Changes to keys, their domains and rules, group quotas or domains (see
+``api/signals.py``) invalidate the namespace on every worker.
+"""
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .domain_index import DomainIndex
+from .models import APIKey, Domain, DomainRule
+from .tiered_cache import namespace
+
+
+@dataclass(frozen=True)
+class Limits:
+    """Quota of a key after falling back to its group's; None means the default."""
+
+    rate: str | None = None
+    burst: int | None = None
+    max_concurrent: int | None = None
+
+
+@dataclass(frozen=True)
+class AuthPrincipal:
+    """What the views need to know about an authenticated API key."""
+
+    api_key_id: int
+    group_id: int
+    name: str
+    key_hash: str
+    domains: DomainIndex
+    limits: Limits = Limits()
+
+    def allows(self, domain: str) -> bool:
+        """Whether this key may query ``domain`` (case-insensitive)."""
+        return domain in self.domains
+
+
+principals = namespace("auth_principal")
+
+
+def load_principal(key_hash: str) -> AuthPrincipal | None:
+    row = APIKey.objects.filter(key=key_hash).values_list(
+        "pk", "group_id", "name",
+        "rate_limit", "burst", "max_concurrent",
+        "group__quota__rate_limit", "group__quota__burst", "group__quota__max_concurrent",
+    ).first()
+    if row is None:
+        return None
+    api_key_id, group_id, name = row[:3]
+    key_limits, group_limits = row[3:6], row[6:]
+    exact = list(Domain.objects.filter(apikey=api_key_id).values_list("name", flat=True))
+    subtrees = []
+    for domain, include_subdomains in DomainRule.objects.filter(
+        api_key=api_key_id
+    ).values_list("domain", "include_subdomains"):
+        (subtrees if include_subdomains else exact).append(domain)
+    return AuthPrincipal(
+        api_key_id=api_key_id,
+        group_id=group_id,
+        name=name,
+        key_hash=key_hash,
+        domains=DomainIndex.compile(exact, subtrees),
+        limits=merge_limits(key_limits, group_limits),
+    )
+
+
+def merge_limits(key_limits, group_limits) -> Limits:
+    """Build ``Limits`` from a key's fields, taking empty ones from its group."""
+    return Limits(*(
+        own if own not in (None, "") else (group or None)
+        for own, group in zip(key_limits, group_limits)
+    ))
+
+
+def get_principal(key_hash: str) -> AuthPrincipal | None:
+    """
+    Return the principal of ``key_hash``, or None for an unknown key.
+    Unknown keys are cached too, so guessing keys does not reach the DB.
+    """
+    cached = principals.get(key_hash)
+    if cached is not None:
+        return cached[0]
+    principal = load_principal(key_hash)
+    _remember(key_hash, principal)
+    return principal
+
+
+async def aget_principal(key_hash: str) -> AuthPrincipal | None:
+    """Async counterpart of ``get_principal``."""
+    cached = await principals.aget(key_hash)
+    if cached is not None:
+        return cached[0]
+    principal = await sync_to_async(load_principal)(key_hash)
+    if principal is None:
+        _remember(key_hash, principal)
+    else:
+        await principals.aset(key_hash, (principal,), settings.HIBP_AUTH_CACHE_TTL)
+    return principal
+
+
+def invalidate_principals() -> None:
+    """Forget all cached principals, on every worker."""
+    principals.invalidate()
+
+
+def _remember(key_hash: str, principal) -> None:
+    # Values are wrapped so a cached "unknown key" differs from a miss.
+    # Unknown keys stay in this worker's L1 so guessing keys does not fill
+    # the shared cache.
+    if principal is None:
+        principals.set_local(key_hash, (None,), settings.HIBP_AUTH_CACHE_TTL)
+    else:
+        principals.set(key_hash, (principal,), settings.HIBP_AUTH_CACHE_TTL)
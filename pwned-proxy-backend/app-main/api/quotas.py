@@ -0,0 +1,93 @@
+# api/quotas.py
+"""
+Per API key limit on concurrent upstream calls.
+
+The views bind the authenticated ``AuthPrincipal`` to the current context
+with ``acting_as``; ``hibp_get`` / ``ahibp_get`` then hold an
+``upstream_slot`` around every call that may reach HIBP (a streamed body
+until it has been sent, see ``views.UpstreamBody``).  Slots are counted
+per key in a shared counter (``api/counters.py``), so the key's
+``max_concurrent`` holds across workers, and a call over the limit fails
+fast with 429 instead of queueing behind the rate governor.
+
+Counters expire after ``HIBP_CONCURRENCY_SLOT_TTL`` seconds so a worker that
+dies while holding slots cannot block a key for good.
+"""
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import counters
+
+_principal = contextvars.ContextVar("quota_principal", default=None)
+
+
+class TooManyConcurrentCalls(APIException):
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    default_detail = "Too many concurrent requests for this API key, try again shortly."
+    default_code = "too_many_concurrent_calls"
+
+    def __init__(self):
+        super().__init__()
+        self.wait = 1
+
+
+def bind(principal) -> contextvars.Token:
+    return _principal.set(principal)
+
+
+def unbind(token: contextvars.Token) -> None:
+    _principal.reset(token)
+
+
+@contextmanager
+def acting_as(principal):
+    """Bind ``principal`` for the upstream calls made inside the block."""
+    token = bind(principal)
+    try:
+        yield
+    finally:
+        unbind(token)
+
+
+def _slot(principal) -> tuple[str | None, int | None]:
+    limits = getattr(principal, "limits", None)
+    limit = limits.max_concurrent if limits is not None else None
+    if not limit:
+        return None, None
+    return f"concurrency_apikey_{principal.api_key_id}", limit
+
+
+@contextmanager
+def upstream_slot():
+    """Hold one of the bound key's concurrent upstream call slots."""
+    name, limit = _slot(_principal.get())
+    if name is None:
+        yield
+        return
+    count = counters.incr(name, settings.HIBP_CONCURRENCY_SLOT_TTL)
+    try:
+        if count > limit:
+            raise TooManyConcurrentCalls()
+        yield
+    finally:
+        counters.decr(name)
+
+
+@asynccontextmanager
+async def aupstream_slot():
+    """Async counterpart of ``upstream_slot``."""
+    name, limit = _slot(_principal.get())
+    if name is None:
+        yield
+        return
+    count = await counters.aincr(name, settings.HIBP_CONCURRENCY_SLOT_TTL)
+    try:
+        if count > limit:
+            raise TooManyConcurrentCalls()
+        yield
+    finally:
+        await counters.adecr(name)
@@ -0,0 +1,80 @@
+# api/request_stats.py
+"""
+Per request timings recorded on ``EndpointLog``.
+
+The views ``bind`` a fresh ``RequestStats`` to the current context when a
+request starts; ``hibp_get`` / ``ahibp_get`` add the time they take (rate
+governor, coalescing and circuit breaker included) and the upstream status
+with ``timed_upstream``.  When the request is logged, ``log_details``
+turns the stats and the response into the extra ``EndpointLog`` fields.
+Streamed upstream bodies are timed and logged once they have been sent, so
+their times include the transfer.
+
+Lookups run on the worker threads of a bulk request are not bound and are
+logged without timings.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+
+@dataclass
+class RequestStats:
+    started: float = field(default_factory=time.perf_counter)
+    upstream_seconds: float = 0.0
+    upstream_calls: int = 0
+    upstream_status: int | None = None
+
+
+_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def bind() -> contextvars.Token:
+    return _stats.set(RequestStats())
+
+
+def unbind(token: contextvars.Token) -> None:
+    _stats.reset(token)
+
+
+def current() -> RequestStats | None:
+    return _stats.get()
+
+
+@contextmanager
+def timed_upstream():
+    """
+    Time the block as upstream time of the current request.  Yields the
+    request's stats (or a throwaway one) so the caller can set
+    ``upstream_status``.
+    """
+    stats = _stats.get() or RequestStats()
+    started = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.upstream_seconds += time.perf_counter() - started
+        stats.upstream_calls += 1
+
+
+def _ms(seconds: float) -> int:
+    return round(seconds * 1000)
+
+
+def log_details(stats: RequestStats | None, response) -> dict:
+    """Keyword arguments for ``make_log`` describing ``response``."""
+    if getattr(response, "streaming", False):
+        response_bytes = None
+    else:
+        response_bytes = len(response.content)
+    details = {
+        "response_bytes": response_bytes,
+        "cache_status": response.get("X-Cache", ""),
+    }
+    if stats is not None:
+        details["duration_ms"] = _ms(time.perf_counter() - stats.started)
+        if stats.upstream_calls:
+            details["upstream_ms"] = _ms(stats.upstream_seconds)
+            details["upstream_status"] = stats.upstream_status
+    return details
@@ -0,0 +1,61 @@
+# api/retention.py
+"""
+Retention of ``EndpointLog`` rows and ``EndpointUsage`` rollups.
+
+Old rows are deleted in chunks of ``HIBP_RETENTION_CHUNK_SIZE``, each in
+its own short transaction, so pruning a large backlog never holds long
+locks or one huge transaction while requests keep being logged.  The
+chunks are found through the BRIN index on ``EndpointLog.created_at``.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import EndpointLog, EndpointUsage
+
+
+def cutoff(days: int):
+    """Start of the retained period, or None when ``days`` is 0 (keep all)."""
+    if days <= 0:
+        return None
+    return timezone.now() - timedelta(days=days)
+
+
+def delete_in_chunks(queryset, chunk_size: int, pause: float = 0, max_chunks: int = 0) -> int:
+    """
+    Delete the rows of ``queryset`` ``chunk_size`` at a time, sleeping
+    ``pause`` seconds between chunks.  Returns the number of rows deleted.
+    """
+    deleted = 0
+    chunks = 0
+    while True:
+        chunk = queryset.values("pk")[:chunk_size]
+        count, _ = queryset.model.objects.filter(pk__in=chunk).delete()
+        deleted += count
+        chunks += 1
+        if count < chunk_size or (max_chunks and chunks >= max_chunks):
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def prune(log_days: int, usage_days: int, chunk_size: int | None = None,
+          pause: float = 0, max_chunks: int = 0) -> dict:
+    """Delete logs older than ``log_days`` and rollups older than ``usage_days``."""
+    chunk_size = chunk_size or settings.HIBP_RETENTION_CHUNK_SIZE
+    deleted = {"logs": 0, "usage": 0}
+    log_cutoff = cutoff(log_days)
+    if log_cutoff is not None:
+        deleted["logs"] = delete_in_chunks(
+            EndpointLog.objects.filter(created_at__lt=log_cutoff),
+            chunk_size, pause, max_chunks,
+        )
+    usage_cutoff = cutoff(usage_days)
+    if usage_cutoff is not None:
+        deleted["usage"] = delete_in_chunks(
+            EndpointUsage.objects.filter(hour__lt=usage_cutoff),
+            chunk_size, pause, max_chunks,
+        )
+    return deleted
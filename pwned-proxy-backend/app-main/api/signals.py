@@ -0,0 +1,42 @@
+# api/signals.py
+"""
+Signal handlers that keep the cached authorization principals
+(``api/principal.py``) in line with the database.  Connected in
+``ApiConfig.ready``.
+
+The cache is invalidated once the change is committed: invalidating
+earlier lets another worker reload and cache the old rows before the
+transaction commits.
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import APIKey, Domain, DomainRule, GroupQuota
+from .principal import invalidate_principals
+
+
+@receiver(post_save, sender=APIKey)
+@receiver(post_delete, sender=APIKey)
+@receiver(post_delete, sender=Domain)
+@receiver(post_save, sender=DomainRule)
+@receiver(post_delete, sender=DomainRule)
+@receiver(post_save, sender=GroupQuota)
+@receiver(post_delete, sender=GroupQuota)
+def api_key_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_principals)
+
+
+@receiver(post_save, sender=Domain)
+def domain_saved(sender, created, update_fields=None, **kwargs):
+    # Only a rename changes what keys may query; imports that update the
+    # counts of existing domains (``update_fields`` without the name) and new,
+    # not yet linked domains do not.
+    if not created and (update_fields is None or "name" in update_fields):
+        transaction.on_commit(invalidate_principals)
+
+
+@receiver(m2m_changed, sender=APIKey.domains.through)
+def api_key_domains_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        transaction.on_commit(invalidate_principals)
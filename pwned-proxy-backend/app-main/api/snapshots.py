@@ -0,0 +1,290 @@
+# api/snapshots.py
+"""
+Locally stored ``breacheddomain`` responses.
+
+``sync_domain_snapshots`` downloads ``breacheddomain/{domain}`` for every
+``Domain`` row and stores the body gzip-compressed as a new
+``DomainSnapshot`` version, but only when the domain's ``pwn_count`` changed
+since the previous snapshot.  ``BreachedDomainProxyView`` serves the latest
+snapshot with its age instead of asking HIBP for the full domain search.
+
+Decompressed bodies are kept in a per-worker LRU keyed by snapshot id, so a
+repeated read costs one indexed query for the latest version.
+
+Every stored snapshot also updates the ``DomainBreachEntry`` rows of its
+domain: each alias/breach pair records the version it appeared in and the
+version it disappeared in.  ``domain_changes`` answers "what changed since
+version N" from those rows without decompressing any snapshot, and
+``indexed_account_get`` answers ``breachedaccount`` for addresses on those
+domains without asking HIBP.
+"""
+import gzip
+import json
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ParseError
+
+from .caching import HIT, CachedResponse, LRUByteCache
+from .catalog import JSON_CONTENT_TYPE, parse_bool
+from .models import DomainBreachEntry, DomainSnapshot
+
+
+class CursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = "The cursor is older than the stored history; fetch the full domain again."
+    default_code = "cursor_expired"
+
+
+def compress(body: bytes) -> bytes:
+    # mtime=0 keeps identical bodies byte-identical once compressed.
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def decompress(content) -> bytes:
+    # BinaryField values come back as memoryview on PostgreSQL.
+    return gzip.decompress(bytes(content))
+
+
+_bodies = None
+_bodies_lock = threading.Lock()
+
+
+def get_body_cache() -> LRUByteCache:
+    global _bodies
+    if _bodies is None:
+        with _bodies_lock:
+            if _bodies is None:
+                _bodies = LRUByteCache(settings.HIBP_DOMAIN_SNAPSHOT_CACHE_MAX_BYTES)
+    return _bodies
+
+
+def latest_snapshot(domain_name: str) -> CachedResponse | None:
+    """
+    Return the latest stored snapshot of ``domain_name`` as a response, or
+    None when there is none verified within ``HIBP_DOMAIN_SNAPSHOT_MAX_AGE``.
+    """
+    row = _latest_row(domain_name)
+    if row is None:
+        return None
+    snapshot_id, status_code, verified_at = row
+
+    cache = get_body_cache()
+    entry = cache.get(snapshot_id)
+    if entry is None:
+        entry = {"content": decompress(_load_content(snapshot_id))}
+        # Snapshots never change, the TTL only bounds how long an old
+        # version lingers in memory.
+        cache.set(snapshot_id, entry, settings.HIBP_DOMAIN_SNAPSHOT_MAX_AGE or 24 * 60 * 60)
+
+    age = max(0, int((timezone.now() - verified_at).total_seconds()))
+    return CachedResponse(
+        status_code, entry["content"], {"Content-Type": JSON_CONTENT_TYPE}, HIT, age
+    )
+
+
+def _latest_row(domain_name: str, fields=("pk", "status_code", "verified_at")):
+    row = (
+        # Domain names are case-insensitive, like the key's domain check.
+        DomainSnapshot.objects.filter(domain__name__iexact=domain_name)
+        .order_by("-version")
+        .values_list("verified_at", *fields)
+        .first()
+    )
+    if row is None:
+        return None
+    max_age = settings.HIBP_DOMAIN_SNAPSHOT_MAX_AGE
+    # Only the latest version counts: an older one is known to be outdated.
+    if max_age and row[0] < timezone.now() - timedelta(seconds=max_age):
+        return None
+    return row[1:]
+
+
+def mark_verified(snapshot_ids) -> int:
+    """Record that the sync found these (latest) snapshots still current."""
+    return DomainSnapshot.objects.filter(pk__in=snapshot_ids).update(verified_at=timezone.now())
+
+
+def indexed_account_get(account: str, query: dict, catalog) -> CachedResponse | None:
+    """
+    Answer a ``breachedaccount`` lookup for an address on a snapshotted
+    domain from the ``DomainBreachEntry`` reverse index, expanded with the
+    local breach catalog.  Returns None, so the caller asks HIBP, when the
+    domain has no current snapshot or a breach is missing from the catalog.
+    """
+    if catalog is None:
+        return None
+    try:
+        alias, domain_name = account.rsplit("@", 1)
+    except ValueError:
+        return None
+    row = _latest_row(domain_name, fields=("domain_id", "verified_at"))
+    if row is None:
+        return None
+    domain_id, verified_at = row
+
+    names = DomainBreachEntry.objects.filter(
+        domain_id=domain_id, alias=alias.lower(), removed_in__isnull=True
+    ).values_list("breach", flat=True)
+    body = catalog.account_breaches(
+        names,
+        truncate=parse_bool(query.get("truncateResponse")) is not False,
+        include_unverified=parse_bool(query.get("includeUnverified")) is not False,
+    )
+    if body is None:
+        return None
+
+    age = max(0, int((timezone.now() - verified_at).total_seconds()))
+    if body == b"[]":
+        # HIBP answers 404 with an empty body for an unbreached account.
+        return CachedResponse(404, b"", {"Content-Type": JSON_CONTENT_TYPE}, HIT, age)
+    return CachedResponse(200, body, {"Content-Type": JSON_CONTENT_TYPE}, HIT, age)
+
+
+def _load_content(snapshot_id: int):
+    return DomainSnapshot.objects.values_list("content", flat=True).get(pk=snapshot_id)
+
+
+def store_snapshot(domain, status_code: int, body: bytes, keep: int) -> DomainSnapshot:
+    """
+    Store ``body`` as the next snapshot version of ``domain`` and delete all
+    but the ``keep`` most recent versions.
+    """
+    with transaction.atomic():
+        latest = domain.snapshots.order_by("-version").values_list("version", flat=True).first()
+        snapshot = DomainSnapshot.objects.create(
+            domain=domain,
+            version=(latest or 0) + 1,
+            pwn_count=domain.pwn_count,
+            status_code=status_code,
+            content=compress(body),
+            size=len(body),
+        )
+        index_snapshot(domain, snapshot.version, body if status_code == 200 else b"{}")
+
+        stale = list(
+            domain.snapshots.order_by("-version").values_list("pk", flat=True)[max(keep, 1):]
+        )
+        if stale:
+            DomainSnapshot.objects.filter(pk__in=stale).delete()
+            # Pairs removed before the oldest kept version can no longer be
+            # reported, see ``domain_changes``.
+            oldest = domain.snapshots.order_by("version").values_list("version", flat=True).first()
+            domain.breach_entries.filter(removed_in__lte=oldest).delete()
+    return snapshot
+
+
+def entry_pairs(body: bytes) -> set[tuple[str, str]]:
+    """
+    Return the ``(alias, breach)`` pairs of a ``breacheddomain`` body, with
+    aliases lower-cased.
+    """
+    return {
+        (alias.lower(), breach)
+        for alias, breaches in json.loads(body or b"{}").items()
+        for breach in breaches
+    }
+
+
+def index_snapshot(domain, version: int, body: bytes) -> tuple[int, int]:
+    """
+    Bring ``domain``'s ``DomainBreachEntry`` rows in line with snapshot
+    ``version``: open rows for new pairs and close rows for pairs that are
+    gone.  Returns the number of added and removed pairs.
+    """
+    pairs = entry_pairs(body)
+    current = {
+        (alias, breach): pk
+        for pk, alias, breach in domain.breach_entries.filter(
+            removed_in__isnull=True
+        ).values_list("pk", "alias", "breach")
+    }
+    added = pairs - current.keys()
+    DomainBreachEntry.objects.bulk_create(
+        (
+            DomainBreachEntry(domain=domain, alias=alias, breach=breach, added_in=version)
+            for alias, breach in added
+        ),
+        batch_size=1000,
+    )
+    removed = [pk for pair, pk in current.items() if pair not in pairs]
+    for start in range(0, len(removed), 1000):
+        DomainBreachEntry.objects.filter(pk__in=removed[start:start + 1000]).update(
+            removed_in=version
+        )
+    return len(added), len(removed)
+
+
+def resolve_cursor(domain, cursor: str | None, oldest: int = 1) -> int:
+    """
+    Turn a ``since`` cursor into a snapshot version.  A number is taken as a
+    version; an ISO 8601 timestamp selects the latest version stored at or
+    before that time.  No cursor means "from the beginning" (0).  A
+    timestamp before the ``oldest`` stored version is only "the beginning"
+    while no version has been pruned yet.
+    """
+    if cursor is None or cursor == "":
+        return 0
+    if cursor.isdigit():
+        return int(cursor)
+    when = parse_datetime(cursor)
+    if when is None:
+        raise ParseError("'since' must be a snapshot version or an ISO 8601 timestamp.")
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    version = (
+        domain.snapshots.filter(created_at__lte=when)
+        .order_by("-version")
+        .values_list("version", flat=True)
+        .first()
+    )
+    if version is None and oldest > 1:
+        raise CursorExpired()
+    return version or 0
+
+
+def domain_changes(domain, cursor: str | None) -> dict:
+    """
+    Return the aliases and breaches added to or removed from ``domain``
+    since the snapshot version given by ``cursor``.  ``Version`` in the
+    result is the cursor for the next poll.
+    """
+    versions = domain.snapshots.order_by("version").values_list("version", flat=True)
+    oldest, latest = versions.first(), versions.last()
+    if latest is None:
+        raise NotFound(f"No snapshots stored for '{domain.name}'.")
+
+    since = resolve_cursor(domain, cursor, oldest)
+    if since > latest:
+        raise ParseError(f"'since' is newer than the latest version ({latest}).")
+    if 0 < since < oldest:
+        raise CursorExpired()
+
+    added = set(domain.breach_entries.filter(
+        added_in__gt=since, removed_in__isnull=True
+    ).values_list("alias", "breach"))
+    removed = set(domain.breach_entries.filter(
+        added_in__lte=since, removed_in__gt=since
+    ).values_list("alias", "breach"))
+    # A pair that was removed and later re-added did not change.
+    unchanged = added & removed
+
+    return {
+        "Domain": domain.name,
+        "Since": since,
+        "Version": latest,
+        "Added": _group(added - unchanged),
+        "Removed": _group(removed - unchanged),
+    }
+
+
+def _group(pairs) -> dict[str, list[str]]:
+    grouped = {}
+    for alias, breach in sorted(pairs):
+        grouped.setdefault(alias, []).append(breach)
+    return grouped
@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from django.urls import resolve, reverse
+
+from api import async_views, views
+
+
+class FakeResponse:
+    status_code = 200
+    content = b'["Email addresses","Passwords"]'
+    headers = {"Content-Type": "application/json; charset=utf-8"}
+
+
+@override_settings(ROOT_URLCONF="api.tests.async_urlconf")
+class AsyncViewsTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_routes_use_async_counterparts(self):
+        for name, kwargs, view in [
+            ("breached-domain", {"domain": "dtu.dk"}, async_views.BreachedDomainProxyView),
+            ("breached-account", {"account": "user@dtu.dk"}, async_views.BreachedAccountProxyView),
+            ("breached-accounts", {}, async_views.BulkBreachedAccountProxyView),
+            ("data-classes", {}, async_views.DataClassesProxyView),
+        ]:
+            with self.subTest(name=name):
+                url = reverse(name, kwargs=kwargs)
+                self.assertEqual(resolve(url).func.view_class, view)
+                self.assertIsNot(view, getattr(views, view.__name__))
+
+    @override_settings(HIBP_HEALTH_ALLOWED_NETWORKS=["10.0.0.0/8"])
+    async def test_upstream_health_is_internal(self):
+        with mock.patch.object(async_views.AsyncLoggedView, "log", new=mock.AsyncMock()):
+            refused = await AsyncClient(client=["203.0.113.5", 0]).get("/api/v3/upstream/health")
+            allowed = await AsyncClient(client=["10.1.2.3", 0]).get("/api/v3/upstream/health")
+        self.assertEqual(refused.status_code, 403)
+        self.assertEqual(allowed.status_code, 200)
+        self.assertIn("log_writer", allowed.json())
+
+    async def test_catalog_body_is_passed_through(self):
+        with mock.patch("api.async_views.ahibp_get", new=mock.AsyncMock(return_value=FakeResponse())), \
+                mock.patch("api.async_views.get_catalog", return_value=None), \
+                mock.patch.object(async_views.AsyncLoggedView, "log", new=mock.AsyncMock()):
+            resp = await AsyncClient().get("/api/v3/dataclasses")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, FakeResponse.content)
+        self.assertEqual(resp["X-Cache"], "MISS")
+
+    async def test_domain_endpoint_requires_api_key(self):
+        with mock.patch.object(async_views.AsyncLoggedView, "log", new=mock.AsyncMock()):
+            resp = await AsyncClient().get("/api/v3/breacheddomain/dtu.dk")
+        self.assertEqual(resp.status_code, 401)
+
+    async def test_bulk_endpoint_requires_api_key(self):
+        with mock.patch.object(async_views.AsyncLoggedView, "log", new=mock.AsyncMock()):
+            resp = await AsyncClient().post(
+                "/api/v3/breachedaccounts", {"accounts": ["a@dtu.dk"]},
+                content_type="application/json",
+            )
+        self.assertEqual(resp.status_code, 401)
+
+    async def test_unexpected_errors_are_logged_as_500(self):
+        log = mock.AsyncMock()
+        with mock.patch.object(
+            async_views.DataClassesProxyView, "get", new=mock.AsyncMock(side_effect=RuntimeError)
+        ), mock.patch.object(async_views.AsyncLoggedView, "log", new=log):
+            with self.assertRaises(RuntimeError):
+                await AsyncClient(raise_request_exception=True).get("/api/v3/dataclasses")
+        log.assert_awaited_once()
+        self.assertEqual(log.await_args.args[1].status_code, 500)
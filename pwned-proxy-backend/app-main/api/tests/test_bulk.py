@@ -0,0 +1,121 @@
+import json
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from rest_framework.exceptions import ParseError
+
+from api import bulk
+from api.domain_index import DomainIndex
+from api.principal import AuthPrincipal
+from api.upstream import UpstreamTimeout
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+
+
+class ParseBatchTest(SimpleTestCase):
+    def test_deduplicates_and_normalizes_flags(self):
+        accounts, query = bulk.parse_batch({
+            "accounts": ["A@dtu.dk", "a@DTU.dk", " b@dtu.dk "],
+            "truncateResponse": False,
+            "includeUnverified": "true",
+        })
+        self.assertEqual(accounts, ["A@dtu.dk", "b@dtu.dk"])
+        self.assertEqual(query, {"truncateResponse": "false", "includeUnverified": "true"})
+
+    @override_settings(HIBP_BULK_MAX_ACCOUNTS=2)
+    def test_rejects_malformed_or_oversized_batches(self):
+        for data in [None, {}, {"accounts": []}, {"accounts": [1]}, {"accounts": ["a", "b", "c"]}]:
+            with self.subTest(data=data), self.assertRaises(ParseError):
+                bulk.parse_batch(data)
+
+    def test_partition_by_authorized_domains(self):
+        authorized, rejected = bulk.partition(
+            ["a@dtu.dk", "b@DTU.DK", "c@example.com", "not-an-email", "ø@dtu.dk"],
+            {"dtu.dk"},
+        )
+        self.assertEqual(authorized, ["a@dtu.dk", "b@DTU.DK"])
+        self.assertEqual([(a, s) for a, s, _ in rejected], [
+            ("c@example.com", 403), ("not-an-email", 400), ("ø@dtu.dk", 400),
+        ])
+
+
+class LinesTest(SimpleTestCase):
+    def test_result_lines_embed_upstream_body(self):
+        line = bulk.result_line("a@dtu.dk", FakeResponse(200, b'[{"Name":"Adobe"}]'))
+        self.assertEqual(
+            json.loads(line),
+            {"account": "a@dtu.dk", "status": 200, "breaches": [{"Name": "Adobe"}]},
+        )
+        self.assertTrue(line.endswith(b"}\n"))
+        self.assertEqual(json.loads(bulk.result_line("a@dtu.dk", FakeResponse(404)))["breaches"], [])
+        self.assertEqual(json.loads(bulk.result_line("a@dtu.dk", FakeResponse(503)))["status"], 503)
+
+    def test_upstream_errors_become_lines(self):
+        def lookup(account):
+            raise UpstreamTimeout()
+
+        status, line = bulk.run_lookup("a@dtu.dk", lookup)
+        self.assertEqual(status, 504)
+        self.assertEqual(json.loads(line)["detail"], UpstreamTimeout.default_detail)
+
+    def test_unexpected_errors_become_lines(self):
+        def lookup(account):
+            if account == "bad@dtu.dk":
+                raise ValueError("bad upstream body")
+            return FakeResponse(404)
+
+        with self.assertLogs("api.bulk", "ERROR"):
+            results = sorted(bulk.fan_out(
+                lambda account: bulk.run_lookup(account, lookup), ["a@dtu.dk", "bad@dtu.dk"], 2
+            ))
+        self.assertEqual([status for status, _line in results], [404, 500])
+        self.assertEqual(json.loads(results[1][1])["account"], "bad@dtu.dk")
+
+    async def test_async_unexpected_errors_become_lines(self):
+        async def lookup(account):
+            raise ValueError("bad upstream body")
+
+        with self.assertLogs("api.bulk", "ERROR"):
+            status, line = await bulk.arun_lookup("a@dtu.dk", lookup)
+        self.assertEqual((status, json.loads(line)["status"]), (500, 500))
+
+
+class FanOutTest(SimpleTestCase):
+    def test_yields_in_completion_order(self):
+        first_done = threading.Event()
+
+        def work(item):
+            if item == "slow":
+                first_done.wait(5)
+            else:
+                first_done.set()
+            return item
+
+        self.assertEqual(list(bulk.fan_out(work, ["slow", "fast"], 2)), ["fast", "slow"])
+
+    def test_reraises_worker_errors(self):
+        def work(item):
+            raise RuntimeError(item)
+
+        with self.assertRaises(RuntimeError):
+            list(bulk.fan_out(work, ["x"], 2))
+
+    @override_settings(HIBP_BULK_CONCURRENCY=4)
+    def test_stream_logs_every_account(self):
+        principal = AuthPrincipal(1, 2, "test", "hash", DomainIndex.compile(["dtu.dk"]))
+        lookup = mock.Mock(return_value=FakeResponse(404))
+        with mock.patch.object(bulk.log_writer, "record") as record:
+            lines = list(bulk.stream_batch(
+                ["a@dtu.dk", "b@dtu.dk"], [("c@x.com", 403, "denied")], lookup, principal,
+            ))
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])["status"], 403)
+        logs = record.call_args[0][0]
+        self.assertEqual(sorted(log.status_code for log in logs), [403, 404, 404])
+        self.assertTrue(all(log.endpoint.name == "breached-account" for log in logs))
+        self.assertTrue(all((log.api_key_id, log.group_id) == (1, 2) for log in logs))
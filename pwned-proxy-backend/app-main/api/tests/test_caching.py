@@ -0,0 +1,114 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from api import caching
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b"[]"):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {"Content-Type": "application/json"}
+
+
+@override_settings(
+    HIBP_CATALOG_CACHE_TTLS={"breaches": 60, "dataclasses": 60},
+    HIBP_CATALOG_STALE_TTL=60,
+)
+class CatalogCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        caching.catalog_responses.clear_local()
+
+    def test_miss_then_hit(self):
+        fetch = mock.Mock(return_value=FakeResponse(content=b'["Email addresses"]'))
+        first = caching.cached_catalog_get("dataclasses", fetch)
+        second = caching.cached_catalog_get("dataclasses", fetch)
+        self.assertEqual(first.cache_status, caching.MISS)
+        self.assertEqual(second.cache_status, caching.HIT)
+        self.assertEqual(second.json(), ["Email addresses"])
+        fetch.assert_called_once_with("dataclasses")
+
+    def test_query_params_are_part_of_the_key(self):
+        fetch = mock.Mock(return_value=FakeResponse())
+        caching.cached_catalog_get("breaches?Domain=adobe.com", fetch)
+        caching.cached_catalog_get("breaches?IsSpamList=true", fetch)
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_errors_are_not_cached(self):
+        fetch = mock.Mock(return_value=FakeResponse(status_code=503))
+        caching.cached_catalog_get("breaches", fetch)
+        caching.cached_catalog_get("breaches", fetch)
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_stale_entry_is_served_and_revalidated(self):
+        fetch = mock.Mock(return_value=FakeResponse())
+        caching.cached_catalog_get("breaches", fetch)
+        with mock.patch("api.caching.time.time", return_value=time.time() + 90), \
+                mock.patch("api.caching._revalidate_in_background") as revalidate:
+            resp = caching.cached_catalog_get("breaches", fetch)
+        self.assertEqual(resp.cache_status, caching.STALE)
+        revalidate.assert_called_once()
+        fetch.assert_called_once()
+
+    def test_stale_local_copy_is_checked_against_the_shared_one(self):
+        old = mock.Mock(return_value=FakeResponse(content=b'["old"]'))
+        caching.cached_catalog_get("breaches", old)
+        later = time.time() + 90
+        # Another worker revalidated the entry meanwhile.
+        entry = caching.to_entry(FakeResponse(content=b'["new"]'))
+        entry["fetched_at"] = later
+        with mock.patch("api.tiered_cache.TieredCache.set_local"):
+            caching.catalog_responses.set(caching.cache_key("catalog", "breaches"), entry, 600)
+        with mock.patch("api.caching.time.time", return_value=later), \
+                mock.patch("api.caching._revalidate_in_background") as revalidate:
+            resp = caching.cached_catalog_get("breaches", old)
+        self.assertEqual(resp.cache_status, caching.HIT)
+        self.assertEqual(resp.json(), ["new"])
+        revalidate.assert_not_called()
+
+
+class LRUByteCacheTest(SimpleTestCase):
+    def entry(self, size):
+        return {"status": 200, "content": b"x" * size, "headers": {}, "fetched_at": time.time()}
+
+    def test_evicts_least_recently_used_when_over_budget(self):
+        store = caching.LRUByteCache(max_bytes=10)
+        store.set("a", self.entry(4), 60)
+        store.set("b", self.entry(4), 60)
+        store.get("a")
+        store.set("c", self.entry(4), 60)
+        self.assertIsNotNone(store.get("a"))
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(store.size, 8)
+        self.assertEqual(store.evictions, 1)
+
+    def test_expired_entries_are_dropped(self):
+        store = caching.LRUByteCache(max_bytes=10)
+        store.set("a", self.entry(4), 0)
+        self.assertIsNone(store.get("a"))
+        self.assertEqual(store.size, 0)
+
+
+@override_settings(HIBP_ACCOUNT_CACHE_TTL=60, HIBP_ACCOUNT_NOT_FOUND_TTL=30)
+class AccountCacheTest(SimpleTestCase):
+    def setUp(self):
+        caching.get_account_cache().clear()
+
+    def test_key_normalizes_account_and_params(self):
+        self.assertEqual(
+            caching.account_cache_key("breachedaccount", " User@DTU.dk", {"truncateResponse": "False"}),
+            caching.account_cache_key("breachedaccount", "user@dtu.dk", {"truncateResponse": "false"}),
+        )
+
+    def test_not_found_answers_are_cached(self):
+        fetch = mock.Mock(return_value=FakeResponse(status_code=404, content=b""))
+        key = caching.account_cache_key("pasteaccount", "user@dtu.dk")
+        caching.cached_account_get("pasteaccount/user@dtu.dk", key, fetch)
+        resp = caching.cached_account_get("pasteaccount/user@dtu.dk", key, fetch)
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp.cache_status, caching.HIT)
+        fetch.assert_called_once()
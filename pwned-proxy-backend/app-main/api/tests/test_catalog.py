@@ -0,0 +1,79 @@
+import json
+from datetime import datetime, timezone
+
+from django.test import SimpleTestCase
+
+from api.caching import CachedResponse, MISS
+from api.catalog import BreachCatalog, dump_json
+
+ADOBE = {"Name": "Adobe", "Title": "Adobe", "Domain": "adobe.com", "IsSpamList": False}
+SPAM = {"Name": "SpamList", "Title": "Spam", "Domain": "", "IsSpamList": True}
+NEWER = {"Name": "Newer", "Title": "Newer – ünïcode", "Domain": "Adobe.com", "IsSpamList": False}
+UNVERIFIED = {"Name": "Unverified", "Domain": "", "IsSpamList": False, "IsVerified": False}
+SENSITIVE = {"Name": "Sensitive", "Domain": "", "IsSpamList": False, "IsSensitive": True}
+
+
+def row(data, added):
+    return (
+        data["Name"], data["Domain"], data["IsSpamList"],
+        datetime(2024, 1, added, tzinfo=timezone.utc), dump_json(data),
+    )
+
+
+class BreachCatalogTest(SimpleTestCase):
+    def setUp(self):
+        self.catalog = BreachCatalog(
+            [row(ADOBE, 1), row(SPAM, 3), row(NEWER, 2)],
+            ["Email addresses", "Passwords"],
+        )
+
+    def test_all_breaches_keep_upstream_order_and_format(self):
+        body = self.catalog.breaches()
+        self.assertEqual(json.loads(body), [ADOBE, SPAM, NEWER])
+        self.assertNotIn(b", ", body)
+        self.assertIn("ünïcode".encode(), body)
+
+    def test_filters_by_domain_and_spam_flag(self):
+        self.assertEqual(
+            [b["Name"] for b in json.loads(self.catalog.breaches(domain="ADOBE.COM"))],
+            ["Adobe", "Newer"],
+        )
+        self.assertEqual(json.loads(self.catalog.breaches(is_spam_list=True)), [SPAM])
+        self.assertEqual(json.loads(self.catalog.breaches(domain="unknown.com")), [])
+
+    def test_lookup_latest_and_dataclasses(self):
+        self.assertEqual(json.loads(self.catalog.get("adobe")), ADOBE)
+        self.assertIsNone(self.catalog.get("missing"))
+        self.assertEqual(json.loads(self.catalog.latest()), SPAM)
+        self.assertEqual(self.catalog.dataclasses(), b'["Email addresses","Passwords"]')
+
+    def test_empty_catalog_is_falsy(self):
+        self.assertFalse(BreachCatalog([], []))
+
+    def test_expands_truncated_account_response(self):
+        truncated = CachedResponse(
+            200, b'[{"Name":"Newer"},{"Name":"Adobe"}]',
+            {"Content-Type": "application/json; charset=utf-8"}, MISS, 0,
+        )
+        expanded = self.catalog.expand(truncated)
+        self.assertEqual(expanded.content, ("[%s,%s]" % (dump_json(NEWER), dump_json(ADOBE))).encode())
+        self.assertEqual(expanded.cache_status, MISS)
+
+    def test_expand_gives_up_on_unknown_breach(self):
+        truncated = CachedResponse(200, b'[{"Name":"Adobe"},{"Name":"Unknown"}]', {}, MISS, 0)
+        self.assertIsNone(self.catalog.expand(truncated))
+
+    def test_account_breaches_follow_hibp_filters(self):
+        catalog = BreachCatalog(
+            [row(ADOBE, 1), row(UNVERIFIED, 2), row(SENSITIVE, 3), row(NEWER, 4)], [],
+        )
+        names = ["newer", "Sensitive", "Unverified", "Adobe"]
+        self.assertEqual(
+            catalog.account_breaches(names),
+            b'[{"Name":"Adobe"},{"Name":"Unverified"},{"Name":"Newer"}]',
+        )
+        self.assertEqual(
+            json.loads(catalog.account_breaches(names, truncate=False, include_unverified=False)),
+            [ADOBE, NEWER],
+        )
+        self.assertIsNone(catalog.account_breaches(["Adobe", "Unknown"]))
@@ -0,0 +1,73 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from api import circuit
+from api.caching import STALE
+from api.upstream import UpstreamUnavailable
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b'{"ok":true}', seconds=0.1):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {"Content-Type": "application/json"}
+        self.elapsed = timedelta(seconds=seconds)
+
+
+@override_settings(
+    HIBP_CIRCUIT_WINDOW=4,
+    HIBP_CIRCUIT_MIN_CALLS=2,
+    HIBP_CIRCUIT_ERROR_RATE=0.5,
+    HIBP_CIRCUIT_OPEN_SECONDS=30,
+    HIBP_CIRCUIT_SLOW_CALL_RATIO=0.8,
+)
+class CircuitTest(SimpleTestCase):
+    def setUp(self):
+        circuit._breakers.clear()
+        circuit.get_last_good().clear()
+
+    def fail(self, path):
+        raise UpstreamUnavailable()
+
+    def test_opens_after_failures_and_fails_fast(self):
+        with self.assertRaises(UpstreamUnavailable):
+            circuit.circuit_get("breaches", self.fail)
+        with self.assertRaises(UpstreamUnavailable):
+            circuit.circuit_get("breaches", self.fail)
+
+        fetch = mock.Mock()
+        with self.assertRaises(circuit.CircuitOpen) as ctx:
+            circuit.circuit_get("breaches", fetch)
+        fetch.assert_not_called()
+        self.assertGreater(ctx.exception.wait, 0)
+        self.assertEqual(circuit.circuit_stats()["breaches"]["state"], circuit.OPEN)
+
+    def test_serves_last_good_response_while_failing(self):
+        circuit.circuit_get("breach/Adobe", lambda p: FakeResponse())
+        stale = circuit.circuit_get("breach/Adobe", self.fail)
+        self.assertEqual(stale.cache_status, STALE)
+        self.assertEqual(stale.content, b'{"ok":true}')
+
+        stale = circuit.circuit_get("breach/Adobe", lambda p: FakeResponse(503, b"down"))
+        self.assertEqual(stale.cache_status, STALE)
+
+    def test_half_open_probe_closes_circuit(self):
+        breaker = circuit.get_breaker("dataclasses")
+        breaker.record(False)
+        breaker.record(False)
+        self.assertEqual(breaker.state, circuit.OPEN)
+
+        breaker.opened_at -= 31
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # only one probe at a time
+        breaker.record(True)
+        self.assertEqual(breaker.state, circuit.CLOSED)
+
+    def test_slow_calls_count_as_failures_and_429_does_not(self):
+        slow = FakeResponse(seconds=60)
+        circuit.circuit_get("breaches", lambda p: FakeResponse(429))
+        circuit.circuit_get("breaches", lambda p: slow)
+        circuit.circuit_get("breaches", lambda p: slow)
+        self.assertEqual(circuit.get_breaker("breaches").state, circuit.OPEN)
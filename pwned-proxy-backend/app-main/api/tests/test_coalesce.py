@@ -0,0 +1,94 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from api import coalesce
+
+
+class FakeResponse:
+    status_code = 200
+    content = b"{}"
+    headers = {}
+
+
+@override_settings(HIBP_COALESCE_ACROSS_WORKERS=True, HIBP_COALESCE_WAIT=5)
+class CoalescedGetTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_callers_share_one_upstream_call(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_fetch(path):
+            started.set()
+            release.wait(5)
+            return FakeResponse()
+
+        fetch = mock.Mock(side_effect=slow_fetch)
+        results = []
+
+        def call():
+            results.append(coalesce.coalesced_get("breacheddomain/dtu.dk", fetch))
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for t in threads[1:]:
+            t.start()
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join(5)
+
+        fetch.assert_called_once_with("breacheddomain/dtu.dk")
+        self.assertEqual(len(results), 5)
+        self.assertEqual(coalesce.in_flight(), 0)
+
+    def test_errors_are_shared_and_not_retained(self):
+        fetch = mock.Mock(side_effect=RuntimeError("boom"))
+        with self.assertRaises(RuntimeError):
+            coalesce.coalesced_get("breaches", fetch)
+        fetch.side_effect = None
+        fetch.return_value = FakeResponse()
+        self.assertEqual(coalesce.coalesced_get("breaches", fetch).status_code, 200)
+
+    def test_waits_for_result_published_by_another_worker(self):
+        path = "breachedaccount/user@dtu.dk"
+        cache.add(coalesce.cache_key("inflight", path), 1, 5)
+
+        def publish():
+            time.sleep(0.05)
+            cache.set(
+                coalesce.cache_key("inflight-result", path),
+                {"status": 404, "content": b"", "headers": {}, "fetched_at": time.time()},
+                5,
+            )
+
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        fetch = mock.Mock()
+        with self.settings(HIBP_COALESCE_POLL_INTERVAL=0.01):
+            resp = coalesce.coalesced_get(path, fetch)
+        publisher.join(5)
+        self.assertEqual(resp.status_code, 404)
+        fetch.assert_not_called()
+
+    def test_result_of_an_earlier_leader_is_not_reused(self):
+        path = "breachedaccount/user@dtu.dk"
+        cache.set(
+            coalesce.cache_key("inflight-result", path),
+            {"status": 404, "content": b"", "headers": {}, "fetched_at": time.time() - 1},
+            5,
+        )
+        cache.add(coalesce.cache_key("inflight", path), 1, 5)
+        # The current leader finishes without publishing (e.g. it failed).
+        threading.Timer(0.05, cache.delete, [coalesce.cache_key("inflight", path)]).start()
+        fetch = mock.Mock(return_value=FakeResponse())
+        with self.settings(HIBP_COALESCE_POLL_INTERVAL=0.01):
+            resp = coalesce.coalesced_get(path, fetch)
+        self.assertEqual(resp.status_code, 200)
+        fetch.assert_called_once_with(path)
@@ -0,0 +1,94 @@
+import threading
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from api import counters
+from api.models import SharedCounter
+
+
+@override_settings(HIBP_COUNTER_BACKEND="database")
+class DatabaseCountersTest(TestCase):
+    def at(self, now):
+        return mock.patch("api.counters.time.time", return_value=now)
+
+    def test_increment_keeps_the_expiry(self):
+        with self.at(1000.0):
+            self.assertEqual(counters.incr("c", 60), 1)
+        with self.at(1059.0):
+            self.assertEqual(counters.incr("c", 60), 2)
+        self.assertEqual(SharedCounter.objects.get(name="c").expires_at, 1060.0)
+        with self.at(1060.0):
+            self.assertIsNone(counters.get("c"))
+            self.assertEqual(counters.incr("c", 60), 1)  # starts over
+        self.assertEqual(SharedCounter.objects.get(name="c").expires_at, 1120.0)
+
+    def test_counters_without_ttl_never_expire(self):
+        self.assertEqual(counters.incr("version", initial=500), 500)
+        self.assertEqual(counters.incr("version"), 501)
+        self.assertIsNone(SharedCounter.objects.get(name="version").expires_at)
+
+    def test_increment_and_read_in_one_statement(self):
+        counters.incr("previous", 60)
+        counters.incr("previous", 60)
+        with self.assertNumQueries(1):
+            values = counters.incr_many({"a": 60, "b": 60}, read=["previous", "missing"])
+        self.assertEqual(values, {"a": 1, "b": 1, "previous": 2})
+
+    def test_decrement_skips_expired_counters(self):
+        with self.at(1000.0):
+            counters.incr("c", 60)
+            counters.incr("c", 60)
+            counters.decr("c")
+            self.assertEqual(counters.get("c"), 1)
+        with self.at(2000.0):
+            counters.decr("c")
+        self.assertEqual(SharedCounter.objects.get(name="c").value, 1)
+
+    def test_add_only_creates_missing_or_expired_counters(self):
+        with self.at(1000.0):
+            self.assertTrue(counters.add("c", 7, 60))
+            self.assertFalse(counters.add("c", 9, 60))
+            self.assertEqual(counters.get("c"), 7)
+        with self.at(2000.0):
+            self.assertTrue(counters.add("c", 9, 60))
+            self.assertEqual(counters.get("c"), 9)
+
+    def test_expired_rows_are_culled(self):
+        with self.at(1000.0):
+            counters.incr("old", 60)
+        with self.at(2000.0), mock.patch("api.counters.CULL_EVERY", 1):
+            counters.incr("new", 60)
+        self.assertEqual(list(SharedCounter.objects.values_list("name", flat=True)), ["new"])
+
+
+@override_settings(HIBP_COUNTER_BACKEND="database")
+class ConcurrentIncrementTest(TransactionTestCase):
+    def test_no_increment_is_lost(self):
+        def worker():
+            try:
+                for _ in range(50):
+                    counters.incr("shared", 60)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(SharedCounter.objects.get(name="shared").value, 400)
+
+
+class BackendTest(SimpleTestCase):
+    @override_settings(
+        HIBP_COUNTER_BACKEND="cache",
+        CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "django_cache",
+        }},
+    )
+    def test_database_cache_is_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            counters.incr("c", 60)
@@ -0,0 +1,39 @@
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase
+
+from api.domain_index import DomainIndex
+from api.models import DomainRule
+
+
+class DomainIndexTest(SimpleTestCase):
+    def test_exact_domains_do_not_cover_subdomains(self):
+        index = DomainIndex.compile(exact=["DTU.dk"])
+        self.assertIn("dtu.dk", index)
+        self.assertIn("dtu.dk.", index)
+        self.assertNotIn("compute.dtu.dk", index)
+
+    def test_subtree_rules_cover_domain_and_subdomains(self):
+        index = DomainIndex.compile(subtrees=["dtu.dk"])
+        self.assertIn("dtu.dk", index)
+        self.assertIn("a.b.Compute.dtu.dk", index)
+        self.assertNotIn("notdtu.dk", index)
+        self.assertNotIn("dk", index)
+
+    def test_empty_index(self):
+        index = DomainIndex()
+        self.assertFalse(index)
+        self.assertNotIn("dtu.dk", index)
+        self.assertNotIn(None, index)
+
+
+class DomainRuleTest(SimpleTestCase):
+    def test_wildcard_spelling_means_subdomains(self):
+        rule = DomainRule(domain="*.DTU.dk.", include_subdomains=False)
+        rule.clean()
+        self.assertEqual((rule.domain, rule.include_subdomains), ("dtu.dk", True))
+        self.assertEqual(str(rule), "*.dtu.dk")
+
+    def test_rejects_bare_or_inner_wildcards(self):
+        for domain in ["dk", "a.*.dk", "*"]:
+            with self.assertRaises(ValidationError):
+                DomainRule(domain=domain).clean()
@@ -0,0 +1,130 @@
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from api import governor
+from api.models import UpstreamRateBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None, data=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._data = data
+        self.closed = False
+
+    def json(self):
+        return self._data
+
+    def close(self):
+        self.closed = True
+
+    async def aclose(self):
+        self.closed = True
+
+
+@override_settings(HIBP_GOVERNOR_MAX_WAIT=5, HIBP_GOVERNOR_MAX_WAITERS=2, HIBP_GOVERNOR_BURST=1)
+class GovernorTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(HIBP_RATE_LIMIT_RPM="auto", HIBP_RATE_LIMIT_RPM_FALLBACK=10)
+    def test_rpm_is_read_from_subscription_status(self):
+        fetch_status = mock.Mock(return_value=FakeResponse(data={"Rpm": 500}))
+        self.assertEqual(governor.get_rpm("abcdef", fetch_status), 500)
+        self.assertEqual(governor.get_rpm("abcdef", fetch_status), 500)
+        fetch_status.assert_called_once()
+
+    @override_settings(HIBP_RATE_LIMIT_RPM="0")
+    def test_disabled_governor_calls_straight_through(self):
+        fetch = mock.Mock(return_value=FakeResponse())
+        with mock.patch("api.governor.reserve") as reserve:
+            governor.governed_get("breaches", fetch, "key")
+        reserve.assert_not_called()
+
+    @override_settings(HIBP_RATE_LIMIT_RPM="60")
+    def test_waits_for_reserved_slot(self):
+        fetch = mock.Mock(return_value=FakeResponse())
+        with mock.patch("api.governor.reserve", return_value=0.25), \
+                mock.patch("api.governor.time.sleep") as sleep:
+            governor.governed_get("breaches", fetch, "key")
+        sleep.assert_called_once_with(0.25)
+
+    @override_settings(HIBP_RATE_LIMIT_RPM="60")
+    def test_rejects_when_deadline_cannot_be_met(self):
+        with mock.patch("api.governor.reserve", return_value=None):
+            with self.assertRaises(governor.UpstreamRateLimited) as ctx:
+                governor.governed_get("breaches", mock.Mock(), "key")
+        self.assertEqual(ctx.exception.wait, 1)
+
+    @override_settings(HIBP_RATE_LIMIT_RPM="60")
+    def test_upstream_429_penalizes_bucket_and_retries(self):
+        rejected = FakeResponse(429, {"Retry-After": "1"})
+        fetch = mock.Mock(side_effect=[rejected, FakeResponse(200)])
+        with mock.patch("api.governor.reserve", return_value=0), \
+                mock.patch("api.governor.time.sleep"), \
+                mock.patch("api.governor.penalize") as penalize:
+            resp = governor.governed_get("breaches", fetch, "key")
+        self.assertEqual(resp.status_code, 200)
+        penalize.assert_called_once_with("hibp", 1.0)
+        self.assertTrue(rejected.closed)
+        self.assertFalse(resp.closed)
+
+    @override_settings(HIBP_RATE_LIMIT_RPM="60")
+    async def test_async_429_is_closed_before_retrying(self):
+        rejected = FakeResponse(429, {"Retry-After": "1"})
+        fetch = mock.AsyncMock(side_effect=[rejected, FakeResponse(200)])
+        with mock.patch("api.governor.reserve", return_value=0), \
+                mock.patch("api.governor.penalize"):
+            resp = await governor.agoverned_get("breaches", fetch, "key")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(rejected.closed)
+
+
+class ConcurrentReserveTest(TransactionTestCase):
+    NOW = 1000.0
+
+    def setUp(self):
+        UpstreamRateBucket.objects.create(name="hibp", tat=0)
+        patcher = mock.patch("api.governor.time.time", return_value=self.NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reserve_concurrently(self, calls, rpm=120, burst=1, max_wait=60):
+        waits = []
+
+        def worker():
+            try:
+                wait = governor.reserve("hibp", rpm, burst, max_wait)
+                with lock:
+                    waits.append(wait)
+            finally:
+                connection.close()
+
+        lock = threading.Lock()
+        threads = [threading.Thread(target=worker) for _ in range(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return waits
+
+    def test_slots_are_spaced_by_the_interval(self):
+        waits = self.reserve_concurrently(8)
+        self.assertEqual(sorted(waits), [slot * 0.5 for slot in range(8)])
+        tat = UpstreamRateBucket.objects.get(name="hibp").tat
+        self.assertAlmostEqual(tat, self.NOW + 8 * 0.5)
+
+    def test_burst_slots_are_free(self):
+        waits = self.reserve_concurrently(5, burst=3)
+        self.assertEqual(sorted(waits), [0.0, 0.0, 0.0, 0.5, 1.0])
+
+    def test_slots_beyond_max_wait_are_not_reserved(self):
+        waits = self.reserve_concurrently(6, max_wait=1.0)
+        self.assertEqual(sorted(w for w in waits if w is not None), [0.0, 0.5, 1.0])
+        self.assertEqual(waits.count(None), 3)
+        tat = UpstreamRateBucket.objects.get(name="hibp").tat
+        self.assertAlmostEqual(tat, self.NOW + 3 * 0.5)
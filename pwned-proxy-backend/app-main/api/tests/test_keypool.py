@@ -0,0 +1,82 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from api import keypool
+from api.governor import UpstreamRateLimited
+
+KEYS = [(1, "key-one", 10), (2, "key-two", 50), (3, "key-three", None)]
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def buckets(tats):
+    queryset = mock.Mock()
+    queryset.filter.return_value.values_list.return_value = list(tats.items())
+    return mock.patch.object(keypool.UpstreamRateBucket, "objects", queryset)
+
+
+@override_settings(HIBP_KEY_UNAUTHORIZED_COOLDOWN=3600)
+class KeyPoolTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(keypool, "get_hibp_keys", return_value=KEYS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(keypool.HIBPKey, "objects")
+        self.key_rows = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_keys_ranked_by_remaining_budget_then_rpm(self):
+        far = keypool.time.time() + 60
+        with buckets({"hibp-key-1": far}):
+            ranked = keypool.rank_keys(KEYS)
+        self.assertEqual([k[0] for k in ranked], [2, 3, 1])
+
+    def test_keys_out_of_rotation_are_skipped(self):
+        keypool.mark_down(2, 429, 30)
+        with buckets({}):
+            self.assertEqual([k[0] for k in keypool.rank_keys(KEYS)], [1, 3])
+        self.key_rows.filter.assert_called_with(pk=2)
+
+    def test_rejected_keys_fail_over_to_the_next_key(self):
+        responses = {
+            "key-two": FakeResponse(401),
+            "key-one": FakeResponse(429, {"Retry-After": "5"}),
+            "key-three": FakeResponse(200),
+        }
+
+        def governed(path, fetch, api_key, **kwargs):
+            self.assertFalse(kwargs["retry_429"])
+            return fetch(path)
+
+        with buckets({"hibp-key-3": keypool.time.time() + 1}), \
+                mock.patch.object(keypool, "governed_get", side_effect=governed):
+            resp = keypool.pooled_get("breaches", lambda p, key: responses[key], None)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(responses["key-two"].closed)
+        self.assertEqual(set(cache.get_many(
+            [f"hibp_key_down:{pk}" for pk in (1, 2, 3)]
+        )), {"hibp_key_down:1", "hibp_key_down:2"})
+
+    def test_no_usable_key_raises(self):
+        with mock.patch.object(keypool, "governed_get", side_effect=UpstreamRateLimited(3)), \
+                buckets({}):
+            with self.assertRaises(UpstreamRateLimited):
+                keypool.pooled_get("breaches", mock.Mock(), None)
+
+        for pk, _key, _rpm in KEYS:
+            keypool.mark_down(pk, 401, 60)
+        with self.assertRaises(keypool.NoUpstreamKey) as ctx:
+            keypool.pooled_get("breaches", mock.Mock(), None)
+        self.assertGreater(ctx.exception.wait, 0)
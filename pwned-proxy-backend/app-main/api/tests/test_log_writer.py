@@ -0,0 +1,94 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from api import log_writer
+from api.domain_index import DomainIndex
+from api.principal import AuthPrincipal
+
+PRINCIPAL = AuthPrincipal(1, 2, "test", "hash", DomainIndex())
+
+
+class LogWriterTest(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(log_writer.EndpointLog.objects, "bulk_create")
+        self.bulk_create = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("api.log_writer.add_usage")
+        self.add_usage = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("api.log_writer.transaction.atomic")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("api.log_writer.resolve_endpoints")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def written(self):
+        return [log for call in self.bulk_create.call_args_list for log in call[0][0]]
+
+    def test_make_log(self):
+        log = log_writer.make_log(PRINCIPAL, "breached-account", 404)
+        self.assertEqual((log.api_key_id, log.group_id), (1, 2))
+        self.assertFalse(log.success)
+        self.assertEqual(log.endpoint.name, "breached-account")
+        self.assertIsNotNone(log.created_at)
+        self.assertIsNone(log_writer.make_log(None, "x", 200).api_key_id)
+
+    def test_writes_in_batches(self):
+        writer = log_writer.LogWriter(100, 2, 60)
+        writer.put([log_writer.make_log(PRINCIPAL, "x", 200) for _ in range(5)])
+        writer.close()
+        self.assertEqual(len(self.written()), 5)
+        self.assertTrue(all(len(call[0][0]) <= 2 for call in self.bulk_create.call_args_list))
+        self.assertEqual(writer.written, 5)
+        self.assertEqual(self.add_usage.call_count, self.bulk_create.call_count)
+
+    def test_flushes_after_the_interval(self):
+        flushed = threading.Event()
+        self.bulk_create.side_effect = lambda logs: flushed.set()
+        writer = log_writer.LogWriter(100, 100, 0.01)
+        writer.put([log_writer.make_log(PRINCIPAL, "x", 200)])
+        # The batch is not full, so only the interval can trigger the write.
+        self.assertTrue(flushed.wait(5))
+        self.assertEqual(len(self.written()), 1)
+        writer.close()
+
+    def test_full_queue_drops_counts_and_warns(self):
+        writer = log_writer.LogWriter(2, 10, 60)
+        with mock.patch.object(writer, "_ensure_started"):
+            with self.assertLogs("api.log_writer", "WARNING") as logs:
+                writer.put([log_writer.make_log(PRINCIPAL, "x", 200) for _ in range(5)])
+                # Further drops within the interval are only counted.
+                writer.put([log_writer.make_log(PRINCIPAL, "x", 200)])
+        self.assertEqual(writer.dropped, 4)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(writer.stats(), {"queued": 2, "written": 0, "dropped": 4})
+
+    def test_failed_insert_is_counted(self):
+        self.bulk_create.side_effect = RuntimeError("db down")
+        writer = log_writer.LogWriter(100, 10, 60)
+        writer.put([log_writer.make_log(PRINCIPAL, "x", 500) for _ in range(3)])
+        with self.assertLogs("api.log_writer", "WARNING"):
+            writer.close()
+        self.assertEqual(writer.dropped, 3)
+
+    @override_settings(HIBP_LOG_QUEUE_SIZE=0)
+    def test_queue_size_zero_writes_inline(self):
+        log_writer.record([log_writer.make_log(PRINCIPAL, "x", 200)])
+        self.assertEqual(len(self.written()), 1)
+
+
+class ResolveEndpointsTest(SimpleTestCase):
+    def test_names_are_resolved_once_per_process(self):
+        logs = [log_writer.make_log(PRINCIPAL, name, 200) for name in ("a", "b", "a")]
+        saved = [log_writer.Endpoint(id=1, name="a"), log_writer.Endpoint(id=2, name="b")]
+        with mock.patch.dict(log_writer._endpoints, clear=True), \
+                mock.patch.object(log_writer.Endpoint, "objects") as objects:
+            objects.filter.return_value = saved
+            log_writer.resolve_endpoints(logs)
+            log_writer.resolve_endpoints([log_writer.make_log(PRINCIPAL, "b", 200)])
+        self.assertEqual([log.endpoint_id for log in logs], [1, 2, 1])
+        objects.bulk_create.assert_called_once()
+        self.assertEqual([e.name for e in objects.bulk_create.call_args[0][0]], ["a", "b"])
@@ -0,0 +1,149 @@
+from unittest import mock
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from api import principal
+from api.domain_index import DomainIndex
+from api.models import APIKey, Domain, hash_api_key
+from api.principal import AuthPrincipal
+
+ALICE = AuthPrincipal(1, 2, "alice", "hash-a", DomainIndex.compile(["dtu.dk"]))
+
+
+@override_settings(
+    HIBP_AUTH_CACHE_TTL=60,
+    HIBP_L1_CACHE_TTL=60,
+    HIBP_L1_CACHE_MAX_ENTRIES=100,
+    HIBP_CACHE_VERSION_CHECK_INTERVAL=0,
+)
+class PrincipalCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        principal.principals.clear_local()
+        patcher = mock.patch.object(principal, "load_principal", return_value=ALICE)
+        self.load = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_allows_is_case_insensitive(self):
+        self.assertTrue(ALICE.allows("DTU.dk"))
+        self.assertFalse(ALICE.allows("example.com"))
+
+    def test_second_lookup_is_served_from_memory(self):
+        self.assertEqual(principal.get_principal("hash-a"), ALICE)
+        self.assertEqual(principal.get_principal("hash-a"), ALICE)
+        self.load.assert_called_once_with("hash-a")
+
+    def test_unknown_keys_are_cached_per_worker_only(self):
+        self.load.return_value = None
+        self.assertIsNone(principal.get_principal("nope"))
+        self.assertIsNone(principal.get_principal("nope"))
+        self.load.assert_called_once()
+        principal.principals.clear_local()  # another worker
+        self.assertIsNone(principal.get_principal("nope"))
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_other_workers_read_the_shared_copy(self):
+        principal.get_principal("hash-a")
+        principal.principals.clear_local()  # another worker
+        self.assertEqual(principal.get_principal("hash-a"), ALICE)
+        self.load.assert_called_once()
+
+    def test_expired_entries_are_reloaded(self):
+        with override_settings(HIBP_AUTH_CACHE_TTL=0):
+            principal.get_principal("hash-a")
+            principal.get_principal("hash-a")
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_invalidation_by_another_worker_drops_entries(self):
+        principal.get_principal("hash-a")
+        cache.incr("ns:auth_principal:version")  # another worker
+        principal.get_principal("hash-a")
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_invalidate(self):
+        principal.get_principal("hash-a")
+        principal.invalidate_principals()
+        principal.get_principal("hash-a")
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_signals_invalidate(self):
+        from django.db.models.signals import m2m_changed, post_delete
+
+        with mock.patch("api.signals.invalidate_principals") as invalidate, \
+                mock.patch("api.signals.transaction.on_commit", side_effect=lambda func: func()):
+            post_delete.send(sender=Domain, instance=Domain(name="dtu.dk"))
+            m2m_changed.send(
+                sender=APIKey.domains.through, instance=None, action="pre_add",
+                reverse=False, model=Domain, pk_set={1},
+            )
+            m2m_changed.send(
+                sender=APIKey.domains.through, instance=None, action="post_add",
+                reverse=False, model=Domain, pk_set={1},
+            )
+        self.assertEqual(invalidate.call_count, 2)
+
+    async def test_async_lookup_shares_the_cache(self):
+        self.assertEqual(await principal.aget_principal("hash-a"), ALICE)
+        self.assertEqual(principal.get_principal("hash-a"), ALICE)
+        self.load.assert_called_once_with("hash-a")
+
+    def test_key_limits_fall_back_to_group_quota(self):
+        limits = principal.merge_limits(("", 5, None), ("100/min", 20, 2))
+        self.assertEqual(limits, principal.Limits("100/min", 5, 2))
+        self.assertEqual(
+            principal.merge_limits(("", None, None), (None, None, None)), principal.Limits()
+        )
+
+
+@override_settings(
+    HIBP_AUTH_CACHE_TTL=60,
+    HIBP_L1_CACHE_TTL=60,
+    HIBP_CACHE_VERSION_CHECK_INTERVAL=0,
+)
+class PrincipalInvalidationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        principal.principals.clear_local()
+        self.domain = Domain.objects.create(name="dtu.dk")
+        group = Group.objects.create(name="DTU")
+        api_key, raw_key = APIKey.create_api_key(group, [self.domain], name="dtu")
+        self.api_key = api_key
+        self.key_hash = hash_api_key(raw_key)
+
+    def lookup(self):
+        return principal.get_principal(self.key_hash)
+
+    def test_renamed_domain_is_seen_after_commit(self):
+        self.assertTrue(self.lookup().allows("dtu.dk"))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.domain.name = "dtu.eu"
+            self.domain.save()
+            # Not before the rename is committed.
+            self.assertTrue(self.lookup().allows("dtu.dk"))
+        self.assertEqual(len(callbacks), 1)
+        self.assertTrue(self.lookup().allows("dtu.eu"))
+        self.assertFalse(self.lookup().allows("dtu.dk"))
+
+    def test_count_updates_keep_the_cache(self):
+        self.lookup()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Domain.objects.update_or_create(name="dtu.dk", defaults={"pwn_count": 5})
+        self.assertEqual(callbacks, [])
+
+    def test_key_changes_are_seen_after_commit(self):
+        self.assertIsNone(self.lookup().limits.rate)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api_key.rate_limit = "10/min"
+            self.api_key.save()
+        self.assertEqual(self.lookup().limits.rate, "10/min")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api_key.domains.clear()
+        self.assertFalse(self.lookup().allows("dtu.dk"))
+
+    @override_settings(HIBP_COUNTER_BACKEND="database")
+    async def test_unknown_key_from_async_code(self):
+        # Remembering the unknown key must not query from the event loop.
+        self.assertIsNone(await principal.aget_principal("unknown"))
+        self.assertIsNone(await principal.aget_principal("unknown"))
@@ -0,0 +1,43 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from api import quotas
+from api.domain_index import DomainIndex
+from api.principal import AuthPrincipal, Limits
+
+LIMITED = AuthPrincipal(3, 1, "limited", "hash", DomainIndex(), Limits(max_concurrent=2))
+
+
+@override_settings(HIBP_CONCURRENCY_SLOT_TTL=300)
+class UpstreamSlotTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_unbound_calls_are_not_limited(self):
+        with quotas.upstream_slot(), quotas.upstream_slot(), quotas.upstream_slot():
+            pass
+
+    def test_limit_applies_to_the_bound_key(self):
+        with quotas.acting_as(LIMITED):
+            with quotas.upstream_slot(), quotas.upstream_slot():
+                with self.assertRaises(quotas.TooManyConcurrentCalls):
+                    with quotas.upstream_slot():
+                        pass
+            # Slots are given back, including the rejected one.
+            self.assertEqual(cache.get("concurrency_apikey_3"), 0)
+            with quotas.upstream_slot():
+                pass
+
+    def test_binding_is_reset_after_the_block(self):
+        with quotas.acting_as(LIMITED):
+            pass
+        with quotas.upstream_slot(), quotas.upstream_slot(), quotas.upstream_slot():
+            pass
+
+    async def test_async_slot(self):
+        with quotas.acting_as(LIMITED):
+            async with quotas.aupstream_slot(), quotas.aupstream_slot():
+                with self.assertRaises(quotas.TooManyConcurrentCalls):
+                    async with quotas.aupstream_slot():
+                        pass
+        self.assertEqual(cache.get("concurrency_apikey_3"), 0)
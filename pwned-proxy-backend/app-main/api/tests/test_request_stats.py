@@ -0,0 +1,64 @@
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import SimpleTestCase
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+
+from api import request_stats, usage
+from api.models import EndpointLog
+
+
+class RequestStatsTest(SimpleTestCase):
+    def test_upstream_time_is_added_to_the_bound_request(self):
+        token = request_stats.bind()
+        try:
+            with request_stats.timed_upstream() as stats:
+                stats.upstream_status = 404
+            with request_stats.timed_upstream():
+                pass
+            current = request_stats.current()
+        finally:
+            request_stats.unbind(token)
+        self.assertEqual(current.upstream_calls, 2)
+        self.assertEqual(current.upstream_status, 404)
+        self.assertIsNone(request_stats.current())
+
+    def test_unbound_calls_are_not_recorded(self):
+        with request_stats.timed_upstream() as stats:
+            stats.upstream_status = 200
+        self.assertIsNone(request_stats.current())
+
+    def test_log_details(self):
+        stats = request_stats.RequestStats()
+        response = HttpResponse(b"12345")
+        response["X-Cache"] = "HIT"
+        details = request_stats.log_details(stats, response)
+        self.assertEqual(details["response_bytes"], 5)
+        self.assertEqual(details["cache_status"], "HIT")
+        self.assertGreaterEqual(details["duration_ms"], 0)
+        self.assertNotIn("upstream_ms", details)
+
+        stats.upstream_calls, stats.upstream_seconds, stats.upstream_status = 1, 0.25, 200
+        details = request_stats.log_details(stats, StreamingHttpResponse(iter([b"x"])))
+        self.assertIsNone(details["response_bytes"])
+        self.assertEqual((details["upstream_ms"], details["upstream_status"]), (250, 200))
+        self.assertEqual(details["cache_status"], "")
+
+    def test_log_details_without_stats(self):
+        details = request_stats.log_details(None, HttpResponse(b""))
+        self.assertNotIn("duration_ms", details)
+
+
+class LatencyReportTest(SimpleTestCase):
+    def test_percentiles_use_percentile_cont(self):
+        rows = EndpointLog.objects.values("endpoint").annotate(
+            p95=usage.Percentile("duration_ms", 95)
+        )
+        self.assertIn(
+            'percentile_cont(0.95) WITHIN GROUP (ORDER BY "api_endpointlog"."duration_ms")',
+            str(rows.query),
+        )
+
+    def test_unknown_grouping_is_rejected(self):
+        now = timezone.now()
+        with self.assertRaises(ParseError):
+            usage.latency_report(now, now, by="country")
@@ -0,0 +1,75 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from api import retention
+from api.models import Endpoint, EndpointLog, EndpointUsage
+
+
+class DeleteInChunksTest(SimpleTestCase):
+    def queryset(self, counts):
+        queryset = mock.MagicMock()
+        queryset.model.objects.filter.return_value.delete.side_effect = [
+            (count, {}) for count in counts
+        ]
+        return queryset
+
+    def test_deletes_until_a_short_chunk(self):
+        queryset = self.queryset([10, 10, 3])
+        self.assertEqual(retention.delete_in_chunks(queryset, 10), 23)
+        self.assertEqual(queryset.model.objects.filter.call_count, 3)
+
+    def test_stops_after_max_chunks(self):
+        queryset = self.queryset([10, 10, 10])
+        self.assertEqual(retention.delete_in_chunks(queryset, 10, max_chunks=2), 20)
+
+    def test_pauses_between_chunks(self):
+        queryset = self.queryset([10, 0])
+        with mock.patch("api.retention.time.sleep") as sleep:
+            retention.delete_in_chunks(queryset, 10, pause=0.5)
+        sleep.assert_called_once_with(0.5)
+
+    def test_zero_days_keeps_everything(self):
+        self.assertIsNone(retention.cutoff(0))
+        with mock.patch("api.retention.delete_in_chunks") as delete:
+            self.assertEqual(retention.prune(0, 0, chunk_size=10), {"logs": 0, "usage": 0})
+        delete.assert_not_called()
+
+
+class PruneTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        endpoint = Endpoint.objects.create(name="breached-account")
+        EndpointLog.objects.bulk_create(
+            EndpointLog(endpoint=endpoint, status_code=200, created_at=now - timedelta(days=days))
+            for days in [100] * 7 + [1] * 2
+        )
+        EndpointUsage.objects.bulk_create(
+            EndpointUsage(
+                hour=retention.cutoff(days).replace(minute=0, second=0, microsecond=0),
+                endpoint="breached-account", status_class=2, count=1,
+            )
+            for days in (400, 100, 1)
+        )
+
+    def test_command_deletes_old_rows_in_chunks(self):
+        out = StringIO()
+        with mock.patch("api.retention.delete_in_chunks", wraps=retention.delete_in_chunks) as delete:
+            call_command(
+                "prune_endpoint_logs", "--days", "30", "--usage-days", "365", "--chunk-size", "3",
+                stdout=out,
+            )
+        self.assertIn("Deleted 7 log rows and 1 usage rows.", out.getvalue())
+        self.assertEqual(EndpointLog.objects.count(), 2)
+        self.assertEqual(EndpointUsage.objects.count(), 2)
+        self.assertEqual(delete.call_args_list[0].args[1], 3)
+
+    def test_max_chunks_leaves_the_rest_for_the_next_run(self):
+        self.assertEqual(retention.prune(30, 0, chunk_size=3, max_chunks=2), {"logs": 6, "usage": 0})
+        self.assertEqual(EndpointLog.objects.count(), 3)
+        self.assertEqual(retention.prune(30, 0, chunk_size=3), {"logs": 1, "usage": 0})
+        self.assertEqual(EndpointLog.objects.count(), 2)
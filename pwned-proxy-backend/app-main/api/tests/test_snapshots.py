@@ -0,0 +1,233 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+
+from api import snapshots
+from api.catalog import BreachCatalog
+from api.caching import HIT
+from api.models import Domain, DomainSnapshot, HIBPKey
+
+BODY = b'{"alice":["Adobe"],"bob":["Adobe","LinkedIn"]}'
+
+
+class SnapshotTest(SimpleTestCase):
+    def setUp(self):
+        snapshots.get_body_cache().clear()
+
+    def test_compression_round_trip_is_deterministic(self):
+        compressed = snapshots.compress(BODY)
+        self.assertEqual(compressed, snapshots.compress(BODY))
+        self.assertEqual(snapshots.decompress(memoryview(compressed)), BODY)
+
+    def test_latest_snapshot_is_served_with_age_and_cached(self):
+        row = (7, 200, timezone.now() - timedelta(seconds=90))
+        load = mock.Mock(return_value=snapshots.compress(BODY))
+        with mock.patch.object(snapshots, "_latest_row", return_value=row), \
+                mock.patch.object(snapshots, "_load_content", load):
+            first = snapshots.latest_snapshot("dtu.dk")
+            second = snapshots.latest_snapshot("dtu.dk")
+
+        self.assertEqual(first.content, BODY)
+        self.assertEqual(first.cache_status, HIT)
+        self.assertGreaterEqual(first.age, 90)
+        self.assertEqual(second.content, BODY)
+        load.assert_called_once_with(7)
+
+    def test_missing_snapshot_falls_back(self):
+        with mock.patch.object(snapshots, "_latest_row", return_value=None):
+            self.assertIsNone(snapshots.latest_snapshot("dtu.dk"))
+
+
+class ChangesTest(SimpleTestCase):
+    def test_entry_pairs_flatten_domain_body(self):
+        self.assertEqual(
+            snapshots.entry_pairs(BODY),
+            {("alice", "Adobe"), ("bob", "Adobe"), ("bob", "LinkedIn")},
+        )
+        self.assertEqual(snapshots.entry_pairs(b"{}"), set())
+
+    def test_pairs_are_grouped_by_alias(self):
+        self.assertEqual(
+            snapshots._group({("bob", "LinkedIn"), ("alice", "Adobe"), ("bob", "Adobe")}),
+            {"alice": ["Adobe"], "bob": ["Adobe", "LinkedIn"]},
+        )
+
+    def test_version_cursors(self):
+        self.assertEqual(snapshots.resolve_cursor(None, None), 0)
+        self.assertEqual(snapshots.resolve_cursor(None, "12"), 12)
+        with self.assertRaises(ParseError):
+            snapshots.resolve_cursor(None, "yesterday")
+
+
+class IndexedAccountTest(SimpleTestCase):
+    def setUp(self):
+        self.catalog = BreachCatalog(
+            [("Adobe", "adobe.com", False, None, '{"Name":"Adobe","IsVerified":true}')], [],
+        )
+
+    def lookup(self, account, breaches, query=None, row=(3, timezone.now())):
+        entries = mock.Mock()
+        entries.filter.return_value.values_list.return_value = breaches
+        with mock.patch.object(snapshots, "_latest_row", return_value=row), \
+                mock.patch.object(snapshots.DomainBreachEntry, "objects", entries):
+            resp = snapshots.indexed_account_get(account, query or {}, self.catalog)
+        return resp, entries
+
+    def test_answers_from_reverse_index(self):
+        resp, entries = self.lookup("Alice@dtu.dk", ["Adobe"])
+        self.assertEqual((resp.status_code, resp.content), (200, b'[{"Name":"Adobe"}]'))
+        entries.filter.assert_called_once_with(domain_id=3, alias="alice", removed_in__isnull=True)
+
+        resp, _ = self.lookup("bob@dtu.dk", [], {"truncateResponse": "false"})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_falls_back_for_unknown_domains_and_breaches(self):
+        self.assertIsNone(self.lookup("alice@example.com", ["Adobe"], row=None)[0])
+        self.assertIsNone(self.lookup("alice@dtu.dk", ["Unknown"])[0])
+        self.assertIsNone(snapshots.indexed_account_get("alice@dtu.dk", {}, None))
+
+
+@override_settings(HIBP_DOMAIN_SNAPSHOT_MAX_AGE=7 * 24 * 60 * 60)
+class SyncDomainSnapshotsTest(TestCase):
+    def setUp(self):
+        snapshots.get_body_cache().clear()
+        HIBPKey.objects.create(api_key="k" * 32)
+        self.domain = Domain.objects.create(name="dtu.dk", pwn_count=3)
+        snapshots.store_snapshot(self.domain, 200, BODY, keep=5)
+        long_ago = timezone.now() - timedelta(days=8)
+        DomainSnapshot.objects.update(created_at=long_ago, verified_at=long_ago)
+
+    def sync(self, response=None, stderr=None):
+        with mock.patch(
+            "api.management.commands.sync_domain_snapshots.pooled_get", return_value=response
+        ) as fetch:
+            call_command(
+                "sync_domain_snapshots", "--skip-import", stdout=StringIO(), stderr=stderr
+            )
+        return fetch
+
+    def test_inactive_keys_are_not_used(self):
+        cache.clear()
+        HIBPKey.objects.update(is_active=False)
+        Domain.objects.filter(pk=self.domain.pk).update(pwn_count=4)
+        stderr = StringIO()
+        self.sync(stderr=stderr).assert_not_called()
+        self.assertIn("No active HIBPKey", stderr.getvalue())
+
+    def test_subscribed_domains_are_fetched_through_the_key_pool(self):
+        response = mock.Mock(status_code=200)
+        response.json.return_value = [{
+            "DomainName": "dtu.eu", "PwnCount": 1, "PwnCountExcludingSpamLists": 1,
+            "PwnCountExcludingSpamListsAtLastSubscriptionRenewal": 1,
+            "NextSubscriptionRenewal": None,
+        }]
+        with mock.patch(
+            "api.management.commands.import_domain_data.pooled_get", return_value=response
+        ) as fetch:
+            call_command("import_domain_data", stdout=StringIO())
+        self.assertEqual(fetch.call_args.args[0], "subscribeddomains")
+        self.assertEqual(list(Domain.objects.values_list("name", flat=True)), ["dtu.eu"])
+
+    def test_unchanged_domain_is_verified_and_served_again(self):
+        self.assertIsNone(snapshots.latest_snapshot("dtu.dk"))
+
+        fetch = self.sync()
+
+        fetch.assert_not_called()
+        self.assertEqual(DomainSnapshot.objects.count(), 1)
+        resp = snapshots.latest_snapshot("dtu.dk")
+        self.assertEqual(resp.content, BODY)
+        self.assertLess(resp.age, 60)
+        # The reverse index is usable again as well.
+        self.assertIsNotNone(snapshots._latest_row("dtu.dk", fields=("domain_id", "verified_at")))
+
+    def test_domain_names_are_case_insensitive(self):
+        self.sync()
+        self.assertEqual(snapshots.latest_snapshot("DTU.dk").content, BODY)
+        Domain.objects.filter(pk=self.domain.pk).update(name="Dtu.Dk")
+        self.assertEqual(snapshots.latest_snapshot("dtu.dk").content, BODY)
+
+    def test_changed_domain_gets_a_new_version(self):
+        Domain.objects.filter(pk=self.domain.pk).update(pwn_count=4)
+        response = mock.Mock(status_code=200, content=b'{"alice":["Adobe"]}')
+
+        self.sync(response)
+
+        self.assertEqual(
+            list(DomainSnapshot.objects.order_by("version").values_list("version", "pwn_count")),
+            [(1, 3), (2, 4)],
+        )
+        self.assertEqual(snapshots.latest_snapshot("dtu.dk").content, b'{"alice":["Adobe"]}')
+
+
+class DomainChangesTest(TestCase):
+    def setUp(self):
+        self.domain = Domain.objects.create(name="dtu.dk", pwn_count=3)
+        self.start = timezone.now() - timedelta(days=10)
+
+    def store(self, body, keep=10):
+        snapshot = snapshots.store_snapshot(self.domain, 200, body, keep=keep)
+        # One snapshot a day from ``self.start`` on.
+        DomainSnapshot.objects.filter(pk=snapshot.pk).update(
+            created_at=self.start + timedelta(days=snapshot.version)
+        )
+        return snapshot
+
+    def changes(self, cursor):
+        return snapshots.domain_changes(self.domain, cursor)
+
+    def test_index_tracks_added_and_removed_pairs(self):
+        self.assertEqual(snapshots.index_snapshot(self.domain, 1, BODY), (3, 0))
+        self.assertEqual(
+            snapshots.index_snapshot(self.domain, 2, b'{"alice":["Adobe"],"carol":["Adobe"]}'),
+            (1, 2),
+        )
+        open_pairs = self.domain.breach_entries.filter(removed_in__isnull=True)
+        self.assertEqual(
+            set(open_pairs.values_list("alias", "breach")), {("alice", "Adobe"), ("carol", "Adobe")}
+        )
+
+    def test_add_remove_and_re_add(self):
+        self.store(BODY)
+        self.store(b'{"alice":["Adobe"],"bob":["Adobe"],"Carol":["Adobe"]}')
+        self.store(b'{"alice":["Adobe"],"bob":["Adobe","LinkedIn"],"carol":["Adobe"]}')
+
+        self.assertEqual(self.changes(None)["Added"], {
+            "alice": ["Adobe"], "bob": ["Adobe", "LinkedIn"], "carol": ["Adobe"],
+        })
+        # bob's LinkedIn breach went away in 2 and came back in 3.
+        since_1 = self.changes("1")
+        self.assertEqual((since_1["Added"], since_1["Removed"]), ({"carol": ["Adobe"]}, {}))
+        since_2 = self.changes("2")
+        self.assertEqual((since_2["Added"], since_2["Removed"]), ({"bob": ["LinkedIn"]}, {}))
+        self.assertEqual(self.changes("3")["Version"], 3)
+        with self.assertRaises(ParseError):
+            self.changes("4")
+
+    def test_timestamp_cursor(self):
+        self.store(BODY)
+        self.store(b'{"alice":["Adobe"]}')
+        between = (self.start + timedelta(days=1, hours=12)).isoformat()
+        self.assertEqual(self.changes(between)["Removed"], {"bob": ["Adobe", "LinkedIn"]})
+        # Before the first snapshot while nothing has been pruned: everything.
+        self.assertEqual(self.changes(self.start.isoformat())["Since"], 0)
+
+    def test_pruned_history_expires_cursors(self):
+        self.store(BODY)
+        self.store(b'{"alice":["Adobe"]}', keep=2)
+        self.store(b'{"alice":["Adobe"],"dave":["Adobe"]}', keep=2)
+        self.assertCountEqual(self.domain.snapshots.values_list("version", flat=True), [2, 3])
+        # Pairs removed before the oldest kept version are gone with it.
+        self.assertFalse(self.domain.breach_entries.filter(alias="bob").exists())
+
+        with self.assertRaises(snapshots.CursorExpired):
+            self.changes("1")
+        with self.assertRaises(snapshots.CursorExpired):
+            self.changes((self.start + timedelta(days=1, hours=12)).isoformat())
+        self.assertEqual(self.changes("2")["Added"], {"dave": ["Adobe"]})
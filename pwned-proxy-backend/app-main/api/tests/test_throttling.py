@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from api import counters
+from api.domain_index import DomainIndex
+from api.principal import AuthPrincipal, Limits
+from api.throttling import APIKeyRateThrottle
+
+PRINCIPAL = AuthPrincipal(7, 1, "test", "hash", DomainIndex())
+
+
+class ThreePerMinute(APIKeyRateThrottle):
+    THROTTLE_RATES = {"apikey": "3/min"}
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class APIKeyRateThrottleTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock(6000.0)  # start of a 60 s window
+
+    def throttle(self):
+        throttle = ThreePerMinute()
+        throttle.timer = self.clock
+        return throttle
+
+    def request(self, auth=PRINCIPAL):
+        return SimpleNamespace(auth=auth)
+
+    def test_unauthenticated_requests_are_not_throttled(self):
+        request = self.request(auth=None)
+        for _ in range(5):
+            self.assertTrue(self.throttle().allow_request(request, None))
+        self.assertFalse(hasattr(request, "rate_limit_headers"))
+
+    def test_limit_within_one_window(self):
+        results = []
+        for _ in range(4):
+            request = self.request()
+            results.append(self.throttle().allow_request(request, None))
+        self.assertEqual(results, [True, True, True, False])
+        self.assertEqual(request.rate_limit_headers["X-RateLimit-Limit"], "3")
+        self.assertEqual(request.rate_limit_headers["X-RateLimit-Remaining"], "0")
+        self.assertEqual(request.rate_limit_headers["X-RateLimit-Reset"], "60")
+
+    def test_rejected_requests_do_not_use_budget(self):
+        for _ in range(10):
+            self.throttle().allow_request(self.request(), None)
+        self.assertEqual(counters.get("throttle_apikey_7_100"), 3)
+
+    def test_previous_window_is_weighted_by_overlap(self):
+        for _ in range(3):
+            self.throttle().allow_request(self.request(), None)
+        # Half way into the next window half of the previous 3 still count.
+        self.clock.now = 6090.0
+        throttle = self.throttle()
+        self.assertTrue(throttle.allow_request(self.request(), None))
+        throttle = self.throttle()
+        self.assertFalse(throttle.allow_request(self.request(), None))
+        # 3 * (1 - t / 60) + 1 + 1 <= 3 once t >= 40, i.e. 10 s from now.
+        self.assertAlmostEqual(throttle.wait(), 10.0)
+
+    def test_wait_when_current_window_is_full(self):
+        throttle = None
+        for _ in range(4):
+            throttle = self.throttle()
+            throttle.allow_request(self.request(), None)
+        # 60 s until the window ends, then 3 * (1 - t / 60) + 1 <= 3 at t = 20.
+        self.assertAlmostEqual(throttle.wait(), 80.0)
+
+    def test_key_rate_overrides_default(self):
+        principal = AuthPrincipal(8, 1, "batch", "hash", DomainIndex(), Limits(rate="5/min"))
+        results = [self.throttle().allow_request(self.request(principal), None) for _ in range(6)]
+        self.assertEqual(results, [True] * 5 + [False])
+
+    @override_settings(HIBP_THROTTLE_BURST_WINDOW=10)
+    def test_burst_limits_short_windows_without_using_the_rate(self):
+        principal = AuthPrincipal(9, 1, "adhoc", "hash", DomainIndex(), Limits(burst=2))
+        results = [self.throttle().allow_request(self.request(principal), None) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(counters.get("throttle_apikey_9_100"), 2)
+        self.clock.now += 20
+        self.assertTrue(self.throttle().allow_request(self.request(principal), None))
+
+
+@override_settings(HIBP_COUNTER_BACKEND="database")
+class DatabaseCounterThrottleTest(APIKeyRateThrottleTest, TestCase):
+    """The same checks against the counter table used in production."""
+
+    def test_one_query_per_request(self):
+        principal = AuthPrincipal(9, 1, "adhoc", "hash", DomainIndex(), Limits(burst=2))
+        with self.assertNumQueries(1):
+            self.assertTrue(self.throttle().allow_request(self.request(principal), None))
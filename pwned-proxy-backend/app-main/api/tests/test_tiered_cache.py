@@ -0,0 +1,77 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from api.tiered_cache import TieredCache, namespace
+
+
+@override_settings(
+    HIBP_L1_CACHE_TTL=60,
+    HIBP_L1_CACHE_MAX_ENTRIES=3,
+    HIBP_CACHE_VERSION_CHECK_INTERVAL=0,
+)
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.tier = TieredCache("test")
+        self.other_worker = TieredCache("test")
+
+    def test_values_are_shared_through_l2(self):
+        self.tier.set("a", [1], 60)
+        self.assertEqual(self.other_worker.get("a"), [1])
+        self.assertIsNone(self.other_worker.get("missing"))
+
+    def test_l1_answers_without_l2(self):
+        self.tier.set("a", [1], 60)
+        with mock.patch("api.tiered_cache.shared_cache") as shared, \
+                mock.patch("api.tiered_cache.counters") as versions:
+            versions.get.return_value = self.tier._version
+            self.assertEqual(self.tier.get("a"), [1])
+        versions.get.assert_called_once()  # version check only
+        shared.get.assert_not_called()
+
+    def test_invalidate_reaches_other_workers(self):
+        self.tier.set("a", [1], 60)
+        self.assertEqual(self.other_worker.get("a"), [1])
+        self.tier.invalidate()
+        self.assertIsNone(self.other_worker.get("a"))
+        self.assertIsNone(self.tier.get("a"))
+
+    def test_namespaces_are_separate(self):
+        self.tier.set("a", [1], 60)
+        TieredCache("elsewhere").invalidate()
+        self.assertIsNone(TieredCache("elsewhere").get("a"))
+        self.assertEqual(self.other_worker.get("a"), [1])
+
+    def test_local_values_stay_local(self):
+        self.tier.set_local("a", [1], 60)
+        self.assertEqual(self.tier.get("a"), [1])
+        self.assertIsNone(self.other_worker.get("a"))
+
+    def test_l1_is_bounded(self):
+        for key in "abcd":
+            self.tier.set_local(key, key, 60)
+        self.assertLessEqual(len(self.tier._entries), 3)
+
+    def test_full_l1_drops_the_least_recently_used(self):
+        self.tier.set_local("hot", 1, 60)
+        for key in ["x1", "x2", "x3", "x4"]:
+            self.assertEqual(self.tier.get("hot"), 1)
+            self.tier.set_local(key, None, 60)
+        self.assertCountEqual(self.tier._entries, ["hot", "x3", "x4"])
+
+    def test_lost_version_does_not_revive_old_keys(self):
+        self.tier.set("a", [1], 60)
+        cache.delete("ns:test:version")  # evicted
+        later = time.time_ns() + 10**9
+        with mock.patch("api.tiered_cache.time.time_ns", return_value=later):
+            self.assertIsNone(self.other_worker.get("a"))
+
+    def test_namespace_is_a_process_wide_singleton(self):
+        self.assertIs(namespace("x"), namespace("x"))
+
+    async def test_async_access(self):
+        await self.tier.aset("a", [1], 60)
+        self.assertEqual(await self.other_worker.aget("a"), [1])
@@ -0,0 +1,39 @@
+from unittest import mock
+
+import requests
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+
+from api import upstream
+
+
+class UpstreamClientTest(SimpleTestCase):
+    def test_timeout_is_chosen_per_endpoint(self):
+        with override_settings(HIBP_TIMEOUTS={"default": (1, 2), "breacheddomain": (1, 60)}):
+            self.assertEqual(upstream.get_timeout("breacheddomain/dtu.dk"), (1, 60))
+            self.assertEqual(upstream.get_timeout("/breaches?Domain=adobe.com"), (1, 2))
+
+    def test_session_is_shared(self):
+        self.assertIs(upstream.get_session(), upstream.get_session())
+
+    def test_timeout_raises_gateway_timeout(self):
+        with mock.patch.object(upstream.get_session(), "get", side_effect=requests.ReadTimeout):
+            with self.assertRaises(upstream.UpstreamTimeout):
+                upstream.upstream_get("breaches", "key")
+
+    def test_connection_error_raises_bad_gateway(self):
+        with mock.patch.object(upstream.get_session(), "get", side_effect=requests.ConnectionError):
+            with self.assertRaises(upstream.UpstreamUnavailable):
+                upstream.upstream_get("breaches", "key")
+
+    def test_async_client_is_closed_with_its_loop(self):
+        async def client():
+            first = upstream.get_async_client()
+            self.assertIs(upstream.get_async_client(), first)
+            return first
+
+        first = async_to_sync(client)()
+        self.assertTrue(first.is_closed)
+        second = async_to_sync(client)()
+        self.assertIsNot(second, first)
+        self.assertTrue(second.is_closed)
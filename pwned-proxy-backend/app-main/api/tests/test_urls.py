@@ -7,7 +7,9 @@ class URLPatternsTest(SimpleTestCase):
     def test_all_endpoints_resolve(self):
         tests = [
             ("breached-domain", {"domain": "dtu.dk"}, views.BreachedDomainProxyView),
+            ("breached-domain-changes", {"domain": "dtu.dk"}, views.BreachedDomainChangesView),
             ("breached-account", {"account": "user@dtu.dk"}, views.BreachedAccountProxyView),
+            ("breached-accounts", {}, views.BulkBreachedAccountProxyView),
             ("paste-account", {"account": "user@dtu.dk"}, views.PasteAccountProxyView),
             ("subscribed-domains", {}, views.SubscribedDomainsProxyView),
             ("stealer-logs-by-email", {"email": "user@dtu.dk"}, views.StealerLogsByEmailProxyView),
@@ -18,6 +20,8 @@ class URLPatternsTest(SimpleTestCase):
             ("latest-breach", {}, views.LatestBreachProxyView),
             ("data-classes", {}, views.DataClassesProxyView),
             ("subscription-status", {}, views.SubscriptionStatusProxyView),
+            ("upstream-health", {}, views.UpstreamHealthView),
+            ("usage", {}, views.UsageView),
             ("group-names", {}, views.GroupNamesView),
         ]
         for name, kwargs, view in tests:
@@ -0,0 +1,160 @@
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.exceptions import ParseError
+
+from api import log_writer, usage
+from api.domain_index import DomainIndex
+from api.models import APIKey, Endpoint, EndpointLog, EndpointUsage
+from api.principal import AuthPrincipal, get_principal, principals
+
+PRINCIPAL = AuthPrincipal(1, 2, "test", "hash", DomainIndex())
+
+
+def log(minute, status=200, endpoint="breached-account", api_key_id=1, group_id=2, hour=10):
+    return EndpointLog(
+        api_key_id=api_key_id,
+        group_id=group_id,
+        endpoint=Endpoint(name=endpoint),
+        status_code=status,
+        created_at=datetime(2024, 5, 1, hour, minute, tzinfo=dt_timezone.utc),
+    )
+
+
+class RollupTest(SimpleTestCase):
+    def test_counts_per_hour_and_status_class(self):
+        counts = usage.rollup_counts([
+            log(1), log(59, status=204), log(5, status=404), log(1, hour=11), log(2, api_key_id=None, group_id=None),
+        ])
+        ten = datetime(2024, 5, 1, 10, tzinfo=dt_timezone.utc)
+        eleven = datetime(2024, 5, 1, 11, tzinfo=dt_timezone.utc)
+        self.assertEqual(counts[(ten, 2, 1, "breached-account", 2)], 2)
+        self.assertEqual(counts[(ten, 2, 1, "breached-account", 4)], 1)
+        self.assertEqual(counts[(eleven, 2, 1, "breached-account", 2)], 1)
+        self.assertEqual(counts[(ten, None, None, "breached-account", 2)], 1)
+
+    def test_add_usage_upserts_increments_in_one_statement(self):
+        with mock.patch("api.usage.connection") as connection:
+            usage.add_usage([log(1), log(2), log(3, api_key_id=None, group_id=None)])
+        cursor = connection.cursor.return_value.__enter__.return_value
+        sql, params = cursor.execute.call_args[0]
+        self.assertIn("ON CONFLICT (hour, COALESCE(group_id, 0), COALESCE(api_key_id, 0)", sql)
+        self.assertIn("count = api_endpointusage.count + EXCLUDED.count", sql)
+        # Two rollup rows, anonymous first (sorted), six values each.
+        self.assertEqual(len(params), 12)
+        self.assertEqual(params[1:3], [None, None])
+        self.assertEqual(params[-1], 2)
+
+    def test_add_usage_skips_empty_batches(self):
+        with mock.patch("api.usage.connection") as connection:
+            usage.add_usage([])
+        connection.cursor.assert_not_called()
+
+
+class UsageReportTest(SimpleTestCase):
+    def test_period_defaults_to_the_last_day(self):
+        since, until = usage.parse_period(None, "2024-05-02T00:00:00Z")
+        self.assertEqual(since, datetime(2024, 5, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(until, datetime(2024, 5, 2, tzinfo=dt_timezone.utc))
+
+    def test_period_is_validated(self):
+        with self.assertRaises(ParseError):
+            usage.parse_period("yesterday", None)
+        with self.assertRaises(ParseError):
+            usage.parse_period("2024-05-02T00:00:00Z", "2024-05-01T00:00:00Z")
+
+    def test_report_rejects_unknown_options(self):
+        since, until = usage.parse_period(None, None)
+        with self.assertRaises(ParseError):
+            usage.usage_report(PRINCIPAL, since, until, bucket="week")
+        with self.assertRaises(ParseError):
+            usage.usage_report(PRINCIPAL, since, until, scope="everyone")
+
+
+@override_settings(HIBP_LOG_QUEUE_SIZE=0)
+class UsageDatabaseTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        principals.clear_local()
+        # Dictionary rows cached by earlier tests were rolled back.
+        patcher = mock.patch.dict(log_writer._endpoints, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.group = Group.objects.create(name="DTU")
+        self.key, self.raw_key = APIKey.create_api_key(self.group, name="one")
+        self.other, _ = APIKey.create_api_key(self.group, name="two")
+
+    def log(self, hour, minute=0, api_key=None, status=200, endpoint="breached-account"):
+        return log(
+            minute, status=status, endpoint=endpoint, hour=hour,
+            api_key_id=(api_key or self.key).pk, group_id=self.group.pk,
+        )
+
+    def principal(self):
+        return get_principal(self.key.key)
+
+    def report(self, **options):
+        since = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+        until = datetime(2024, 5, 2, tzinfo=dt_timezone.utc)
+        return usage.usage_report(self.principal(), since, until, **options)
+
+    def test_batches_add_to_the_same_row(self):
+        log_writer.write_logs([self.log(10, 1), self.log(10, 2)])
+        log_writer.write_logs([self.log(10, 3), self.log(10, 4, status=404)])
+        counts = dict(EndpointUsage.objects.values_list("status_class", "count"))
+        self.assertEqual(counts, {2: 3, 4: 1})
+
+    def test_rebuild_from_since(self):
+        log_writer.write_logs([self.log(10), self.log(11), self.log(11, 30)])
+        EndpointUsage.objects.update(count=99)
+        written = usage.rebuild_usage(datetime(2024, 5, 1, 11, 15, tzinfo=dt_timezone.utc))
+        self.assertEqual(written, 1)
+        counts = dict(EndpointUsage.objects.values_list("hour__hour", "count"))
+        self.assertEqual(counts, {10: 99, 11: 2})
+        usage.rebuild_usage()
+        counts = dict(EndpointUsage.objects.values_list("hour__hour", "count"))
+        self.assertEqual(counts, {10: 1, 11: 2})
+
+    def test_hour_and_day_buckets_per_key_and_group(self):
+        log_writer.write_logs([
+            self.log(10), self.log(11), self.log(11, status=500), self.log(10, api_key=self.other),
+        ])
+        by_hour = self.report()
+        self.assertEqual(by_hour["Total"], 3)
+        self.assertEqual(
+            [(row["Period"][11:13], row["Status"], row["Count"]) for row in by_hour["Usage"]],
+            [("10", "2xx", 1), ("11", "2xx", 1), ("11", "5xx", 1)],
+        )
+        group_by_hour = self.report(scope="group")
+        self.assertEqual(group_by_hour["Usage"][0]["Count"], 2)
+        self.assertEqual(group_by_hour["Total"], 4)
+        group_by_day = self.report(scope="group", bucket="day")
+        self.assertEqual(
+            [(row["Status"], row["Count"]) for row in group_by_day["Usage"]],
+            [("2xx", 3), ("5xx", 1)],
+        )
+
+    def test_usage_view(self):
+        log_writer.write_logs([self.log(10), self.log(10, api_key=self.other)])
+        resp = self.client.get(
+            "/api/v3/usage",
+            {"since": "2024-05-01T00:00:00Z", "until": "2024-05-02T00:00:00Z", "scope": "group"},
+            HTTP_X_API_KEY=self.raw_key,
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["Total"], 2)
+        resp = self.client.get("/api/v3/usage", {"bucket": "week"}, HTTP_X_API_KEY=self.raw_key)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_admin_changelist_shows_the_filtered_total(self):
+        log_writer.write_logs([
+            self.log(10), self.log(10, 5), self.log(10, endpoint="paste-account"),
+        ])
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        resp = self.client.get("/admin/api/endpointusage/")
+        self.assertEqual(resp.context_data["total_requests"], 3)
+        resp = self.client.get("/admin/api/endpointusage/", {"endpoint": "paste-account"})
+        self.assertEqual(resp.context_data["total_requests"], 1)
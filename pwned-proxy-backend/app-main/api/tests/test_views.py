@@ -0,0 +1,138 @@
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from api import counters, log_writer, quotas, request_stats, views
+from api.domain_index import DomainIndex
+from api.models import APIKey, Domain, EndpointLog
+from api.principal import AuthPrincipal, Limits, principals
+
+LIMITED = AuthPrincipal(3, 1, "limited", "hash", DomainIndex(), Limits(max_concurrent=1))
+
+
+class UpstreamResponse:
+    def __init__(self, content, headers=None, status_code=200):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {"Content-Type": "application/json; charset=utf-8"}
+        self.close = mock.Mock()
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+
+class MakeResponseTest(SimpleTestCase):
+    def test_body_is_passed_through_unparsed(self):
+        body = b'{"alias":["Adobe"]}'
+        resp = UpstreamResponse(body, {"Content-Type": "application/json", "Retry-After": "2"}, 429)
+        with mock.patch("json.loads") as loads:
+            response = views.make_response(resp)
+        loads.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.content, body)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response["Retry-After"], "2")
+
+    def test_streamed_body_is_forwarded_in_chunks_and_closed(self):
+        body = b"x" * 200_000
+        resp = UpstreamResponse(body)
+        response = views.make_response(resp, stream=True)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b"".join(response.streaming_content), body)
+        response.close()
+        resp.close.assert_called_once()
+
+
+@override_settings(HIBP_CONCURRENCY_SLOT_TTL=300)
+class StreamedUpstreamSlotTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def stream(self):
+        with mock.patch("api.views.circuit_get", return_value=UpstreamResponse(b"x" * 10)):
+            return views.make_response(
+                views.hibp_get("breacheddomain/dtu.dk", stream=True), stream=True
+            )
+
+    def test_slot_is_held_until_the_body_is_sent(self):
+        with quotas.acting_as(LIMITED):
+            response = self.stream()
+            self.assertEqual(counters.get("concurrency_apikey_3"), 1)
+            with self.assertRaises(quotas.TooManyConcurrentCalls):
+                self.stream()
+            self.assertEqual(b"".join(response.streaming_content), b"x" * 10)
+            response.close()
+            self.assertEqual(counters.get("concurrency_apikey_3"), 0)
+
+    def test_call_is_timed_until_the_body_is_sent(self):
+        token = request_stats.bind()
+        self.addCleanup(request_stats.unbind, token)
+        response = self.stream()
+        self.assertEqual(request_stats.current().upstream_calls, 0)
+        b"".join(response.streaming_content)
+        response.close()
+        self.assertEqual(request_stats.current().upstream_calls, 1)
+        self.assertEqual(request_stats.current().upstream_status, 200)
+
+    def test_unsent_body_gives_the_slot_back(self):
+        with quotas.acting_as(LIMITED):
+            self.stream().close()
+            self.stream().close()
+        self.assertEqual(counters.get("concurrency_apikey_3"), 0)
+@override_settings(HIBP_HEALTH_ALLOWED_NETWORKS=["10.0.0.0/8", "::1"], HIBP_LOG_QUEUE_SIZE=0)
+class UpstreamHealthTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Dictionary rows cached by earlier tests were rolled back.
+        patcher = mock.patch.dict(log_writer._endpoints, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = reverse("upstream-health")
+
+    def test_outside_clients_are_refused(self):
+        resp = self.client.get(self.url, REMOTE_ADDR="203.0.113.5")
+        self.assertEqual(resp.status_code, 403)
+        self.assertNotIn("circuits", resp.json())
+
+    def test_allowed_networks_see_the_report(self):
+        for address in ["10.1.2.3", "::1"]:
+            with self.subTest(address=address):
+                resp = self.client.get(self.url, REMOTE_ADDR=address)
+                self.assertEqual(resp.status_code, 200)
+                self.assertIn("circuits", resp.json())
+                self.assertIn("log_writer", resp.json())
+
+    def test_staff_only(self):
+        user = User.objects.create_user("ops")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR="203.0.113.5").status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR="203.0.113.5").status_code, 200)
+
+
+@override_settings(HIBP_LOG_QUEUE_SIZE=0, HIBP_STREAM_ENDPOINTS={"breacheddomain"})
+class StreamedLogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        principals.clear_local()
+        # Dictionary rows cached by earlier tests were rolled back.
+        patcher = mock.patch.dict(log_writer._endpoints, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        domain = Domain.objects.create(name="dtu.dk")
+        _key, self.raw_key = APIKey.create_api_key(Group.objects.create(name="DTU"), [domain])
+
+    def test_row_is_logged_once_the_body_is_sent(self):
+        with mock.patch("api.views.circuit_get", return_value=UpstreamResponse(b"x" * 10)):
+            response = self.client.get("/api/v3/breacheddomain/dtu.dk", HTTP_X_API_KEY=self.raw_key)
+        self.assertTrue(response.streaming)
+        self.assertFalse(EndpointLog.objects.exists())
+        b"".join(response.streaming_content)  # the test client closes it
+        row = EndpointLog.objects.get()
+        self.assertEqual((row.status_code, row.upstream_status), (200, 200))
+        self.assertIsNotNone(row.upstream_ms)
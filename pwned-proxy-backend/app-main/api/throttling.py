@@ -1,11 +1,129 @@
+# api/throttling.py
+"""
+Per API key request throttle.
+
+DRF's ``SimpleRateThrottle`` keeps a list with one timestamp per request in
+the cache and re-pickles it on every call.  ``APIKeyRateThrottle`` uses a
+sliding-window counter instead: one counter per key and fixed window,
+incremented atomically (``api/counters.py``), and the previous window's count
+weighted by how much of it still overlaps the sliding window::
+
+    used = previous * (1 - elapsed / duration) + current
+
+One round trip to the counters counts the request in every current window
+and reads the previous ones.
+The throttle keys on the already-authenticated ``AuthPrincipal``, so both
+the ``X-API-Key`` and the ``hibp-api-key`` header are limited, and a rotated
+key keeps its budget.  The rate comes from the key's (or its group's) quota,
+falling back to ``DEFAULT_THROTTLE_RATES["apikey"]``; a ``burst`` quota adds
+a second window of ``HIBP_THROTTLE_BURST_WINDOW`` seconds.  The outcome is
+left on the request as ``X-RateLimit-*`` headers for the views to copy onto
+the response.
+"""
+import math
+
+from django.conf import settings
 from rest_framework.throttling import SimpleRateThrottle
-from .models import hash_api_key
+
+from . import counters
+from .principal import AuthPrincipal
+
+
+class SlidingWindow:
+    """Sliding-window counter ``name`` allowing ``limit`` hits per ``duration``."""
+
+    def __init__(self, name: str, limit: int, duration: float):
+        self.name = name
+        self.limit = limit
+        self.duration = duration
+
+    def start(self, now: float) -> None:
+        """Pick the counters of the window ``now`` falls into."""
+        window, self.elapsed = divmod(now, self.duration)
+        self.current = f"{self.name}_{int(window)}"
+        self.previous = f"{self.name}_{int(window) - 1}"
+        self.reset = self.duration - self.elapsed
+
+    @property
+    def ttl(self) -> int:
+        # Counters live for two windows: their own and the one after it.
+        return math.ceil(self.duration * 2)
+
+    def check(self, counts: dict) -> bool:
+        """Whether the hit counted in ``counts`` fits into the window."""
+        count = counts[self.current]
+        previous = counts.get(self.previous, 0)
+        self.used = previous * (1 - self.elapsed / self.duration) + count
+        if self.used <= self.limit:
+            return True
+        self.retry_after = self._retry_after(previous, count - 1, self.elapsed)
+        return False
+
+    @property
+    def remaining(self) -> int:
+        return max(0, math.floor(self.limit - self.used))
+
+    def _retry_after(self, previous: int, current: int, elapsed: float) -> float:
+        """Seconds until one more request fits into the sliding window."""
+        budget = self.limit - 1 - current
+        if budget < 0:
+            # This window alone is full: wait for it to end and then for it
+            # to slide out far enough.
+            return self.reset + self.duration * (1 - (self.limit - 1) / current)
+        if not previous:  # pragma: no cover - cannot be over the limit
+            return self.reset
+        # previous * (1 - t / duration) + current + 1 <= limit
+        return max(0.0, self.duration * (1 - budget / previous) - elapsed)
+
 
 class APIKeyRateThrottle(SimpleRateThrottle):
     scope = 'apikey'
 
     def get_cache_key(self, request, view):
-        api_key = request.headers.get('X-API-Key')
-        if not api_key:
+        principal = getattr(request, "auth", None)
+        if not isinstance(principal, AuthPrincipal):
             return None
-        return f"apikey_{hash_api_key(api_key)}"
+        return f"throttle_{self.scope}_{principal.api_key_id}"
+
+    def allow_request(self, request, view):
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        limits = request.auth.limits
+        if limits.rate:
+            self.rate = limits.rate
+            self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.rate is None:
+            return True
+
+        now = self.timer()
+        rate = SlidingWindow(key, self.num_requests, self.duration)
+        windows = [rate]
+        if limits.burst:
+            windows.append(SlidingWindow(
+                f"{key}_burst", limits.burst, settings.HIBP_THROTTLE_BURST_WINDOW
+            ))
+        for window in windows:
+            window.start(now)
+        # One round trip counts the hit in every current window and reads the
+        # previous ones.
+        counts = counters.incr_many(
+            {window.current: window.ttl for window in windows},
+            read=[window.previous for window in windows],
+        )
+        rejected = [window for window in windows if not window.check(counts)]
+        allowed = not rejected
+        if rejected:
+            # Rejected requests do not use up budget.
+            counters.decr_many([window.current for window in windows])
+            self.retry_after = max(window.retry_after for window in rejected)
+
+        request.rate_limit_headers = {
+            "X-RateLimit-Limit": str(self.num_requests),
+            "X-RateLimit-Remaining": str(rate.remaining if allowed else 0),
+            "X-RateLimit-Reset": str(math.ceil(rate.reset)),
+        }
+        return allowed
+
+    def wait(self):
+        return self.retry_after
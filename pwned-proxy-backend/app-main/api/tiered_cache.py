@@ -0,0 +1,178 @@
+# api/tiered_cache.py
+"""
+Two-level cache for read-mostly data.
+
+The Django ``default`` cache is the shared L2 (Postgres or Redis, see
+``CACHES`` in settings) that all workers on all nodes see.  In front of it,
+each process keeps a small L1 of recently read values so hot keys such as
+API key principals, the HIBP key list or catalog responses do not cost a
+round trip to L2 on every request.
+
+Keys are grouped in namespaces.  Every namespace has a version number,
+kept in a shared counter (``api/counters.py``), that is part of its keys, so
+``invalidate()`` drops a whole namespace on every worker with one
+increment: the old keys are simply never read again and expire.  Workers
+compare their L1 against the version at most every
+``HIBP_CACHE_VERSION_CHECK_INTERVAL`` seconds, and L1 entries live at most
+``HIBP_L1_CACHE_TTL`` seconds.
+
+Locks (coalescing) must be atomic and use the shared cache directly
+instead.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+
+from . import counters
+
+_MISSING = object()
+
+
+class TieredCache:
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._entries = OrderedDict()  # key -> (expires_at, value), LRU order
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = float("-inf")
+
+    # -- reads ----------------------------------------------------------
+
+    def get(self, key: str, default=None, *, skip_local: bool = False):
+        now = time.monotonic()
+        version = self._current_version(now)
+        if not skip_local:
+            value = self._local(key, now)
+            if value is not _MISSING:
+                return value
+        value = shared_cache.get(self._shared_key(key, version), _MISSING)
+        if value is _MISSING:
+            return default
+        self.set_local(key, value, settings.HIBP_L1_CACHE_TTL)
+        return value
+
+    async def aget(self, key: str, default=None, *, skip_local: bool = False):
+        now = time.monotonic()
+        version = await self._acurrent_version(now)
+        if not skip_local:
+            value = self._local(key, now)
+            if value is not _MISSING:
+                return value
+        value = await shared_cache.aget(self._shared_key(key, version), _MISSING)
+        if value is _MISSING:
+            return default
+        self.set_local(key, value, settings.HIBP_L1_CACHE_TTL)
+        return value
+
+    # -- writes ---------------------------------------------------------
+
+    def set(self, key: str, value, timeout: float) -> None:
+        version = self._current_version(time.monotonic())
+        shared_cache.set(self._shared_key(key, version), value, timeout)
+        self.set_local(key, value, timeout)
+
+    async def aset(self, key: str, value, timeout: float) -> None:
+        version = await self._acurrent_version(time.monotonic())
+        await shared_cache.aset(self._shared_key(key, version), value, timeout)
+        self.set_local(key, value, timeout)
+
+    def set_local(self, key: str, value, timeout: float) -> None:
+        """
+        Keep ``value`` in this process only, e.g. for negative results.
+        Never touches L2, so it is safe to call from async code.
+        """
+        ttl = min(timeout, settings.HIBP_L1_CACHE_TTL)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            # Bound memory by dropping the least recently used entries, so a
+            # flood of new keys (e.g. guessed API keys) cannot flush hot ones.
+            while len(self._entries) > settings.HIBP_L1_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        version = self._current_version(time.monotonic())
+        with self._lock:
+            self._entries.pop(key, None)
+        shared_cache.delete(self._shared_key(key, version))
+
+    def invalidate(self) -> None:
+        """Drop every key of this namespace on all workers."""
+        version = counters.incr(self._version_key(), initial=self._clock())
+        self._sync_version(version, time.monotonic())
+
+    def clear_local(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._version_checked_at = float("-inf")
+
+    # -- internals ------------------------------------------------------
+
+    def _version_key(self) -> str:
+        return f"ns:{self.namespace}:version"
+
+    def _shared_key(self, key: str, version) -> str:
+        return f"{self.namespace}:{version}:{key}"
+
+    def _local(self, key: str, now: float):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] <= now:
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _current_version(self, now: float):
+        if now - self._version_checked_at >= settings.HIBP_CACHE_VERSION_CHECK_INTERVAL:
+            name = self._version_key()
+            version = counters.get(name)
+            if version is None:
+                counters.add(name, self._clock())
+                version = counters.get(name)
+            self._sync_version(version, now)
+        return self._version
+
+    async def _acurrent_version(self, now: float):
+        if now - self._version_checked_at >= settings.HIBP_CACHE_VERSION_CHECK_INTERVAL:
+            name = self._version_key()
+            version = await counters.aget(name)
+            if version is None:
+                await counters.aadd(name, self._clock())
+                version = await counters.aget(name)
+            self._sync_version(version, now)
+        return self._version
+
+    @staticmethod
+    def _clock() -> int:
+        # Versions start from the clock rather than 0 so a version lost to
+        # eviction never comes back to an older one whose keys may still exist.
+        return time.time_ns() // 1_000_000
+
+    def _sync_version(self, version, now: float) -> None:
+        with self._lock:
+            if version != self._version:
+                # Entries stored before the first check (``set_local``) are
+                # newer than any version seen so far and stay.
+                if self._version is not None:
+                    self._entries.clear()
+                self._version = version
+            self._version_checked_at = now
+
+
+_namespaces = {}
+_namespaces_lock = threading.Lock()
+
+
+def namespace(name: str) -> TieredCache:
+    """Return the process-wide ``TieredCache`` of namespace ``name``."""
+    tier = _namespaces.get(name)
+    if tier is None:
+        with _namespaces_lock:
+            tier = _namespaces.setdefault(name, TieredCache(name))
+    return tier
@@ -0,0 +1,212 @@
+# api/upstream.py
+"""
+Process-wide HTTP client for the HIBP API.
+
+Every gunicorn worker keeps one ``requests.Session`` with a sized urllib3
+connection pool, so proxied calls reuse keep-alive TLS connections to
+haveibeenpwned.com instead of paying a new TCP+TLS handshake each time.
+Each call is bounded by a (connect, read) timeout chosen per endpoint.
+
+The ASGI views (``api/async_views.py``) use an ``httpx.AsyncClient`` with
+the same timeouts instead, one per event loop, closed when the loop shuts
+down.
+"""
+import asyncio
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+USER_AGENT = "pwned_proxy_app/1.0"
+
+
+class UpstreamTimeout(APIException):
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = "Upstream HIBP request timed out."
+    default_code = "upstream_timeout"
+
+
+class UpstreamUnavailable(APIException):
+    status_code = status.HTTP_502_BAD_GATEWAY
+    default_detail = "Could not reach the upstream HIBP API."
+    default_code = "upstream_unavailable"
+
+
+_session = None
+_session_lock = threading.Lock()
+
+# Simple per-process counters exposed by ``pool_stats``.
+_stats_lock = threading.Lock()
+_stats = {
+    "requests": 0,
+    "errors": 0,
+    "timeouts": 0,
+    "total_time": 0.0,
+}
+
+
+def get_session() -> requests.Session:
+    """
+    Return the per-process session, creating it on first use.
+
+    The session is created lazily so that each gunicorn worker builds its
+    own pool after the fork instead of sharing sockets with the master.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=settings.HIBP_POOL_CONNECTIONS,
+                    pool_maxsize=settings.HIBP_POOL_MAXSIZE,
+                    pool_block=settings.HIBP_POOL_BLOCK,
+                    max_retries=0,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"User-Agent": USER_AGENT})
+                _session = session
+    return _session
+
+
+def get_timeout(path: str) -> tuple[float, float]:
+    """Return the (connect, read) timeout configured for ``path``."""
+    endpoint = path.lstrip("/").split("/", 1)[0].split("?", 1)[0]
+    timeouts = settings.HIBP_TIMEOUTS
+    return tuple(timeouts.get(endpoint, timeouts["default"]))
+
+
+def build_url(path: str) -> str:
+    return f"{settings.HIBP_API_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
+
+
+def upstream_get(path: str, api_key: str, **kwargs) -> requests.Response:
+    """
+    GET ``path`` from the HIBP API through the pooled session.
+
+    Raises ``UpstreamTimeout`` or ``UpstreamUnavailable`` (both DRF
+    ``APIException`` subclasses) instead of blocking the worker forever.
+    """
+    headers = {"hibp-api-key": api_key}
+    headers.update(kwargs.pop("headers", {}))
+    kwargs.setdefault("timeout", get_timeout(path))
+
+    start = time.monotonic()
+    try:
+        return get_session().get(build_url(path), headers=headers, **kwargs)
+    except requests.Timeout:
+        _record(start, timeout=True)
+        raise UpstreamTimeout()
+    except requests.RequestException:
+        _record(start, error=True)
+        raise UpstreamUnavailable()
+    finally:
+        with _stats_lock:
+            _stats["requests"] += 1
+            _stats["total_time"] += time.monotonic() - start
+
+
+# loop -> (client, lifetime); an entry goes away with its loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Return the pooled async client of the running event loop.  The client
+    is closed when its loop shuts down, so a process that runs several
+    loops (``async_to_sync`` starts one per call) does not leak their
+    connection pools.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.HIBP_ASYNC_POOL_MAXSIZE,
+                max_keepalive_connections=settings.HIBP_ASYNC_POOL_MAXSIZE,
+            ),
+            headers={"User-Agent": USER_AGENT},
+        )
+        lifetime = _close_with_loop(client)
+        # Starting the generator registers it with the loop; asyncio.run and
+        # async_to_sync close such generators before they close the loop.
+        asyncio.ensure_future(lifetime.__anext__())
+        entry = _async_clients[loop] = (client, lifetime)
+    return entry[0]
+
+
+async def _close_with_loop(client: httpx.AsyncClient):
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+async def upstream_aget(path: str, api_key: str) -> httpx.Response:
+    """Async counterpart of ``upstream_get``."""
+    connect, read = get_timeout(path)
+    start = time.monotonic()
+    try:
+        return await get_async_client().get(
+            build_url(path),
+            headers={"hibp-api-key": api_key},
+            timeout=httpx.Timeout(read, connect=connect),
+        )
+    except httpx.TimeoutException:
+        _record(start, timeout=True)
+        raise UpstreamTimeout()
+    except httpx.HTTPError:
+        _record(start, error=True)
+        raise UpstreamUnavailable()
+    finally:
+        with _stats_lock:
+            _stats["requests"] += 1
+            _stats["total_time"] += time.monotonic() - start
+
+
+def _record(start: float, *, timeout: bool = False, error: bool = False) -> None:
+    with _stats_lock:
+        if timeout:
+            _stats["timeouts"] += 1
+        if error or timeout:
+            _stats["errors"] += 1
+
+
+def pool_stats() -> dict:
+    """Return a snapshot of the connection pool state for this process."""
+    with _stats_lock:
+        counters = dict(_stats)
+    requests_made = counters.pop("requests")
+    total_time = counters.pop("total_time")
+
+    pools = []
+    if _session is not None:
+        adapter = _session.get_adapter(build_url(""))
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                "host": pool.host,
+                "port": pool.port,
+                "maxsize": pool.pool.maxsize if pool.pool else 0,
+                "idle_connections": pool.pool.qsize() if pool.pool else 0,
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+            })
+
+    return {
+        "pool_maxsize": settings.HIBP_POOL_MAXSIZE,
+        "requests": requests_made,
+        "errors": counters["errors"],
+        "timeouts": counters["timeouts"],
+        "avg_latency_ms": round(total_time / requests_made * 1000, 2) if requests_made else None,
+        "pools": pools,
+    }
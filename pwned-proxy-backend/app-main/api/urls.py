@@ -4,7 +4,9 @@ from django.urls import path
 from .views import (
     # Core proxies
     BreachedDomainProxyView,
+    BreachedDomainChangesView,
     BreachedAccountProxyView,
+    BulkBreachedAccountProxyView,
     # Extended HIBP v3
     PasteAccountProxyView,
     SubscribedDomainsProxyView,
@@ -16,6 +18,8 @@ from .views import (
     LatestBreachProxyView,
     DataClassesProxyView,
     SubscriptionStatusProxyView,
+    UpstreamHealthView,
+    UsageView,
     GroupNamesView,
 )
 
@@ -26,11 +30,21 @@ urlpatterns = [
         BreachedDomainProxyView.as_view(),
         name="breached-domain",
     ),
+    path(
+        "breacheddomain/<str:domain>/changes",
+        BreachedDomainChangesView.as_view(),
+        name="breached-domain-changes",
+    ),
     path(
         "breachedaccount/<path:account>",
         BreachedAccountProxyView.as_view(),
         name="breached-account",
     ),
+    path(
+        "breachedaccounts",
+        BulkBreachedAccountProxyView.as_view(),
+        name="breached-accounts",
+    ),
     # Extended
     path("pasteaccount/<path:account>", PasteAccountProxyView.as_view(), name="paste-account"),
     path(
@@ -62,5 +76,7 @@ urlpatterns = [
         SubscriptionStatusProxyView.as_view(),
         name="subscription-status",
     ),
+    path("upstream/health", UpstreamHealthView.as_view(), name="upstream-health"),
+    path("usage", UsageView.as_view(), name="usage"),
     path("group-names", GroupNamesView.as_view(), name="group-names"),
 ]
@@ -0,0 +1,195 @@
+# api/usage.py
+"""
+Usage and latency reports of ``EndpointLog``.
+
+``add_usage`` folds a batch of new log rows into ``EndpointUsage`` with one
+``INSERT ... ON CONFLICT DO UPDATE`` that adds to the existing counts; the
+log writer (``api/log_writer.py``) calls it in the transaction that
+inserts the rows.  ``usage_report`` answers the usage API and
+``rebuild_usage`` recomputes rollups from the raw log, e.g. for rows logged
+before the rollups existed.
+
+``latency_report`` computes duration percentiles per endpoint or group from
+the raw log with PostgreSQL's ``percentile_cont``.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Aggregate, Count, FloatField, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ParseError
+
+from .models import Endpoint, EndpointLog, EndpointUsage
+
+BUCKETS = {"hour": TruncHour, "day": TruncDay}
+
+# Report columns grouped by: --by endpoint / --by group
+LATENCY_GROUPINGS = {"endpoint": "endpoint__name", "group": "group__name"}
+PERCENTILES = (50, 95, 99)
+
+
+class Percentile(Aggregate):
+    """Continuous percentile of an expression (PostgreSQL ``percentile_cont``)."""
+
+    function = "percentile_cont"
+    template = "%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, percent: int, **extra):
+        super().__init__(expression, fraction=percent / 100, **extra)
+
+
+def truncate_hour(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_counts(logs) -> Counter:
+    """Count ``logs`` per (hour, group, key, endpoint, status class)."""
+    return Counter(
+        (
+            truncate_hour(log.created_at),
+            log.group_id,
+            log.api_key_id,
+            log.endpoint.name,
+            log.status_code // 100,
+        )
+        for log in logs
+    )
+
+
+def add_usage(logs) -> None:
+    counts = rollup_counts(logs)
+    if not counts:
+        return
+    # A fixed order keeps concurrent writers from deadlocking on the rows.
+    rows = sorted(counts.items(), key=lambda item: (
+        item[0][0], item[0][1] or 0, item[0][2] or 0, item[0][3], item[0][4],
+    ))
+    table = EndpointUsage._meta.db_table
+    values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))
+    params = [value for key, count in rows for value in (*key, count)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} "
+            f"(hour, group_id, api_key_id, endpoint, status_class, count) "
+            f"VALUES {values} "
+            f"ON CONFLICT (hour, COALESCE(group_id, 0), COALESCE(api_key_id, 0), "
+            f"endpoint, status_class) "
+            f"DO UPDATE SET count = {table}.count + EXCLUDED.count",
+            params,
+        )
+
+
+def rebuild_usage(since=None) -> int:
+    """
+    Recompute the rollups from ``EndpointLog``, for all hours or those from
+    ``since`` on.  Returns the number of rollup rows written.
+    """
+    usage = EndpointUsage.objects.all()
+    if since is not None:
+        since = truncate_hour(since)
+        usage = usage.filter(hour__gte=since)
+    table = EndpointUsage._meta.db_table
+    log_table = EndpointLog._meta.db_table
+    endpoint_table = Endpoint._meta.db_table
+    where, params = ("WHERE log.created_at >= %s", [since]) if since is not None else ("", [])
+    with transaction.atomic():
+        usage.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} "
+                f"(hour, group_id, api_key_id, endpoint, status_class, count) "
+                f"SELECT date_trunc('hour', log.created_at), log.group_id, log.api_key_id, "
+                f"endpoint.name, log.status_code / 100, COUNT(*) "
+                f"FROM {log_table} AS log "
+                f"JOIN {endpoint_table} AS endpoint ON endpoint.id = log.endpoint_id "
+                f"{where} "
+                f"GROUP BY 1, 2, 3, 4, 5",
+                params,
+            )
+            return cursor.rowcount
+
+
+def parse_period(since: str | None, until: str | None) -> tuple:
+    """Parse the ``since`` / ``until`` query parameters; default: last 24h."""
+    def parse(value, name):
+        when = parse_datetime(value)
+        if when is None:
+            raise ParseError(f"'{name}' must be an ISO 8601 timestamp.")
+        return timezone.make_aware(when) if timezone.is_naive(when) else when
+
+    end = parse(until, "until") if until else timezone.now()
+    start = parse(since, "since") if since else end - timedelta(days=1)
+    if start >= end:
+        raise ParseError("'since' must be before 'until'.")
+    return start, end
+
+
+def usage_report(principal, since, until, bucket: str = "hour", scope: str = "key") -> dict:
+    """Request counts of the caller's key (or group) between two times."""
+    if bucket not in BUCKETS:
+        raise ParseError(f"'bucket' must be one of: {', '.join(BUCKETS)}.")
+    if scope == "key":
+        rows = EndpointUsage.objects.filter(api_key_id=principal.api_key_id)
+    elif scope == "group" and principal.group_id is not None:
+        rows = EndpointUsage.objects.filter(group_id=principal.group_id)
+    elif scope == "group":
+        rows = EndpointUsage.objects.none()
+    else:
+        raise ParseError("'scope' must be 'key' or 'group'.")
+
+    rows = (
+        rows.filter(hour__gte=truncate_hour(since), hour__lt=until)
+        .annotate(period=BUCKETS[bucket]("hour"))
+        .values("period", "endpoint", "status_class")
+        .annotate(requests=Sum("count"))
+        .order_by("period", "endpoint", "status_class")
+    )
+    usage = [
+        {
+            "Period": row["period"].isoformat(),
+            "Endpoint": row["endpoint"],
+            "Status": f"{row['status_class']}xx",
+            "Count": row["requests"],
+        }
+        for row in rows
+    ]
+    return {
+        "Scope": scope,
+        "Since": since.isoformat(),
+        "Until": until.isoformat(),
+        "Bucket": bucket,
+        "Total": sum(row["Count"] for row in usage),
+        "Usage": usage,
+    }
+
+
+def latency_report(since, until, by: str = "endpoint") -> list[dict]:
+    """
+    Requests, cache hits and p50/p95/p99 of the total and upstream time (ms)
+    per endpoint or group, for requests logged between ``since`` and
+    ``until``.  Rows without timings are left out.
+    """
+    if by not in LATENCY_GROUPINGS:
+        raise ParseError(f"'by' must be one of: {', '.join(LATENCY_GROUPINGS)}.")
+    aggregates = {
+        "requests": Count("id"),
+        "cache_hits": Count("id", filter=Q(cache_status="HIT")),
+        "upstream_calls": Count("upstream_ms"),
+    }
+    for percent in PERCENTILES:
+        aggregates[f"p{percent}"] = Percentile("duration_ms", percent)
+        aggregates[f"upstream_p{percent}"] = Percentile("upstream_ms", percent)
+    column = LATENCY_GROUPINGS[by]
+    rows = (
+        EndpointLog.objects.filter(
+            created_at__gte=since, created_at__lt=until, duration_ms__isnull=False
+        )
+        .values(column)
+        .annotate(**aggregates)
+        .order_by(column)
+    )
+    return [{by: row.pop(column), **row} for row in rows]
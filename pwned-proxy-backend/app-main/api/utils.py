@@ -1,24 +1,34 @@
 # api/utils.py
-from django.core.cache import cache
 from .models import HIBPKey
+from .tiered_cache import namespace
 
 
-def get_hibp_key() -> str:
+def get_hibp_keys() -> list[tuple[int, str, int | None]]:
     """
-    Return the single HIBP API key stored in the DB.
+    Return the ``(pk, api_key, rpm)`` of every active HIBP key, oldest first.
 
-    * The result is cached for one hour to avoid a query on every request.
+    * The result is cached for one hour in the ``hibp_keys`` namespace of
+      the two-level cache to avoid a query on every request; saving or
+      deleting a key invalidates it on all workers.
     * Raises RuntimeError if no key has been configured yet.
     """
-    cache_key = "hibp_api_key"
-    key = cache.get(cache_key)
-    if key:
-        return key
+    tier = namespace("hibp_keys")
+    keys = tier.get("active")
+    if keys:
+        return keys
 
-    try:
-        key = HIBPKey.objects.only("api_key").get().api_key
-    except HIBPKey.DoesNotExist:  # pragma: no cover
+    keys = list(
+        HIBPKey.objects.filter(is_active=True)
+        .order_by("created_at")
+        .values_list("pk", "api_key", "rpm")
+    )
+    if not keys:  # pragma: no cover
         raise RuntimeError("HIBP API key is missing – add it via the admin first.")
 
-    cache.set(cache_key, key, 60 * 60)  # 1 hour
-    return key
+    tier.set("active", keys, 60 * 60)  # 1 hour
+    return keys
+
+
+def get_hibp_key() -> str:
+    """Return the oldest active HIBP API key."""
+    return get_hibp_keys()[0][1]
@@ -1,71 +1,234 @@
 # api/views.py
+import ipaddress
+from contextlib import ExitStack
+
 import requests
+from django.conf import settings
 from django.contrib.auth.models import Group
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status
+from rest_framework.authentication import SessionAuthentication
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from urllib.parse import urlencode
 
-from .models import APIKey, Domain, EndpointLog
-from .utils import get_hibp_key
+from .bulk import NDJSON_CONTENT_TYPE, parse_batch, partition, stream_batch
+from .caching import account_cache_key, cached_account_get, cached_catalog_get
+from .catalog import get_catalog, parse_bool
+from .circuit import circuit_get, circuit_stats
+from .coalesce import coalesced_get
+from .keypool import pooled_get
+from . import log_writer
+from .log_writer import make_log
+from .models import Domain
+from . import quotas
+from .principal import AuthPrincipal
+from .quotas import upstream_slot
+from . import request_stats
+from .request_stats import timed_upstream
+from .snapshots import domain_changes, indexed_account_get, latest_snapshot
+from .upstream import pool_stats, upstream_get
+from .usage import BUCKETS, parse_period, usage_report
 
 
 # ---------------------------------------------------------------------
 # Helper
 # ---------------------------------------------------------------------
 
-USER_AGENT = "pwned_proxy_app/1.0"
-
 
-def hibp_get(path: str):
+def hibp_get(path: str, stream: bool = False):
     """
-    Convenience wrapper around requests.get with the correct headers.
+    GET ``path`` from HIBP through the pooled upstream session, with the
+    API key header and a per-endpoint timeout.  Concurrent calls for the
+    same path share one upstream request, and every upstream request goes
+    to the HIBP key with the most budget left and waits for a slot from
+    that key's cluster-wide rate governor.  A per-endpoint circuit
+    breaker fails fast, or serves the last good response, while HIBP is
+    failing.
+
+    With ``stream=True`` the body is left unread so ``make_response`` can
+    stream it to the client; such calls are not coalesced because a stream
+    cannot be shared, and the key's upstream slot is held (and the call
+    timed) until the body has been sent.
 
     Example:
         resp = hibp_get(f"breacheddomain/{domain}")
     """
-    url = f"https://haveibeenpwned.com/api/v3/{path.lstrip('/')}"
-    headers = {
-        "hibp-api-key": get_hibp_key(),
-        "User-Agent": USER_AGENT,
-    }
-    return requests.get(url, headers=headers)
+    def fetch(p, api_key):
+        return upstream_get(p, api_key, stream=stream)
 
+    def governed(p):
+        return pooled_get(
+            p, fetch, lambda api_key: upstream_get("subscription/status", api_key)
+        )
 
-def make_response(resp: requests.Response) -> Response:
-    """Create a DRF Response from a requests.Response, forwarding JSON/text and
-    select headers."""
-    try:
-        data = resp.json()
-    except ValueError:
-        data = resp.text
-    headers = {}
+    def guarded(p):
+        return circuit_get(p, governed, remember=not stream)
+
+    with ExitStack() as held:
+        held.enter_context(upstream_slot())
+        stats = held.enter_context(timed_upstream())
+        if stream:
+            resp = guarded(path)
+        else:
+            resp = coalesced_get(path, guarded)
+        stats.upstream_status = resp.status_code
+        if stream:
+            # Released by ``UpstreamBody.close`` once the body is sent.
+            resp.release = held.pop_all().close
+        return resp
+
+
+def breached_account_path(account: str, query: dict) -> str:
+    path = f"breachedaccount/{requests.utils.requote_uri(account)}"
+    if query:
+        path += f"?{urlencode(query)}"
+    return path
+
+
+def breached_account_get(account: str, query: dict):
+    """
+    Look up ``account`` in the local reverse index of snapshotted domains,
+    or else through the account cache.  With
+    ``truncateResponse=false`` the truncated list is fetched instead and
+    expanded from the local breach catalog when one is available.
+    """
+    catalog = get_catalog()
+    indexed = indexed_account_get(account, query, catalog)
+    if indexed is not None:
+        return indexed
+
+    if catalog is not None and parse_bool(query.get("truncateResponse")) is False:
+        # Fetch the smaller truncated form (cached together with the
+        # truncated requests) and expand it from the local catalog.
+        truncated = {k: v for k, v in query.items() if k != "truncateResponse"}
+        resp = cached_account_get(
+            breached_account_path(account, truncated),
+            account_cache_key("breachedaccount", account, truncated),
+            hibp_get,
+        )
+        if resp.status_code != 200:
+            return resp
+        expanded = catalog.expand(resp)
+        if expanded is not None:
+            return expanded
+
+    return cached_account_get(
+        breached_account_path(account, query),
+        account_cache_key("breachedaccount", account, query),
+        hibp_get,
+    )
+
+
+def should_stream(endpoint: str) -> bool:
+    """Whether upstream bodies for ``endpoint`` are streamed to the client."""
+    return endpoint in settings.HIBP_STREAM_ENDPOINTS
+
+
+def make_response(resp, stream: bool = False) -> HttpResponse:
+    """
+    Pass an upstream response through to the client without parsing it.
+
+    The body is forwarded byte for byte with the upstream content type and
+    select headers.  With ``stream=True`` the body of an unread
+    ``requests.Response`` is streamed in chunks instead of buffered.
+    """
+    content_type = resp.headers.get("Content-Type", "application/json")
+    if stream:
+        body = UpstreamBody(resp)
+        response = StreamingHttpResponse(
+            body, status=resp.status_code, content_type=content_type
+        )
+        response.upstream_body = body
+    else:
+        response = HttpResponse(
+            resp.content, status=resp.status_code, content_type=content_type
+        )
     if "Retry-After" in resp.headers:
-        headers["Retry-After"] = resp.headers["Retry-After"]
-    return Response(data, status=resp.status_code, headers=headers)
+        response["Retry-After"] = resp.headers["Retry-After"]
+    cache_status = getattr(resp, "cache_status", None)
+    if cache_status:
+        response["X-Cache"] = cache_status
+        response["Age"] = str(getattr(resp, "age", 0))
+    return response
+
+
+class UpstreamBody:
+    """
+    The unread body of an upstream response, in chunks.  Django closes it
+    when the response is done, even if it was never iterated, which returns
+    the upstream connection to the pool, releases what ``hibp_get`` held
+    for the call and then runs ``on_close`` (the request's log entry).
+    """
+
+    on_close = None
+
+    def __init__(self, resp):
+        self.resp = resp
+
+    def __iter__(self):
+        return self.resp.iter_content(settings.HIBP_STREAM_CHUNK_SIZE)
+
+    def close(self):
+        try:
+            self.resp.close()
+        finally:
+            try:
+                release = getattr(self.resp, "release", None)
+                if release is not None:
+                    release()
+            finally:
+                if self.on_close is not None:
+                    self.on_close()
 
 
 class LoggedAPIView(APIView):
     """API view that records basic analytics for each request."""
 
+    quota_token = None
+
+    def dispatch(self, request, *args, **kwargs):
+        token = request_stats.bind()
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            request_stats.unbind(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Upstream calls of this request count against the key's quota.
+        self.quota_token = quotas.bind(request.auth)
+
     def finalize_response(self, request, response, *args, **kwargs):
+        if self.quota_token is not None:
+            quotas.unbind(self.quota_token)
+            self.quota_token = None
         resp = super().finalize_response(request, response, *args, **kwargs)
         try:
             endpoint = request.resolver_match.view_name
         except AttributeError:  # pragma: no cover - should not happen
             endpoint = request.path
-        api_key = request.auth if isinstance(request.auth, APIKey) else None
-        group = api_key.group if api_key else None
-        EndpointLog.objects.create(
-            api_key=api_key,
-            group=group,
-            endpoint=endpoint,
-            status_code=resp.status_code,
-            success=200 <= resp.status_code < 400,
-        )
+        if not resp.streaming and not getattr(resp, "is_rendered", True):
+            resp.render()  # to log its size
+        principal = request.auth if isinstance(request.auth, AuthPrincipal) else None
+        stats = request_stats.current()
+
+        def record():
+            details = request_stats.log_details(stats, resp)
+            log_writer.record([make_log(principal, endpoint, resp.status_code, **details)])
+
+        body = getattr(resp, "upstream_body", None)
+        if body is not None:
+            # Logged once the body is sent, so the times include the transfer.
+            body.on_close = record
+        else:
+            record()
+        for header, value in getattr(request, "rate_limit_headers", {}).items():
+            resp[header] = value
         return resp
 
 
@@ -98,15 +261,61 @@ class BreachedDomainProxyView(LoggedAPIView):
         ],
     )
     def get(self, request, domain: str = None):
-        if not isinstance(request.auth, APIKey):
+        if not isinstance(request.auth, AuthPrincipal):
             return Response({"detail": "No valid API key provided."}, status=401)
 
-        api_key_obj = request.auth
-        if not api_key_obj.domains.filter(name=domain).exists():
+        if not request.auth.allows(domain):
             raise PermissionDenied(f"API key not authorized for domain '{domain}'")
 
-        resp = hibp_get(f"breacheddomain/{domain}")
-        return make_response(resp)
+        snapshot = latest_snapshot(domain)
+        if snapshot is not None:
+            return make_response(snapshot)
+
+        stream = should_stream("breacheddomain")
+        resp = hibp_get(f"breacheddomain/{domain}", stream=stream)
+        return make_response(resp, stream=stream)
+
+
+class BreachedDomainChangesView(LoggedAPIView):
+    """
+    GET /api/v3/breacheddomain/{domain}/changes?since={cursor}
+    """
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Aliases and breaches added to or removed from the domain since "
+            "a snapshot version, computed from the stored domain snapshots. "
+            "Pass the returned Version as 'since' on the next poll."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                name="domain",
+                in_=openapi.IN_PATH,
+                type=openapi.TYPE_STRING,
+                required=True,
+                description="Domain to query (e.g. dtu.dk).",
+            ),
+            openapi.Parameter(
+                name="since",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                description="Snapshot version or ISO 8601 timestamp; omit for everything.",
+            ),
+        ],
+        responses={200: "Success", 404: "No snapshot stored", 410: "Cursor too old"},
+    )
+    def get(self, request, domain: str = None):
+        if not isinstance(request.auth, AuthPrincipal):
+            return Response({"detail": "No valid API key provided."}, status=401)
+
+        domain_obj = None
+        if request.auth.allows(domain):
+            domain_obj = Domain.objects.filter(name__iexact=domain).first()
+        if domain_obj is None:
+            raise PermissionDenied(f"API key not authorized for domain '{domain}'")
+
+        return Response(domain_changes(domain_obj, request.query_params.get("since")))
 
 
 class BreachedAccountProxyView(LoggedAPIView):
@@ -162,16 +371,51 @@ class BreachedAccountProxyView(LoggedAPIView):
             if param in request.query_params:
                 query[param] = request.query_params[param]
 
-        path = f"breachedaccount/{requests.utils.requote_uri(account)}"
-        if query:
-            path += f"?{urlencode(query)}"
+        return make_response(breached_account_get(account, query))
 
-        print("DEBUG final path to HIBP:", path)  # Optional: Debug log
-        resp = hibp_get(path)
-        return make_response(resp)
-    
-        # resp = hibp_get(f"breachedaccount/{requests.utils.requote_uri(account)}")
-        # return make_response(resp)
+
+class BulkBreachedAccountProxyView(LoggedAPIView):
+    """
+    POST /api/v3/breachedaccounts
+    """
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Look up many accounts at once. Each email domain must be "
+            "authorised. Results are streamed as NDJSON, one line per "
+            "account, in the order the lookups complete."
+        ),
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=["accounts"],
+            properties={
+                "accounts": openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Schema(type=openapi.TYPE_STRING),
+                    description="Email addresses, e.g. [\"user@dtu.dk\"]",
+                ),
+                "truncateResponse": openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                "includeUnverified": openapi.Schema(type=openapi.TYPE_BOOLEAN),
+            },
+        ),
+        responses={200: "NDJSON stream"},
+    )
+    def post(self, request):
+        api_key_obj = request.auth
+        if not isinstance(api_key_obj, AuthPrincipal):
+            return Response({"detail": "No valid API key provided."}, status=401)
+
+        accounts, query = parse_batch(request.data)
+        authorized, rejected = partition(accounts, api_key_obj.domains)
+        return StreamingHttpResponse(
+            stream_batch(
+                authorized,
+                rejected,
+                lambda account: breached_account_get(account, query),
+                api_key_obj,
+            ),
+            content_type=NDJSON_CONTENT_TYPE,
+        )
 
 
 # ---------------------------------------------------------------------
@@ -216,10 +460,14 @@ class PasteAccountProxyView(LoggedAPIView):
         except ValueError:
             return Response({"detail": "Invalid email format."}, status=400)
 
-        if not api_key_obj.domains.filter(name=email_domain).exists():
+        if not api_key_obj.allows(email_domain):
             raise PermissionDenied(f"API key not authorised for '{email_domain}'")
 
-        resp = hibp_get(f"pasteaccount/{requests.utils.requote_uri(account)}")
+        resp = cached_account_get(
+            f"pasteaccount/{requests.utils.requote_uri(account)}",
+            account_cache_key("pasteaccount", account),
+            hibp_get,
+        )
         return make_response(resp)
 
 
@@ -253,9 +501,7 @@ class SubscribedDomainsProxyView(LoggedAPIView):
         if not api_key_obj:
             return Response({"detail": "No valid API key."}, status=401)
 
-        allowed = set(
-            api_key_obj.domains.values_list("name", flat=True)
-        )  # e.g. {"dtu.dk", ...}
+        allowed = api_key_obj.domains  # domains and domain rules of the key
 
         resp = hibp_get("subscribeddomains")
         if resp.status_code != 200:
@@ -303,10 +549,14 @@ class StealerLogsByEmailProxyView(LoggedAPIView):
         except ValueError:
             return Response({"detail": "Invalid email format."}, status=400)
 
-        if not api_key_obj.domains.filter(name=email_domain).exists():
+        if not api_key_obj.allows(email_domain):
             raise PermissionDenied(f"API key not authorised for '{email_domain}'")
 
-        resp = hibp_get(f"stealerlogsbyemail/{requests.utils.requote_uri(email)}")
+        resp = cached_account_get(
+            f"stealerlogsbyemail/{requests.utils.requote_uri(email)}",
+            account_cache_key("stealerlogsbyemail", email),
+            hibp_get,
+        )
         return make_response(resp)
 
 
@@ -340,13 +590,15 @@ class StealerLogsByWebsiteDomainProxyView(LoggedAPIView):
         if not domain:
             return Response({"detail": "Missing 'domain' parameter."}, status=400)
 
-        if not api_key_obj.domains.filter(name=domain).exists():
+        if not api_key_obj.allows(domain):
             raise PermissionDenied(f"API key not authorised for '{domain}'")
 
+        stream = should_stream("stealerlogsbywebsitedomain")
         resp = hibp_get(
-            f"stealerlogsbywebsitedomain/{requests.utils.requote_uri(domain)}"
+            f"stealerlogsbywebsitedomain/{requests.utils.requote_uri(domain)}",
+            stream=stream,
         )
-        return make_response(resp)
+        return make_response(resp, stream=stream)
 
 
 class StealerLogsByEmailDomainProxyView(LoggedAPIView):
@@ -379,11 +631,12 @@ class StealerLogsByEmailDomainProxyView(LoggedAPIView):
         if not domain:
             return Response({"detail": "Missing 'domain' parameter."}, status=400)
 
-        if not api_key_obj.domains.filter(name=domain).exists():
+        if not api_key_obj.allows(domain):
             raise PermissionDenied(f"API key not authorised for '{domain}'")
 
-        resp = hibp_get(f"stealerlogsbyemaildomain/{domain}")
-        return make_response(resp)
+        stream = should_stream("stealerlogsbyemaildomain")
+        resp = hibp_get(f"stealerlogsbyemaildomain/{domain}", stream=stream)
+        return make_response(resp, stream=stream)
 
 
 class AllBreachesProxyView(LoggedAPIView):
@@ -415,10 +668,17 @@ class AllBreachesProxyView(LoggedAPIView):
             query["Domain"] = request.query_params["Domain"]
         if "IsSpamList" in request.query_params:
             query["IsSpamList"] = request.query_params["IsSpamList"]
+        catalog = get_catalog()
+        if catalog is not None:
+            return make_response(catalog.response(catalog.breaches(
+                domain=query.get("Domain"),
+                is_spam_list=parse_bool(query.get("IsSpamList")),
+            )))
+
         path = "breaches"
         if query:
             path += f"?{urlencode(query)}"
-        resp = hibp_get(path)
+        resp = cached_catalog_get(path, hibp_get)
         return make_response(resp)
 
 
@@ -438,7 +698,15 @@ class SingleBreachProxyView(LoggedAPIView):
         ],
     )
     def get(self, request, name: str = None):
-        resp = hibp_get(f"breach/{requests.utils.requote_uri(name)}")
+        catalog = get_catalog()
+        # Unknown names fall through to HIBP in case the breach was added
+        # since the last sync.
+        if catalog is not None and catalog.get(name):
+            return make_response(catalog.response(catalog.get(name)))
+
+        resp = cached_catalog_get(
+            f"breach/{requests.utils.requote_uri(name)}", hibp_get
+        )
         return make_response(resp)
 
 
@@ -447,7 +715,11 @@ class LatestBreachProxyView(LoggedAPIView):
 
     @swagger_auto_schema(operation_description="Proxy to /latestbreach on HIBP.")
     def get(self, request):
-        resp = hibp_get("latestbreach")
+        catalog = get_catalog()
+        if catalog is not None and catalog.latest():
+            return make_response(catalog.response(catalog.latest()))
+
+        resp = cached_catalog_get("latestbreach", hibp_get)
         return make_response(resp)
 
 
@@ -456,7 +728,11 @@ class DataClassesProxyView(LoggedAPIView):
 
     @swagger_auto_schema(operation_description="Proxy to /dataclasses on HIBP.")
     def get(self, request):
-        resp = hibp_get("dataclasses")
+        catalog = get_catalog()
+        if catalog is not None and catalog.dataclasses():
+            return make_response(catalog.response(catalog.dataclasses()))
+
+        resp = cached_catalog_get("dataclasses", hibp_get)
         return make_response(resp)
 
 
@@ -481,6 +757,95 @@ class SubscriptionStatusProxyView(LoggedAPIView):
         return make_response(resp)
 
 
+def health_report() -> dict:
+    """Upstream pool, circuit breaker and log writer state of this worker."""
+    return {**pool_stats(), "circuits": circuit_stats(), "log_writer": log_writer.writer_stats()}
+
+
+def from_allowed_network(request) -> bool:
+    """Whether the client address is in ``HIBP_HEALTH_ALLOWED_NETWORKS``."""
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.HIBP_HEALTH_ALLOWED_NETWORKS
+    )
+
+
+HEALTH_FORBIDDEN = "Upstream health is only available to staff and internal networks."
+
+
+class UpstreamHealthView(LoggedAPIView):
+    """GET /api/v3/upstream/health (staff or internal networks only)"""
+
+    # Staff are recognised by their admin session.
+    authentication_classes = [*api_settings.DEFAULT_AUTHENTICATION_CLASSES, SessionAuthentication]
+
+    @swagger_auto_schema(auto_schema=None)
+    def get(self, request):
+        # API keys are not enough: the report shows the state of all keys.
+        if not (from_allowed_network(request) or request.user.is_staff):
+            return Response({"detail": HEALTH_FORBIDDEN}, status=403)
+        return Response(health_report(), status=200)
+
+
+class UsageView(LoggedAPIView):
+    """GET /api/v3/usage"""
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Requests made with this API key (or its group), counted per "
+            "hour or day, endpoint and status class."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                name="since",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                description="ISO 8601 start time (default: 24 hours before 'until').",
+            ),
+            openapi.Parameter(
+                name="until",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                description="ISO 8601 end time (default: now).",
+            ),
+            openapi.Parameter(
+                name="bucket",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                enum=list(BUCKETS),
+                description="Period to count per (default: hour).",
+            ),
+            openapi.Parameter(
+                name="scope",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                enum=["key", "group"],
+                description="Count this key's requests or its whole group's (default: key).",
+            ),
+        ],
+    )
+    def get(self, request):
+        if not isinstance(request.auth, AuthPrincipal):
+            return Response({"detail": "No valid API key."}, status=401)
+        since, until = parse_period(request.GET.get("since"), request.GET.get("until"))
+        report = usage_report(
+            request.auth,
+            since,
+            until,
+            bucket=request.GET.get("bucket", "hour"),
+            scope=request.GET.get("scope", "key"),
+        )
+        return Response(report, status=200)
+
+
 class GroupNamesView(LoggedAPIView):
     """GET /api/v3/group-names"""
 
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pwned_proxy.settings')
+# Under ASGI, serve the native async proxy views (api/async_views.py).
+os.environ.setdefault('PWNED_PROXY_ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from envutils import ensure_env
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -70,6 +71,13 @@ if service_fqdn:
     ALLOWED_HOSTS.append(service_fqdn)
 
 
+# Serve the native async views from api/async_views.py instead of the DRF
+# views. pwned_proxy/asgi.py enables this by default.
+PWNED_PROXY_ASYNC_VIEWS = os.environ.get(
+    "PWNED_PROXY_ASYNC_VIEWS", "false"
+).lower() in {"1", "true", "yes"}
+
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -99,6 +107,187 @@ REST_FRAMEWORK = {
     }
 }
 
+# Upstream HIBP client (see api/upstream.py). Each worker keeps one pooled
+# keep-alive session; timeouts are (connect, read) seconds per endpoint.
+HIBP_API_BASE_URL = os.environ.get(
+    "HIBP_API_BASE_URL", "https://haveibeenpwned.com/api/v3"
+)
+HIBP_POOL_CONNECTIONS = int(os.environ.get("HIBP_POOL_CONNECTIONS", "2"))
+HIBP_POOL_MAXSIZE = int(os.environ.get("HIBP_POOL_MAXSIZE", "10"))
+HIBP_POOL_BLOCK = os.environ.get("HIBP_POOL_BLOCK", "false").lower() in {"1", "true", "yes"}
+# Connection limit of the httpx client used by the async (ASGI) views.
+HIBP_ASYNC_POOL_MAXSIZE = int(os.environ.get("HIBP_ASYNC_POOL_MAXSIZE", "100"))
+_hibp_connect_timeout = float(os.environ.get("HIBP_CONNECT_TIMEOUT", "3.05"))
+_hibp_read_timeout = float(os.environ.get("HIBP_READ_TIMEOUT", "10"))
+HIBP_TIMEOUTS = {
+    "default": (_hibp_connect_timeout, _hibp_read_timeout),
+    # Domain-wide searches can return very large payloads.
+    "breacheddomain": (_hibp_connect_timeout, 60),
+    "stealerlogsbyemaildomain": (_hibp_connect_timeout, 60),
+    "subscribeddomains": (_hibp_connect_timeout, 30),
+}
+
+# Endpoints whose upstream bodies are streamed to the client in chunks
+# instead of buffered. Streamed calls are not coalesced (see
+# api/coalesce.py), so large endpoints that are often requested concurrently,
+# like breacheddomain, are better left buffered.
+HIBP_STREAM_ENDPOINTS = {
+    e.strip()
+    for e in os.environ.get("HIBP_STREAM_ENDPOINTS", "stealerlogsbyemaildomain").split(",")
+    if e.strip()
+}
+HIBP_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Response cache for the breach catalog endpoints (see api/caching.py).
+# TTLs are seconds per HIBP endpoint; stale entries are served for up to
+# HIBP_CATALOG_STALE_TTL more seconds while being revalidated.
+HIBP_CATALOG_CACHE_TTLS = {
+    "breaches": int(os.environ.get("HIBP_CACHE_TTL_BREACHES", "3600")),
+    "breach": int(os.environ.get("HIBP_CACHE_TTL_BREACH", "3600")),
+    "latestbreach": int(os.environ.get("HIBP_CACHE_TTL_LATESTBREACH", "600")),
+    "dataclasses": int(os.environ.get("HIBP_CACHE_TTL_DATACLASSES", "86400")),
+}
+HIBP_CATALOG_STALE_TTL = int(os.environ.get("HIBP_CACHE_STALE_TTL", "86400"))
+# Once `manage.py sync_breach_catalog` has run, catalog reads are answered
+# from an in-memory index (api/catalog.py); workers look for a newer sync
+# this often (seconds).
+HIBP_CATALOG_CHECK_INTERVAL = int(os.environ.get("HIBP_CATALOG_CHECK_INTERVAL", "30"))
+
+# breacheddomain snapshots stored by `manage.py sync_domain_snapshots` (see
+# api/snapshots.py). Snapshots not verified by a sync for
+# HIBP_DOMAIN_SNAPSHOT_MAX_AGE seconds are no longer served (0 = no limit);
+# decompressed bodies are kept per worker up to
+# HIBP_DOMAIN_SNAPSHOT_CACHE_MAX_BYTES.
+HIBP_DOMAIN_SNAPSHOT_KEEP = int(os.environ.get("HIBP_DOMAIN_SNAPSHOT_KEEP", "5"))
+HIBP_DOMAIN_SNAPSHOT_MAX_AGE = int(
+    os.environ.get("HIBP_DOMAIN_SNAPSHOT_MAX_AGE", str(7 * 24 * 60 * 60))
+)
+HIBP_DOMAIN_SNAPSHOT_CACHE_MAX_BYTES = int(
+    os.environ.get("HIBP_DOMAIN_SNAPSHOT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+
+# Short-lived per-worker cache for breachedaccount, pasteaccount and
+# stealerlogsbyemail lookups, bounded by the total size of cached bodies.
+HIBP_ACCOUNT_CACHE_TTL = int(os.environ.get("HIBP_ACCOUNT_CACHE_TTL", "300"))
+HIBP_ACCOUNT_NOT_FOUND_TTL = int(os.environ.get("HIBP_ACCOUNT_NOT_FOUND_TTL", "120"))
+HIBP_ACCOUNT_CACHE_MAX_BYTES = int(
+    os.environ.get("HIBP_ACCOUNT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))
+)
+
+# Single-flight coalescing of identical in-flight upstream requests (see
+# api/coalesce.py). Cross-worker coalescing needs a cache shared by workers.
+HIBP_COALESCE_ACROSS_WORKERS = os.environ.get(
+    "HIBP_COALESCE_ACROSS_WORKERS", "true"
+).lower() in {"1", "true", "yes"}
+HIBP_COALESCE_WAIT = int(os.environ.get("HIBP_COALESCE_WAIT", "15"))
+HIBP_COALESCE_POLL_INTERVAL = 0.05
+HIBP_COALESCE_RESULT_TTL = 5
+
+# Cluster-wide upstream rate governor (see api/governor.py). Set
+# HIBP_RATE_LIMIT_RPM to the subscription's RPM, "auto" to read it from
+# subscription/status, or 0 to disable the governor.
+HIBP_RATE_LIMIT_RPM = os.environ.get("HIBP_RATE_LIMIT_RPM", "auto")
+HIBP_RATE_LIMIT_RPM_FALLBACK = int(os.environ.get("HIBP_RATE_LIMIT_RPM_FALLBACK", "10"))
+HIBP_GOVERNOR_BURST = int(os.environ.get("HIBP_GOVERNOR_BURST", "1"))
+HIBP_GOVERNOR_MAX_WAIT = float(os.environ.get("HIBP_GOVERNOR_MAX_WAIT", "20"))
+HIBP_GOVERNOR_MAX_WAITERS = int(os.environ.get("HIBP_GOVERNOR_MAX_WAITERS", "50"))
+# With several HIBP keys (see api/keypool.py) each key has its own bucket; a
+# key answered with 401 stays out of rotation this many seconds.
+HIBP_KEY_UNAUTHORIZED_COOLDOWN = int(os.environ.get("HIBP_KEY_UNAUTHORIZED_COOLDOWN", "3600"))
+
+# Per-endpoint circuit breaker (see api/circuit.py). The circuit opens when
+# HIBP_CIRCUIT_ERROR_RATE of the last HIBP_CIRCUIT_WINDOW calls (at least
+# HIBP_CIRCUIT_MIN_CALLS) failed; calls slower than HIBP_CIRCUIT_SLOW_CALL_RATIO
+# of their read timeout count as failures. While open, the last good response
+# is served for up to HIBP_CIRCUIT_STALE_TTL seconds.
+HIBP_CIRCUIT_WINDOW = int(os.environ.get("HIBP_CIRCUIT_WINDOW", "20"))
+HIBP_CIRCUIT_MIN_CALLS = int(os.environ.get("HIBP_CIRCUIT_MIN_CALLS", "5"))
+HIBP_CIRCUIT_ERROR_RATE = float(os.environ.get("HIBP_CIRCUIT_ERROR_RATE", "0.5"))
+HIBP_CIRCUIT_SLOW_CALL_RATIO = float(os.environ.get("HIBP_CIRCUIT_SLOW_CALL_RATIO", "0.8"))
+HIBP_CIRCUIT_OPEN_SECONDS = int(os.environ.get("HIBP_CIRCUIT_OPEN_SECONDS", "30"))
+HIBP_CIRCUIT_STALE_TTL = int(os.environ.get("HIBP_CIRCUIT_STALE_TTL", "86400"))
+HIBP_CIRCUIT_STALE_MAX_BYTES = int(
+    os.environ.get("HIBP_CIRCUIT_STALE_MAX_BYTES", str(32 * 1024 * 1024))
+)
+
+# Bulk account lookups (POST api/v3/breachedaccounts, see api/bulk.py):
+# largest accepted batch and number of lookups run at once per request.
+HIBP_BULK_MAX_ACCOUNTS = int(os.environ.get("HIBP_BULK_MAX_ACCOUNTS", "1000"))
+HIBP_BULK_CONCURRENCY = int(os.environ.get("HIBP_BULK_CONCURRENCY", "8"))
+
+# GET api/v3/upstream/health (pool, circuit breaker and log writer state) is
+# only answered for staff logged in to the admin and for clients in these
+# networks (comma-separated addresses or CIDRs), e.g. a monitoring host.
+# Empty by default: behind a reverse proxy every client has the proxy's
+# address.
+HIBP_HEALTH_ALLOWED_NETWORKS = [
+    n.strip()
+    for n in os.environ.get("HIBP_HEALTH_ALLOWED_NETWORKS", "").split(",")
+    if n.strip()
+]
+
+# Shared cache (L2) seen by all workers on all nodes: coalescing locks, HIBP
+# key health and the two-level cache of api/tiered_cache.py.
+# Set DJANGO_CACHE_URL to redis://host:6379/0 to use Redis (needs the "redis"
+# package); otherwise the cache lives in Postgres (`manage.py
+# createcachetable`). Tests use a per-process cache.
+DJANGO_CACHE_URL = os.environ.get("DJANGO_CACHE_URL", "")
+if "test" in sys.argv[1:2]:
+    _shared_cache = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+elif DJANGO_CACHE_URL.startswith(("redis://", "rediss://", "unix://")):
+    _shared_cache = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": DJANGO_CACHE_URL,
+    }
+else:
+    _shared_cache = {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "django_cache",
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("DJANGO_CACHE_MAX_ENTRIES", "100000"))},
+    }
+CACHES = {"default": {**_shared_cache, "KEY_PREFIX": "pwned_proxy"}}
+
+# Atomic counters (throttle windows, concurrent call slots and cache
+# namespace versions, see api/counters.py): "database" keeps them in the
+# SharedCounter table, "cache" in the shared cache. The database cache's
+# incr is neither atomic nor keeps the expiry, so "cache" is only the
+# default for Redis (and the per-process test cache).
+HIBP_COUNTER_BACKEND = os.environ.get("HIBP_COUNTER_BACKEND") or (
+    "database" if _shared_cache["BACKEND"].endswith(".DatabaseCache") else "cache"
+)
+
+# Per-process L1 in front of the shared cache (see api/tiered_cache.py):
+# lifetime and number of entries per namespace, and how often a worker checks
+# whether a namespace was invalidated.
+HIBP_L1_CACHE_TTL = int(os.environ.get("HIBP_L1_CACHE_TTL", "60"))
+HIBP_L1_CACHE_MAX_ENTRIES = int(os.environ.get("HIBP_L1_CACHE_MAX_ENTRIES", "10000"))
+HIBP_CACHE_VERSION_CHECK_INTERVAL = float(
+    os.environ.get("HIBP_CACHE_VERSION_CHECK_INTERVAL", "1")
+)
+# Cached API key principals (see api/principal.py) live this long in L2.
+HIBP_AUTH_CACHE_TTL = int(os.environ.get("HIBP_AUTH_CACHE_TTL", "300"))
+
+# Per key / per group quotas (APIKey and GroupQuota in the admin): a "burst"
+# limit counts requests over this many seconds, and concurrent upstream call
+# counters (see api/quotas.py) expire after HIBP_CONCURRENCY_SLOT_TTL seconds.
+HIBP_THROTTLE_BURST_WINDOW = int(os.environ.get("HIBP_THROTTLE_BURST_WINDOW", "10"))
+HIBP_CONCURRENCY_SLOT_TTL = int(os.environ.get("HIBP_CONCURRENCY_SLOT_TTL", "300"))
+
+# EndpointLog rows are queued in memory and written in batches by a
+# background thread per worker (see api/log_writer.py): after
+# HIBP_LOG_BATCH_SIZE rows or HIBP_LOG_FLUSH_INTERVAL seconds. Rows beyond
+# HIBP_LOG_QUEUE_SIZE are dropped; 0 writes every row inline instead.
+HIBP_LOG_QUEUE_SIZE = int(os.environ.get("HIBP_LOG_QUEUE_SIZE", "10000"))
+HIBP_LOG_BATCH_SIZE = int(os.environ.get("HIBP_LOG_BATCH_SIZE", "500"))
+HIBP_LOG_FLUSH_INTERVAL = float(os.environ.get("HIBP_LOG_FLUSH_INTERVAL", "1"))
+
+# Retention applied by `manage.py prune_endpoint_logs` (see api/retention.py):
+# days of EndpointLog rows and of hourly usage rollups to keep (0 = keep
+# all), deleted this many rows per transaction.
+HIBP_LOG_RETENTION_DAYS = int(os.environ.get("HIBP_LOG_RETENTION_DAYS", "90"))
+HIBP_USAGE_RETENTION_DAYS = int(os.environ.get("HIBP_USAGE_RETENTION_DAYS", "0"))
+HIBP_RETENTION_CHUNK_SIZE = int(os.environ.get("HIBP_RETENTION_CHUNK_SIZE", "5000"))
+
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
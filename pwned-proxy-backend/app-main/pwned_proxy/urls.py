@@ -13,12 +13,17 @@ schema_view = get_schema_view(
     ),
     public=True,
     permission_classes=(permissions.AllowAny,),
+    # Always document the DRF views; the async views share their contract.
+    patterns=[path('api/v3/', include('api.urls'))],
     url=f"{'https' if not settings.DEBUG else 'http'}://{settings.PWNED_PROXY_DOMAIN}",
 )
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/v3/', include('api.urls')),
+    path(
+        'api/v3/',
+        include('api.async_urls' if settings.PWNED_PROXY_ASYNC_VIEWS else 'api.urls'),
+    ),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0)),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0)),
 
@@ -21,10 +21,32 @@ sudo install -d -m 0755 "$STATIC_ROOT" && sudo chown appuser:appuser "$STATIC_RO
 /usr/src/venvs/app-main/bin/python app-main/wait_for_db.py
 
 /usr/src/venvs/app-main/bin/python manage.py migrate --noinput
+# Table of the shared Django cache (no-op when DJANGO_CACHE_URL points at Redis).
+/usr/src/venvs/app-main/bin/python manage.py createcachetable
 /usr/src/venvs/app-main/bin/python manage.py collectstatic --noinput
 /usr/src/venvs/app-main/bin/python app-main/create_admin.py
 # Run one-time setup tasks if HIBP_API_KEY is configured
 /usr/src/venvs/app-main/bin/python manage.py initial_setup || true
+# Refresh the local breach catalog; schedule this command (e.g. hourly via
+# cron) to keep catalog reads current.
+/usr/src/venvs/app-main/bin/python manage.py sync_breach_catalog || true
+# Store breacheddomain snapshots for domains whose pwn_count changed; schedule
+# this too so domain searches are served locally.
+/usr/src/venvs/app-main/bin/python manage.py sync_domain_snapshots --skip-import || true
+# Delete request logs past their retention (a bounded amount at start-up so a
+# large backlog does not delay it); schedule this daily as well.
+/usr/src/venvs/app-main/bin/python manage.py prune_endpoint_logs --max-chunks 20 || true
+
+# Set PWNED_PROXY_ASGI=true to serve the async proxy views through the ASGI
+# entry point with uvicorn workers instead of the sync WSGI workers.
+if [ "${PWNED_PROXY_ASGI:-false}" = "true" ]; then
+    exec /usr/src/venvs/app-main/bin/gunicorn \
+        pwned_proxy.asgi:application \
+        --worker-class uvicorn_worker.UvicornWorker \
+        --bind 0.0.0.0:8000 \
+        --access-logfile - \
+        --log-level info
+fi
 
 exec /usr/src/venvs/app-main/bin/gunicorn \
     pwned_proxy.wsgi:application \